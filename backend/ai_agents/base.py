@@ -1,5 +1,76 @@
+from typing import Callable, TypeVar
 from langchain_core.messages import HumanMessage
 from gemini_config import get_runnable_llm, prebuilt_runnables
+from ai_agents.json_stream import JSONStream
+from ai_agents.schemas import StageOutput
+
+TokenCallback = Callable[[str], None]
+S = TypeVar("S", bound=StageOutput)
+
+
+def _text(chunk) -> str:
+    content = chunk.content if hasattr(chunk, "content") else chunk
+    if isinstance(content, list):  # multi-part message content
+        return "".join(p if isinstance(p, str) else p.get("text", "") for p in content)
+    return content or ""
+
+
+async def complete(runnable, inputs, on_token: TokenCallback | None = None,
+                   config: dict | None = None) -> str:
+    """Run `runnable` to completion, forwarding each streamed chunk to `on_token`.
+
+    Without a callback this is a plain `ainvoke`. With one, output is
+    accumulated while it streams, so the full text is ready the moment the
+    last chunk arrives.
+    """
+    if on_token is None:
+        return _text(await runnable.ainvoke(inputs, config=config))
+    parts = []
+    async for chunk in runnable.astream(inputs, config=config):
+        text = _text(chunk)
+        if text:
+            parts.append(text)
+            on_token(text)
+    return "".join(parts)
+
+
+def _closes(schema: type[StageOutput]) -> Callable[[str], bool]:
+    def check(text: str) -> bool:
+        stream = JSONStream(schema.accepts)
+        stream.feed(text)
+        return stream.done
+    return check
+
+
+async def complete_structured(runnable, inputs, schema: type[S],
+                              on_token: TokenCallback | None = None, *,
+                              whole: bool = False, fresh: bool = False) -> S:
+    """Like `complete`, but parse the reply into `schema`.
+
+    When streaming, the JSON is parsed incrementally as chunks arrive, so
+    no second pass over the full reply is needed at the end. With `whole`,
+    a reply whose JSON never closes (cut off mid-value) raises ValueError
+    instead of being repaired. `fresh` skips the LLM cache, for retries.
+    Replies that don't close are never cached either way.
+    """
+    configurable = {"llm_cache_accept": _closes(schema)}
+    if fresh:
+        configurable["llm_cache_bypass"] = True
+    config = {"configurable": configurable}
+    stream = JSONStream(schema.accepts)
+
+    if on_token is None:
+        text = await complete(runnable, inputs, config=config)
+        stream.feed(text)
+    else:
+        def tap(text: str) -> None:
+            stream.feed(text)
+            on_token(text)
+
+        text = await complete(runnable, inputs, tap, config)
+    if whole and not stream.done:
+        raise ValueError("reply was cut off before its JSON closed")
+    return schema.from_parsed(stream.value(), text)
 
 
 class BaseAgent:
@@ -7,16 +78,19 @@ class BaseAgent:
         self.role = role
         self.llm = prebuilt_runnables.get(role) or get_runnable_llm(role, temperature=temperature)
 
-    async def run(self, prompt: str, context: dict | None = None) -> str:
+    async def run(self, prompt: str, context: dict | None = None, on_token: TokenCallback | None = None) -> str:
         formatted = self.format_prompt(prompt, context)
         try:
-            response = await self.llm.ainvoke([HumanMessage(content=formatted)])
-            return response.content
+            return await complete(self.llm, [HumanMessage(content=formatted)], on_token)
         except Exception as e:
             return f"Error: {e}"
 
     def format_prompt(self, prompt: str, context: dict | None = None) -> str:
         if context:
-            ctx = "\n".join(f"{k}: {v}" for k, v in context.items())
+            from ai_agents.context import budget_for, fit
+
+            # Items share the role's budget; each is shortened only as far as needed
+            share = max(64, budget_for("run", self.role) // len(context))
+            ctx = "\n".join(f"{k}: {fit(v, share)}" for k, v in context.items())
             return f"{prompt}\n\nContext:\n{ctx}"
         return prompt
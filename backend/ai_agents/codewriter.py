@@ -1,4 +1,6 @@
-from ai_agents.base import BaseAgent
+from ai_agents.base import BaseAgent, TokenCallback, complete_structured
+from ai_agents.context import ContextBudget
+from ai_agents.schemas import FileSet, GeneratedFile, UXPlan
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from langchain_core.output_parsers import StrOutputParser
@@ -7,7 +9,7 @@ class CodewriterAgent(BaseAgent):
     def __init__(self):
         super().__init__("codewriter", temperature=0.5)
 
-    async def generate_code(self, ux_plan: str):
+    async def generate_code(self, ux: UXPlan, on_token: TokenCallback | None = None) -> FileSet:
         prompt = ChatPromptTemplate.from_template("""
         You are a Flutter developer.
         Based on the UX plan, generate boilerplate Dart files for each screen.
@@ -15,7 +17,31 @@ class CodewriterAgent(BaseAgent):
         UX plan:
         {ux_plan}
 
-        Return JSON list: [{{"file": "screen.dart", "content": "<dart code>"}}]
+        Return only a JSON list (no markdown fences): [{{"file": "screen.dart", "content": "<dart code>"}}]
         """)
         chain = RunnableSequence(prompt | self.llm | StrOutputParser())
-        return await chain.ainvoke({"ux_plan": ux_plan})
+        return await complete_structured(chain, {"ux_plan": ux.compact()}, FileSet, on_token)
+
+    async def generate_file(self, ux: UXPlan, screen: str, file: str,
+                            on_token: TokenCallback | None = None,
+                            ctx: ContextBudget | None = None, fresh: bool = False) -> GeneratedFile:
+        """Generate a single screen's file; raises ValueError on an unusable or cut-off reply.
+
+        `fresh` skips the LLM cache (for a retry after a bad reply).
+        """
+        prompt = ChatPromptTemplate.from_template("""
+        You are a Flutter developer.
+        Based on this screen spec from the UX plan, generate the boilerplate Dart file for the "{screen}" screen only.
+
+        Screen spec:
+        {ux_plan}
+
+        Return only a JSON object (no markdown fences): {{"file": "{file}", "content": "<dart code>"}}
+        """)
+        chain = RunnableSequence(prompt | self.llm | StrOutputParser())
+        spec = (ctx or ContextBudget()).render("code", self.role, ux, screen)
+        out = await complete_structured(chain, {"ux_plan": spec, "screen": screen, "file": file},
+                                        FileSet, on_token, whole=True, fresh=fresh)
+        if not out.files or not out.files[0].content.strip():
+            raise ValueError(f"no code returned for {file}")
+        return GeneratedFile(file=file, content=out.files[0].content)
@@ -0,0 +1,155 @@
+"""
+Context budgeting for agent prompts.
+------------------------------------
+Each stage gets a view of its upstream outputs holding only the fields it
+needs. The critic sees each screen's widget structure and styling, not the
+code. A per-screen codewriter sees only that screen's spec. The rendered
+view is then fitted to the stage's token budget: long strings and lists
+are shortened until it fits.
+
+    ctx = ContextBudget()
+    text = ctx.render("critique", "reviewer", ui_files)
+    ctx.report  # {"critique": {"calls": 1, "before": 5200, "after": 610, "budget": 8000}}
+
+`before` is what handing over the full output would have cost, `after`
+what was actually sent (both ~4 chars per token).
+"""
+from __future__ import annotations
+import json
+import os
+import re
+import threading
+from typing import Any, Callable
+
+from ai_agents.schemas import Critique, FileSet, StageOutput, UXPlan
+from llm_pool import estimate_tokens
+
+CONTEXT_BUDGET = int(os.getenv("CONTEXT_BUDGET_TOKENS", "8000"))
+# Per-stage overrides, e.g. CONTEXT_BUDGETS="critique=4000,code=2000"
+STAGE_BUDGETS = {
+    k.strip(): int(v)
+    for k, _, v in (item.partition("=") for item in os.getenv("CONTEXT_BUDGETS", "").split(","))
+    if k.strip() and v.strip().isdigit()
+}
+# Room left in the model's window for its reply
+OUTPUT_RESERVE = 8192
+
+
+def budget_for(stage: str, role: str) -> int:
+    from gemini_config import get_context_window, get_model_for
+
+    window = get_context_window(get_model_for(role)) - OUTPUT_RESERVE
+    return max(256, min(STAGE_BUDGETS.get(stage, CONTEXT_BUDGET), window))
+
+
+def _dumps(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False,
+                      default=lambda o: o.model_dump() if hasattr(o, "model_dump") else str(o))
+
+
+# -------------------------------------------------------------------------
+# Views: what each stage needs from its inputs
+# -------------------------------------------------------------------------
+_WIDGET = re.compile(r"\b([A-Z][A-Za-z0-9_]*)(?:\.[a-z]\w*)?\(")
+_STYLE = re.compile(
+    r"Colors\.\w+(?:\.shade\d+)?|EdgeInsets\.\w+\([^)]*\)|Theme\.of\(context\)\.\w+(?:\.\w+)?"
+    r"|fontSize:\s*[\d.]+|Semantics|semanticLabel|tooltip|MediaQuery|LayoutBuilder")
+
+
+def outline(code: str) -> dict:
+    """Widgets (first-use order) and styling/accessibility tokens of a Dart file."""
+    widgets = list(dict.fromkeys(_WIDGET.findall(code)))
+    styles = list(dict.fromkeys(m.group(0) for m in _STYLE.finditer(code)))
+    return {"widgets": widgets, "styles": styles, "lines": code.count("\n") + 1}
+
+
+def _files_outline(files: FileSet) -> Any:
+    if not files.files:
+        return files.compact()
+    return [{"file": f.file, **outline(f.content)} for f in files.files]
+
+
+def _feedback(critique: Critique) -> Any:
+    if critique.raw is not None:
+        return critique.raw
+    return {"issues": critique.issues, "suggestions": critique.suggestions}
+
+
+def _screen_spec(ux: UXPlan, screen: str) -> Any:
+    entry = next((s for s in ux.screens if isinstance(s, dict) and screen in s.values()), None)
+    components = ux.components.get(screen) if isinstance(ux.components, dict) else None
+    spec = {"screen": entry or screen, "components": components,
+            "navigation": ux.navigation, "all_screens": ux.screen_names()}
+    if components is None and entry is None:
+        spec["components"] = ux.components  # plan isn't keyed by screen; keep it whole
+    return {k: v for k, v in spec.items() if v is not None}
+
+
+def _data(value: Any) -> Any:
+    if isinstance(value, StageOutput):
+        # An upstream reply that didn't parse is passed on as text, not "{}"
+        return value.data() or value.raw or {}
+    return value.model_dump() if hasattr(value, "model_dump") else value
+
+
+VIEWS: dict[str, Callable[..., Any]] = {
+    "ux": _data,                                # vision → UX architect
+    "ui": _data,                                # UX plan → UI designer
+    "feedback": _feedback,                      # critique → UI revision
+    "critique": _files_outline,                 # UI files → critic
+    "code": _screen_spec,                       # UX plan → per-screen codewriter
+    "style": _data,                             # one file → stylist
+}
+
+
+# -------------------------------------------------------------------------
+# Fitting
+# -------------------------------------------------------------------------
+def _shrink(value: Any, max_str: int, max_items: int) -> Any:
+    if isinstance(value, str):
+        return value if len(value) <= max_str else value[:max_str] + "…"
+    if isinstance(value, list):
+        items = [_shrink(v, max_str, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"… {len(value) - max_items} more")
+        return items
+    if isinstance(value, dict):
+        return {k: _shrink(v, max_str, max_items) for k, v in value.items()}
+    return value
+
+
+def fit(value: Any, budget: int) -> str:
+    """Render `value` as compact JSON of at most ~`budget` tokens."""
+    text = _dumps(value)
+    if estimate_tokens(text) <= budget:
+        return text
+    if isinstance(value, str):
+        return text[:budget * 4] + "…"
+    max_str, max_items = 4 * budget, 256
+    while max_str > 16 or max_items > 4:
+        max_str, max_items = max(16, max_str // 2), max(4, max_items // 2)
+        text = _dumps(_shrink(value, max_str, max_items))
+        if estimate_tokens(text) <= budget:
+            return text
+    return text[:budget * 4] + "…"
+
+
+class ContextBudget:
+    """Renders stage inputs within budget and records their sizes."""
+
+    def __init__(self):
+        self.report: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def render(self, stage: str, role: str, value: Any, *args) -> str:
+        full = value.compact() if isinstance(value, StageOutput) else _dumps(_data(value))
+        budget = budget_for(stage, role)
+        text = fit(VIEWS.get(stage, _data)(value, *args), budget)
+        with self._lock:
+            r = self.report.setdefault(stage, {"calls": 0, "before": 0, "after": 0, "budget": budget})
+            r["calls"] += 1
+            r["before"] += estimate_tokens(full)
+            r["after"] += estimate_tokens(text)
+        return text
@@ -1,13 +1,83 @@
+import asyncio
 import json
+import os
+import re
 from ai_agents.creative_director import CreativeDirectorAgent
 from ai_agents.ux_architect import UXArchitectAgent
 from ai_agents.ui_designer import UIDesignerAgent
 from ai_agents.critic import CriticAgent
 from ai_agents.codewriter import CodewriterAgent
 from ai_agents.stylist import StylistAgent
+from ai_agents.context import ContextBudget
+from ai_agents.pipeline import Stage, fan_out, run_stages
+from ai_agents.schemas import FileSet, GeneratedFile, UXPlan, Vision
+import speculative
+
+AGENT_CONCURRENCY = int(os.getenv("AGENT_CONCURRENCY", "4"))
+# Per-screen code generation: files in flight at once, and extra attempts per file
+CODEGEN_CONCURRENCY = int(os.getenv("CODEGEN_CONCURRENCY", "12"))
+CODEGEN_RETRIES = int(os.getenv("CODEGEN_RETRIES", "2"))
+
+
+def _file_name(screen: str) -> str:
+    words = re.findall(r"[A-Za-z0-9]+", re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", screen))
+    stem = "_".join(w.lower() for w in words) or "screen"
+    return f"{stem}.dart" if stem.endswith("screen") else f"{stem}_screen.dart"
+
+
+_WIDGET = re.compile(r"^\s*class\s+([A-Z]\w*)\s+extends\s+(?:StatelessWidget|StatefulWidget)\b", re.M)
+
+_MAIN_DART = """import 'package:flutter/material.dart';
+
+{imports}
+
+void main() => runApp(const GeneratedApp());
+
+class GeneratedApp extends StatelessWidget {{
+  const GeneratedApp({{super.key}});
+
+  @override
+  Widget build(BuildContext context) {{
+    return MaterialApp(
+      debugShowCheckedModeBanner: false,
+      theme: ThemeData(useMaterial3: true),
+      home: {home}(),
+      routes: {{
+{routes}
+      }},
+    );
+  }}
+}}
+"""
+
+
+def _main_dart(files: list[GeneratedFile]) -> str | None:
+    """lib/main.dart importing the generated screens, with a named route to each.
+
+    The first screen is the home screen. None if there is nothing to
+    route to, or the model wrote its own main.dart.
+    """
+    screens = []
+    for f in files:
+        rel = f.file.removeprefix("lib/")
+        if rel == "main.dart":
+            return None
+        m = _WIDGET.search(f.content)
+        if m:
+            screens.append((rel, "/" + rel.removesuffix(".dart"), m.group(1)))
+    if not screens:
+        return None
+    return _MAIN_DART.format(
+        imports="\n".join(f"import '{rel}';" for rel, _, _ in screens),
+        home=screens[0][2],
+        routes="\n".join(f"        '{route}': (context) => {cls}()," for _, route, cls in screens))
+
 
 class CoordinatorAgent:
-    def __init__(self):
+    def __init__(self, max_concurrency: int = AGENT_CONCURRENCY,
+                 codegen_concurrency: int = CODEGEN_CONCURRENCY):
+        self.max_concurrency = max_concurrency
+        self.codegen_concurrency = codegen_concurrency
         self.director = CreativeDirectorAgent()
         self.architect = UXArchitectAgent()
         self.ui_designer = UIDesignerAgent()
@@ -15,23 +85,224 @@ class CoordinatorAgent:
         self.codewriter = CodewriterAgent()
         self.stylist = StylistAgent()
 
-    async def generate_design(self, user_prompt: str):
-        vision = await self.director.create_vision(user_prompt)
-        ux = await self.architect.design_structure(vision)
-        ui = await self.ui_designer.design_ui(ux)
-        critique = await self.critic.review_design(ui)
+    # ------------------------------------------------------------------
+    # Planning (vision + UX), with speculative drafts
+    # ------------------------------------------------------------------
+    async def _draft(self, user_prompt: str) -> "speculative.Draft | None":
+        if not speculative.SPECULATIVE_ENABLED:
+            return None
+        return await asyncio.to_thread(speculative.get_index().lookup, user_prompt)
+
+    async def _vision(self, user_prompt: str, on_token=None, draft=None) -> Vision:
+        if draft is not None:
+            return Vision.from_value(draft.vision)
+        return await self.director.create_vision(user_prompt, on_token)
+
+    async def _ux(self, user_prompt: str, vision: Vision, on_token=None, ctx: ContextBudget | None = None,
+                  draft=None, source: str = "generated") -> UXPlan:
+        if draft is not None and draft.exact:
+            return UXPlan.from_value(draft.ux)
+        if draft is not None:
+            # The vision came from a similar prompt; plan for what this one asks
+            return await self.architect.design_structure(vision, on_token, ctx, request=user_prompt)
+        ux = await self.architect.design_structure(vision, on_token, ctx)
+        if speculative.SPECULATIVE_ENABLED:
+            await asyncio.to_thread(speculative.get_index().remember, user_prompt, vision.data(), ux.data(), source)
+        return ux
+
+    async def plan(self, user_prompt: str, source: str = "generated") -> tuple[Vision, UXPlan]:
+        """Run just the planner stages; the result is stored as a draft for similar prompts."""
+        vision = await self._vision(user_prompt)
+        return vision, await self._ux(user_prompt, vision, source=source)
+
+    def _refine_later(self, user_prompt: str, draft) -> None:
+        """Replace a near-match draft with a plan for this exact prompt, off the request path."""
+        if draft is None or draft.exact or not speculative.SPECULATIVE_REFINE:
+            return
+        index = speculative.get_index()
 
+        async def refine():
+            index.count("refinements")
+            try:
+                await self.plan(user_prompt, "refined")
+            except Exception:
+                index.count("refine_failures")
+        speculative.spawn(refine())
+
+    async def warm_up(self, categories: list[str] | None = None, force: bool = False) -> dict:
+        """Pre-generate drafts for popular app categories (SPECULATIVE_WARMUP)."""
+        index = speculative.get_index()
+        categories = categories or speculative.SPECULATIVE_WARMUP
+        todo = [c for c in categories if force or not index.has(c)]
+        _, failures = await fan_out(todo, lambda c: self.plan(c, "warm-up"), self.max_concurrency)
+        index.count("warmed", len(todo) - len(failures))
+        return {"warmed": [c for c in todo if c not in {f[0] for f in failures}],
+                "skipped": [c for c in categories if c not in todo],
+                "failed": [{"category": c, "error": str(e)} for c, e in failures]}
+
+    async def _revise_ui(self, r: dict, on_token=None, ctx: ContextBudget | None = None):
         # if critique finds major issues, loop back once
-        if "issues" in critique.lower():
-            ui = await self.ui_designer.design_ui(f"{ux}\n\nFeedback:\n{critique}")
-
-        code = await self.codewriter.generate_code(ux)
-        styled = await self.stylist.apply_style(code)
-
-        return json.dumps({
-            "vision": vision,
-            "ux": ux,
-            "ui": ui,
-            "critique": critique,
-            "final_code": styled
-        }, indent=2)
+        if r["critique"].has_issues:
+            return await self.ui_designer.design_ui(r["ux"], on_token, feedback=r["critique"], ctx=ctx)
+        return r["ui"]
+
+    async def _write_code(self, ux, tap, emit=None, workspace_id: str | None = None,
+                          ctx: ContextBudget | None = None) -> FileSet:
+        """Generate and style one file per screen, concurrently.
+
+        Each file goes codewriter → stylist on its own, so a slow or
+        truncated reply only costs that file: generation is retried per
+        file, and a file whose styling keeps failing is kept unstyled.
+        With `workspace_id`, finished files are written to lib/ as they
+        complete, and lib/main.dart is rewritten to route to them before
+        the stage ends (the build starts right after). Plans without a
+        screen list fall back to one call each.
+        """
+        async def save(f: GeneratedFile) -> None:
+            if workspace_id:
+                import workspace
+                rel = "lib/" + f.file.removeprefix("lib/")
+                await workspace.awrite_file(workspace_id, rel, f.content, label=f"generate {f.file}")
+
+        async def save_main(files: list[GeneratedFile]) -> None:
+            main = _main_dart(files) if workspace_id else None
+            if main is not None:
+                await save(GeneratedFile(file="main.dart", content=main))
+
+        screens = ux.screen_names()
+        if not screens:
+            code = await self.codewriter.generate_code(ux, tap("final_code"))
+            styled = await self.stylist.apply_style(code, tap("final_code"))
+            for f in styled.files:
+                await save(f)
+            await save_main(styled.files)
+            return styled
+
+        # Retries skip the LLM cache, which would only hand back the same bad reply
+        tries: dict[str, int] = {}
+
+        def retrying(key: str) -> bool:
+            tries[key] = tries.get(key, 0) + 1
+            return tries[key] > 1
+
+        async def one(item: tuple[str, str]) -> GeneratedFile:
+            screen, name = item
+            f = await self.codewriter.generate_file(ux, screen, name, tap("final_code", name), ctx,
+                                                    fresh=retrying("code:" + name))
+            styled, failed = await fan_out(
+                [f], lambda f: self.stylist.style_file(f, tap("final_code", name), ctx,
+                                                       fresh=retrying("style:" + name)),
+                1, CODEGEN_RETRIES)
+            f = styled[0] or f
+            await save(f)
+            if emit:
+                emit({"event": "file_done", "stage": "final_code", "file": f.file, "styled": not failed})
+            return f
+
+        items, seen = [], set()
+        for screen in screens:
+            name = _file_name(screen)
+            if name not in seen:
+                seen.add(name)
+                items.append((screen, name))
+        files, failures = await fan_out(items, one, self.codegen_concurrency, CODEGEN_RETRIES)
+        if failures and len(failures) == len(items):
+            raise failures[0][1]
+        files = [f for f in files if f is not None]
+        await save_main(files)
+        return FileSet(files=files,
+                       failed=[{"file": name, "error": str(e)} for (_, name), e in failures])
+
+    def stages(self, user_prompt: str, emit=None, workspace_id: str | None = None,
+               ctx: ContextBudget | None = None, draft=None) -> list[Stage]:
+        """The design pipeline as a dependency graph.
+
+        Code generation only needs the UX plan, so the per-screen
+        codewriter → stylist fan-out runs alongside UI design → critique →
+        revision. With `emit`, every stage forwards its streamed tokens as
+        `token` events (code tokens also carry their `file`). Stage inputs
+        are rendered through `ctx`, which records their token counts. With
+        a speculative `draft`, the vision comes from it without a call, and
+        so does the UX plan if the draft is an exact match.
+        """
+        ctx = ctx or ContextBudget()
+
+        def tap(stage: str, file: str | None = None):
+            if emit is None:
+                return None
+            extra = {"file": file} if file else {}
+            return lambda text: emit({"event": "token", "stage": stage, **extra, "text": text})
+
+        return [
+            Stage("vision", lambda r: self._vision(user_prompt, tap("vision"), draft)),
+            Stage("ux", lambda r: self._ux(user_prompt, r["vision"], tap("ux"), ctx, draft), ("vision",)),
+            Stage("ui", lambda r: self.ui_designer.design_ui(r["ux"], tap("ui"), ctx=ctx), ("ux",)),
+            Stage("critique", lambda r: self.critic.review_design(r["ui"], tap("critique"), ctx), ("ui",)),
+            Stage("revised_ui", lambda r: self._revise_ui(r, tap("revised_ui"), ctx), ("ux", "ui", "critique")),
+            Stage("final_code", lambda r: self._write_code(r["ux"], tap, emit, workspace_id, ctx), ("ux",)),
+        ]
+
+    @staticmethod
+    def _result(results: dict, timings: dict, ctx: ContextBudget | None = None, draft=None) -> dict:
+        out = {
+            "vision": results["vision"].data(),
+            "ux": results["ux"].data(),
+            "ui": results["revised_ui"].data(),
+            "critique": results["critique"].data(),
+            "final_code": results["final_code"].data(),
+            "timings": timings,
+        }
+        if ctx is not None:
+            out["context_tokens"] = ctx.report
+        if draft is not None:
+            out["draft"] = draft.info()
+        failed = getattr(results["final_code"], "failed", None)
+        if failed:
+            out["failed_files"] = failed
+        return out
+
+    async def generate_design(self, user_prompt: str, max_concurrency: int | None = None,
+                              workspace_id: str | None = None):
+        ctx = ContextBudget()
+        draft = await self._draft(user_prompt)
+        results, timings = await run_stages(
+            self.stages(user_prompt, workspace_id=workspace_id, ctx=ctx, draft=draft),
+            max_concurrency or self.max_concurrency)
+        self._refine_later(user_prompt, draft)
+        return json.dumps(self._result(results, timings, ctx, draft), indent=2)
+
+    async def stream_design(self, user_prompt: str, max_concurrency: int | None = None,
+                            workspace_id: str | None = None):
+        """Yield pipeline events as they happen.
+
+        `stage_start`, `token` and `stage_done` events arrive interleaved
+        across concurrently running stages; the last event is `done` with
+        the same payload `generate_design` returns, or `error`. A `draft`
+        event first lists the stages served from a stored plan.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        ctx = ContextBudget()
+        draft = await self._draft(user_prompt)
+        if draft is not None:
+            queue.put_nowait({"event": "draft", "stages": ["vision", "ux"] if draft.exact else ["vision"],
+                              **draft.info()})
+        run = asyncio.ensure_future(run_stages(
+            self.stages(user_prompt, emit=queue.put_nowait, workspace_id=workspace_id, ctx=ctx, draft=draft),
+            max_concurrency or self.max_concurrency,
+            on_event=queue.put_nowait,
+        ))
+        run.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            if run.exception() is not None:
+                yield {"event": "error", "error": str(run.exception())}
+            else:
+                self._refine_later(user_prompt, draft)
+                yield {"event": "done", "result": self._result(*run.result(), ctx, draft)}
+        finally:
+            if not run.done():
+                run.cancel()  # client went away
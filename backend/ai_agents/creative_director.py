@@ -1,5 +1,7 @@
 from langchain_core.prompts import ChatPromptTemplate
 from gemini_config import get_runnable_llm
+from ai_agents.base import TokenCallback, complete_structured
+from ai_agents.schemas import Vision
 
 class CreativeDirectorAgent:
     """Agent responsible for defining the app's vision, tone, and design direction."""
@@ -15,13 +17,12 @@ Define the overall *vision* for this app idea.
 User request:
 {user_prompt}
 
-Return only valid JSON strictly matching keys:
+Return only valid JSON (no markdown fences) strictly matching keys:
 ["theme_mood", "color_palette", "design_style", "tone", "inspiration_references"]
 """)
             | self.llm
         ).with_config({"tags": ["CreativeDirector", "DesignPipeline"]})
 
-    async def create_vision(self, user_prompt: str):
+    async def create_vision(self, user_prompt: str, on_token: TokenCallback | None = None) -> Vision:
         """Generates the creative vision for a given app idea."""
-        result = await self.chain.ainvoke({"user_prompt": user_prompt})
-        return result.content if hasattr(result, "content") else result
+        return await complete_structured(self.chain, {"user_prompt": user_prompt}, Vision, on_token)
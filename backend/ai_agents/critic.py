@@ -1,4 +1,6 @@
-from ai_agents.base import BaseAgent
+from ai_agents.base import BaseAgent, TokenCallback, complete_structured
+from ai_agents.context import ContextBudget
+from ai_agents.schemas import Critique, FileSet
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from langchain_core.output_parsers import StrOutputParser
@@ -7,19 +9,21 @@ class CriticAgent(BaseAgent):
     def __init__(self):
         super().__init__("reviewer", temperature=0.3)
 
-    async def review_design(self, ui_code_json: str):
+    async def review_design(self, ui: FileSet, on_token: TokenCallback | None = None,
+                            ctx: ContextBudget | None = None) -> Critique:
         prompt = ChatPromptTemplate.from_template("""
         You are a Design Critic specializing in Flutter UI/UX.
-        Review the generated layouts critically for:
+        Review the generated layouts (widget structure and styling per file) critically for:
         - Visual hierarchy
         - Color & spacing
         - Accessibility
         - Material 3 compliance
 
-        Code:
+        Layouts:
         {ui_code_json}
 
-        Return JSON with keys: issues[], suggestions[]
+        Return only JSON (no markdown fences) with keys: issues[], suggestions[]
+        Leave issues empty if nothing needs fixing.
         """)
         chain = RunnableSequence(prompt | self.llm | StrOutputParser())
-        return await chain.ainvoke({"ui_code_json": ui_code_json})
+        return await complete_structured(chain, {"ui_code_json": (ctx or ContextBudget()).render("critique", self.role, ui)}, Critique, on_token)
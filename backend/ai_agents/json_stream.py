@@ -0,0 +1,179 @@
+"""
+Incremental, forgiving JSON parser for model output.
+----------------------------------------------------
+`JSONStream` is fed text chunks as they stream in and can return the best
+parse of everything seen so far at any moment:
+
+- prose and ``` fences around the JSON are skipped; a bracketed aside in
+  the prose ("see [1]", "plan [v2]:") that doesn't parse, or isn't the
+  kind of value the caller expects, is set aside and scanning resumes
+  at the next bracket
+- trailing commas are dropped as they are read
+- an unfinished document is closed (open string, arrays, objects) or cut
+  back to the last complete value
+- raw newlines inside strings are accepted
+
+Each character is looked at once, so re-parsing after every chunk costs
+O(chunk) plus one `json.loads` of the closed-off prefix.
+"""
+from __future__ import annotations
+import json
+from typing import Any, Callable, Optional
+
+_CLOSERS = {"{": "}", "[": "]"}
+_WS = " \t\r\n"
+
+
+def is_object(value: Any) -> bool:
+    return isinstance(value, dict)
+
+
+class JSONStream:
+    def __init__(self, expect: Optional[Callable[[Any], bool]] = is_object):
+        self.expect = expect  # accepts a top-level value (None: anything)
+        self._fallback: Any = None  # best parse of a container that was set aside
+        self._out: list[str] = []
+        self._stack: list[list] = []  # [bracket, expecting "key" | "value"] per open container
+        self._in_string = False
+        self._escape = False
+        self._string_is_key = False
+        self._pending_comma = False
+        self._safe: tuple[int, str] | None = None  # (len of _out, closers) at the last complete value
+        self.started = False
+        self.done = False  # an accepted top-level value was closed; the rest is ignored
+
+    # ------------------------------------------------------------------
+    # Feeding
+    # ------------------------------------------------------------------
+    def feed(self, chunk: str) -> None:
+        out, stack = self._out, self._stack
+        for ch in chunk:
+            if self.done:
+                return
+            if not self.started:
+                if ch in "{[":
+                    self.started = True
+                    self._open(ch)
+                continue
+
+            if self._in_string:
+                out.append(ch)
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if not self._string_is_key:
+                        self._mark_safe()
+                continue
+
+            if ch in _WS:
+                continue
+            if ch == ",":
+                self._pending_comma = True
+                self._mark_safe()
+                if stack and stack[-1][0] == "{":
+                    stack[-1][1] = "key"
+                continue
+            if ch in "}]":
+                self._pending_comma = False  # trailing comma
+                if not stack or _CLOSERS[stack[-1][0]] != ch:
+                    continue  # stray closer
+                stack.pop()
+                out.append(ch)
+                self._mark_safe()
+                if not stack:
+                    self._finish()
+                continue
+
+            if self._pending_comma:
+                out.append(",")
+                self._pending_comma = False
+            if ch in "{[":
+                self._open(ch)
+            elif ch == ":":
+                out.append(ch)
+                if stack and stack[-1][0] == "{":
+                    stack[-1][1] = "value"
+            elif ch == '"':
+                out.append(ch)
+                self._in_string = True
+                self._string_is_key = bool(stack) and stack[-1][0] == "{" and stack[-1][1] == "key"
+            else:
+                out.append(ch)  # number / literal character
+
+    def _accepts(self, value: Any) -> bool:
+        return value is not None and (self.expect is None or self.expect(value))
+
+    def _finish(self) -> None:
+        """The top-level container closed: keep it, or set it aside and rescan."""
+        try:
+            value = json.loads("".join(self._out), strict=False)
+        except ValueError:
+            value = None
+        if self._accepts(value):
+            self.done = True
+            return
+        if self._fallback is None:
+            fallback = self._repaired()
+            self._fallback = fallback if self._accepts(fallback) else None
+        self._out.clear()
+        self._stack.clear()
+        self._pending_comma = False
+        self._safe = None
+        self.started = False
+
+    def _open(self, ch: str) -> None:
+        self._out.append(ch)
+        self._stack.append([ch, "key"])
+        self._mark_safe()
+
+    def _closers(self) -> str:
+        return "".join(_CLOSERS[b] for b, _ in reversed(self._stack))
+
+    def _mark_safe(self) -> None:
+        self._safe = (len(self._out), self._closers())
+
+    # ------------------------------------------------------------------
+    # Reading
+    # ------------------------------------------------------------------
+    def value(self) -> Any:
+        """Best parse of the input so far, or None if nothing usable yet."""
+        value = self._repaired() if self.started else None
+        return value if self._accepts(value) else self._fallback
+
+    def _repaired(self) -> Any:
+        text = "".join(self._out)
+        if not self.done:
+            tail = ""
+            if self._in_string and not self._string_is_key:
+                tail = ("" if not self._escape else "\\") + '"'
+            try:
+                return json.loads(text + tail + self._closers(), strict=False)
+            except ValueError:
+                pass
+        try:
+            return json.loads(text, strict=False)
+        except ValueError:
+            pass
+        if self._safe is None:
+            return None
+        n, closers = self._safe
+        try:
+            return json.loads(text[:n] + closers, strict=False)
+        except ValueError:
+            return None
+
+
+def parse(text: str, expect: Optional[Callable[[Any], bool]] = is_object) -> Any:
+    """Parse (and repair) a complete model response.
+
+    Raises ValueError when the text contains no JSON that `expect` accepts.
+    """
+    stream = JSONStream(expect)
+    stream.feed(text)
+    value = stream.value()
+    if value is None:
+        raise ValueError("no JSON found in model output")
+    return value
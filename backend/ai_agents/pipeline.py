@@ -0,0 +1,125 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+import metrics
+
+
+@dataclass
+class Stage:
+    """One node of the agent pipeline.
+
+    `fn` receives the results of all finished stages (at least `deps`).
+    """
+    name: str
+    fn: Callable[[dict], Awaitable[Any]]
+    deps: tuple = field(default_factory=tuple)
+
+
+def _check_graph(stages: list[Stage]) -> None:
+    names = {s.name for s in stages}
+    if len(names) != len(stages):
+        raise ValueError("duplicate stage names")
+    for s in stages:
+        missing = set(s.deps) - names
+        if missing:
+            raise ValueError(f"stage {s.name!r} depends on unknown {sorted(missing)}")
+
+    state: dict[str, int] = {}  # 1 = visiting, 2 = done
+    graph = {s.name: s.deps for s in stages}
+
+    def visit(n: str) -> None:
+        if state.get(n) == 2:
+            return
+        if state.get(n) == 1:
+            raise ValueError(f"dependency cycle through {n!r}")
+        state[n] = 1
+        for d in graph[n]:
+            visit(d)
+        state[n] = 2
+
+    for n in graph:
+        visit(n)
+
+
+async def run_stages(stages: list[Stage], max_concurrency: int | None = None,
+                     on_event: Callable[[dict], None] | None = None) -> tuple[dict, dict]:
+    """Run `stages` as soon as their dependencies finish.
+
+    Returns `(results, timings)`; timings are seconds relative to the start
+    of the run. A failing stage cancels everything still running.
+    `on_event` receives `stage_start` / `stage_done` events.
+    """
+    _check_graph(stages)
+    sem = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+    results: dict[str, Any] = {}
+    timings: dict[str, dict] = {}
+    tasks: dict[str, asyncio.Task] = {}
+    t0 = time.perf_counter()
+
+    def emit(event: dict) -> None:
+        if on_event:
+            on_event(event)
+
+    async def call(stage: Stage):
+        emit({"event": "stage_start", "stage": stage.name})
+        return time.perf_counter() - t0, await stage.fn(results)
+
+    async def run(stage: Stage):
+        if stage.deps:
+            await asyncio.gather(*(tasks[d] for d in stage.deps))
+        ready = time.perf_counter() - t0
+        if sem:
+            async with sem:
+                start, results[stage.name] = await call(stage)
+        else:
+            start, results[stage.name] = await call(stage)
+        end = time.perf_counter() - t0
+        metrics.stage_seconds.observe(end - start, stage=stage.name)
+        timings[stage.name] = {
+            "ready": round(ready, 3),
+            "start": round(start, 3),
+            "end": round(end, 3),
+            "duration": round(end - start, 3),
+        }
+        emit({"event": "stage_done", "stage": stage.name, **timings[stage.name]})
+
+    for s in stages:
+        tasks[s.name] = asyncio.ensure_future(run(s))
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for t in tasks.values():
+            t.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        raise
+
+    timings["_total"] = {"wall": round(time.perf_counter() - t0, 3),
+                         "sum_of_stages": round(sum(t["duration"] for t in timings.values()), 3)}
+    return results, timings
+
+
+async def fan_out(items: list, fn: Callable[[Any], Awaitable[Any]], max_concurrency: int,
+                  retries: int = 0) -> tuple[list, list]:
+    """Run `fn` over `items`, at most `max_concurrency` at a time.
+
+    An item whose call raises is retried on its own, up to `retries` more
+    times. Returns `(results, failures)`: results in input order (None for
+    items that never succeeded) and `(item, exception)` pairs.
+    """
+    sem = asyncio.Semaphore(max(1, max_concurrency))
+    failures: list[tuple[Any, BaseException]] = []
+
+    async def one(item):
+        async with sem:
+            for attempt in range(retries + 1):
+                try:
+                    return await fn(item)
+                except Exception as e:
+                    if attempt == retries:
+                        failures.append((item, e))
+        return None
+
+    results = await asyncio.gather(*(one(i) for i in items))
+    return list(results), failures
@@ -0,0 +1,134 @@
+"""
+Typed outputs of the design pipeline stages.
+
+Every stage's reply is parsed into one of these models with
+`Model.from_text`, which never raises: missing keys get defaults, unknown
+keys are kept, and a reply with no usable JSON yields an empty model whose
+`raw` holds the original text. `compact()` is what the next stage's prompt
+receives.
+"""
+from __future__ import annotations
+import json
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from ai_agents.json_stream import parse
+
+
+class StageOutput(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    raw: str | None = Field(default=None, exclude=True)
+
+    @classmethod
+    def accepts(cls, value: Any) -> bool:
+        """Whether a top-level JSON value in the reply can be this model (else keep looking)."""
+        return isinstance(value, dict)
+
+    @classmethod
+    def coerce(cls, value: Any) -> dict:
+        """Shape a parsed value into the model's fields."""
+        return value if isinstance(value, dict) else {}
+
+    @classmethod
+    def from_value(cls, value: Any) -> "StageOutput":
+        try:
+            return cls.model_validate(cls.coerce(value))
+        except ValueError:
+            return cls()
+
+    @classmethod
+    def from_parsed(cls, value: Any, text: str) -> "StageOutput":
+        out = cls() if value is None else cls.from_value(value)
+        if not out.model_dump(exclude_defaults=True):
+            out.raw = text
+        return out
+
+    @classmethod
+    def from_text(cls, text: str) -> "StageOutput":
+        try:
+            value = parse(text, cls.accepts)
+        except ValueError:
+            value = None
+        return cls.from_parsed(value, text)
+
+    def data(self) -> Any:
+        return self.model_dump(exclude_defaults=True)
+
+    def compact(self) -> str:
+        """Minified JSON for the next prompt (the raw reply if nothing parsed)."""
+        data = self.data()
+        if not data and self.raw:
+            return self.raw
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+class Vision(StageOutput):
+    theme_mood: Any = None
+    color_palette: Any = None
+    design_style: Any = None
+    tone: Any = None
+    inspiration_references: list[Any] = Field(default_factory=list)
+
+
+class UXPlan(StageOutput):
+    screens: list[Any] = Field(default_factory=list)
+    navigation: Any = None
+    components: Any = None
+    accessibility: Any = None
+
+    def screen_names(self) -> list[str]:
+        """Screen names in plan order (entries may be strings or objects)."""
+        names = []
+        for s in self.screens:
+            if isinstance(s, dict):
+                s = next((s[k] for k in ("name", "title", "screen") if isinstance(s.get(k), str)), None)
+            if isinstance(s, str) and s.strip() and s.strip() not in names:
+                names.append(s.strip())
+        return names
+
+
+class GeneratedFile(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    file: str
+    content: str = ""
+
+
+class FileSet(StageOutput):
+    files: list[GeneratedFile] = Field(default_factory=list)
+
+    @classmethod
+    def accepts(cls, value: Any) -> bool:
+        # A bare list counts only as a list of files, not e.g. a "[1]" citation in the prose
+        if isinstance(value, list):
+            return bool(value) and all(isinstance(f, dict) and "file" in f for f in value)
+        return isinstance(value, dict)
+
+    @classmethod
+    def coerce(cls, value: Any) -> dict:
+        if isinstance(value, dict) and "files" not in value and "file" in value:
+            value = [value]
+        if isinstance(value, list):
+            value = {"files": value}
+        if not isinstance(value, dict):
+            return {}
+        # Drop entries the model got wrong instead of rejecting the whole set
+        files = [f for f in value.get("files") or []
+                 if isinstance(f, dict) and isinstance(f.get("file"), str)]
+        return {**value, "files": files}
+
+    def data(self) -> Any:
+        return [f.model_dump() for f in self.files]
+
+
+class Critique(StageOutput):
+    issues: list[Any] = Field(default_factory=list)
+    suggestions: list[Any] = Field(default_factory=list)
+
+    @property
+    def has_issues(self) -> bool:
+        if self.raw is not None:  # unparseable review: fall back to a keyword check
+            return "issues" in self.raw.lower()
+        return bool(self.issues)
@@ -1,4 +1,6 @@
-from ai_agents.base import BaseAgent
+from ai_agents.base import BaseAgent, TokenCallback, complete_structured
+from ai_agents.context import ContextBudget
+from ai_agents.schemas import FileSet, GeneratedFile
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from langchain_core.output_parsers import StrOutputParser
@@ -7,7 +9,7 @@ class StylistAgent(BaseAgent):
     def __init__(self):
         super().__init__("stylist", temperature=0.4)
 
-    async def apply_style(self, files_json: str):
+    async def apply_style(self, files: FileSet, on_token: TokenCallback | None = None) -> FileSet:
         prompt = ChatPromptTemplate.from_template("""
         You are a Flutter code stylist.
         Apply consistent formatting, typography, and Material 3 color theming.
@@ -15,7 +17,31 @@ class StylistAgent(BaseAgent):
         Input files (JSON):
         {files_json}
 
-        Return the updated JSON with styled code content only.
+        Return only the updated JSON list (no markdown fences): [{{"file": "...", "content": "<styled code>"}}]
         """)
         chain = RunnableSequence(prompt | self.llm | StrOutputParser())
-        return await chain.ainvoke({"files_json": files_json})
+        styled = await complete_structured(chain, {"files_json": files.compact()}, FileSet, on_token)
+        # Keep the unstyled files if the reply can't be used
+        return styled if styled.files else files
+
+    async def style_file(self, file: GeneratedFile, on_token: TokenCallback | None = None,
+                         ctx: ContextBudget | None = None, fresh: bool = False) -> GeneratedFile:
+        """Style a single file; raises ValueError on an unusable or cut-off reply.
+
+        `fresh` skips the LLM cache (for a retry after a bad reply).
+        """
+        prompt = ChatPromptTemplate.from_template("""
+        You are a Flutter code stylist.
+        Apply consistent formatting, typography, and Material 3 color theming.
+
+        Input file (JSON):
+        {file_json}
+
+        Return only the updated JSON object (no markdown fences): {{"file": "{file}", "content": "<styled code>"}}
+        """)
+        chain = RunnableSequence(prompt | self.llm | StrOutputParser())
+        inputs = {"file_json": (ctx or ContextBudget()).render("style", self.role, file), "file": file.file}
+        out = await complete_structured(chain, inputs, FileSet, on_token, whole=True, fresh=fresh)
+        if not out.files or not out.files[0].content.strip():
+            raise ValueError(f"no styled code returned for {file.file}")
+        return GeneratedFile(file=file.file, content=out.files[0].content)
@@ -1,4 +1,6 @@
-from ai_agents.base import BaseAgent
+from ai_agents.base import BaseAgent, TokenCallback, complete_structured
+from ai_agents.context import ContextBudget
+from ai_agents.schemas import Critique, FileSet, UXPlan
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from langchain_core.output_parsers import StrOutputParser
@@ -7,15 +9,22 @@ class UIDesignerAgent(BaseAgent):
     def __init__(self):
         super().__init__("codewriter", temperature=0.6)
 
-    async def design_ui(self, ux_json: str):
+    async def design_ui(self, ux: UXPlan, on_token: TokenCallback | None = None,
+                        feedback: Critique | None = None, ctx: ContextBudget | None = None) -> FileSet:
         prompt = ChatPromptTemplate.from_template("""
         You are a Flutter UI designer following Material 3.
         Generate the core widget layout for each screen in this UX plan:
 
         {ux_json}
+        {feedback}
 
         Use good naming, spacing, and theming conventions.
-        Return JSON list of objects: [{{"file": "dashboard.dart", "content": "<code>"}}]
+        Return only a JSON list (no markdown fences) of objects: [{{"file": "dashboard.dart", "content": "<code>"}}]
         """)
         chain = RunnableSequence(prompt | self.llm | StrOutputParser())
-        return await chain.ainvoke({"ux_json": ux_json})
+        ctx = ctx or ContextBudget()
+        inputs = {
+            "ux_json": ctx.render("ui", self.role, ux),
+            "feedback": f"\nFeedback:\n{ctx.render('feedback', self.role, feedback)}\n" if feedback else "",
+        }
+        return await complete_structured(chain, inputs, FileSet, on_token)
@@ -1,4 +1,6 @@
-from ai_agents.base import BaseAgent
+from ai_agents.base import BaseAgent, TokenCallback, complete_structured
+from ai_agents.context import ContextBudget
+from ai_agents.schemas import UXPlan, Vision
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableSequence
 from langchain_core.output_parsers import StrOutputParser
@@ -7,19 +9,29 @@ class UXArchitectAgent(BaseAgent):
     def __init__(self):
         super().__init__("planner", temperature=0.4)
 
-    async def design_structure(self, vision_json: str):
+    async def design_structure(self, vision: Vision, on_token: TokenCallback | None = None,
+                               ctx: ContextBudget | None = None, request: str | None = None) -> UXPlan:
+        # `request` is the user's own prompt, given when the vision was drafted for a similar one
+        asked = """
+        The user asked for:
+        {request}
+        Where the vision doesn't fit this request, follow the request.
+""" if request else ""
         prompt = ChatPromptTemplate.from_template("""
         You are a UX Architect.
         Using this vision:
         {vision_json}
-
+""" + asked + """
         Design:
         1. List of main screens
         2. Navigation pattern (bottom bar, tabs, drawer, FAB)
         3. Component hierarchy per screen
         4. Accessibility & responsive design principles
 
-        Return JSON with keys: screens, navigation, components, accessibility.
+        Return only JSON (no markdown fences) with keys: screens, navigation, components, accessibility.
         """)
         chain = RunnableSequence(prompt | self.llm | StrOutputParser())
-        return await chain.ainvoke({"vision_json": vision_json})
+        inputs = {"vision_json": (ctx or ContextBudget()).render("ux", self.role, vision)}
+        if request:
+            inputs["request"] = request
+        return await complete_structured(chain, inputs, UXPlan, on_token)
@@ -0,0 +1,229 @@
+"""
+SSE smoothness while hundreds of workspace file requests run concurrently.
+
+Starts the API in a child process (uvicorn, fake flutter, throwaway root)
+and opens --streams build-log SSE streams. Each fake build prints a progress
+line every --tick seconds. The gap between consecutive progress lines is
+measured per stream, first on an idle server and then while --concurrency
+clients in another process hammer the file endpoints (read, write, tree
+listing, preview) as fast as they can. Any time the server's event loop is
+blocked, gaps stretch past the tick.
+
+    python benchmarks/bench_async_io.py --streams 20 --concurrency 300
+"""
+from __future__ import annotations
+import argparse, asyncio, json, os, random, re, shutil, socket, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+TICK_LINE = re.compile(r"build: \d+/\d+")
+
+
+# -------------------------------------------------------------------------
+# Server side (child process)
+# -------------------------------------------------------------------------
+def serve(port: int, root: Path) -> None:
+    sys.path.insert(0, str(BACKEND))
+    import uvicorn
+    import server
+    import workspace as ws
+    import workspace_lifecycle
+    from workspace_pool import pool
+
+    ws.WORKSPACES = root / "workspaces"
+    ws.LAYERS = root / "layers"
+    workspace_lifecycle.ARCHIVE_DIR = root / "archives"
+    workspace_lifecycle.ACCESS_DIR = root / "access"
+    pool.pool_dir = root / "pool"
+    ws.WORKSPACES.mkdir(parents=True, exist_ok=True)
+    uvicorn.run(server.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(root: Path, args) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = {**os.environ,
+           "GEMINI_API_KEY": "offline-benchmark", "LLM_CACHE": "false", "LANGCHAIN_TRACING_V2": "false",
+           "FLUTTER_BIN": f"{sys.executable} {BACKEND / 'tools' / 'fake_flutter.py'}",
+           "FAKE_FLUTTER_DELAY": str(args.tick * args.ticks), "FAKE_FLUTTER_TICKS": str(args.ticks),
+           "PUB_CACHE_DIR": str(root / "pub-cache"), "JOB_DB": str(root / "jobs.sqlite"),
+           "METRICS_DIR": str(root / "metrics"), "LIFECYCLE": "false", "JOB_WORKERS": "0",
+           "WORKSPACE_POOL_SIZE": "0", "BUILD_WORKERS": str(args.streams)}
+    if args.io_threads:
+        env["WORKSPACE_IO_THREADS"] = str(args.io_threads)
+    proc = subprocess.Popen([sys.executable, __file__, "--serve", str(port), "--root", str(root)],
+                            cwd=BACKEND, env=env, stdout=subprocess.DEVNULL)
+    return proc, f"http://127.0.0.1:{port}"
+
+
+# -------------------------------------------------------------------------
+# Client side
+# -------------------------------------------------------------------------
+def _ms(values: list[float]) -> dict:
+    if not values:
+        return {"n": 0}
+    ordered = sorted(values)
+    return {
+        "n": len(ordered),
+        "median_ms": round(statistics.median(ordered) * 1000, 2),
+        "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+
+async def stream_build(client, wid: str) -> list[float]:
+    """Arrival times of the build's progress lines."""
+    times = []
+    async with client.stream("GET", f"/api/workspaces/{wid}/build/logs") as resp:
+        async for line in resp.aiter_lines():
+            if line.startswith("data:") and TICK_LINE.search(line):
+                times.append(time.perf_counter())
+    return times
+
+
+async def run_streams(client, wids: list[str], round_no: int, tick: float) -> dict:
+    for wid in wids:  # a source change, so the build isn't skipped
+        r = await client.put(f"/api/workspaces/{wid}/file", params={"durability": "none"},
+                             json={"path": "lib/round.dart", "content": f"// round {round_no}\n"})
+        r.raise_for_status()
+    streams = await asyncio.gather(*(stream_build(client, wid) for wid in wids))
+    gaps = [b - a for times in streams for a, b in zip(times, times[1:])]
+    return {
+        "streams": len(wids), "tick_ms": tick * 1000,
+        "progress_lines": sum(len(t) for t in streams),
+        "gap": _ms(gaps),
+        "stalls": sum(1 for g in gaps if g > 2 * tick),  # a tick arrived over a tick late
+    }
+
+
+async def hammer(client, load_wids: list[str], preview_wids: list[str], files: int,
+                 stop: asyncio.Event, latencies: dict, errors: dict, seed: int) -> None:
+    rng = random.Random(seed)
+    while not stop.is_set():
+        op = rng.choice(("read", "read", "write", "tree", "preview"))
+        wid = rng.choice(load_wids)
+        started = time.perf_counter()
+        try:
+            if op == "read":
+                r = await client.get(f"/api/workspaces/{wid}/file", params={"path": f"lib/load/f{rng.randrange(files)}.dart"})
+            elif op == "write":
+                r = await client.put(f"/api/workspaces/{wid}/file",
+                                     json={"path": f"lib/load/w{rng.randrange(files)}.dart", "content": "// w\n" * 200})
+            elif op == "tree":
+                r = await client.get(f"/api/workspaces/{wid}")
+            else:
+                r = await client.get(f"/preview/{rng.choice(preview_wids)}/build/web/main.dart.js",
+                                     headers={"accept-encoding": "gzip"})
+            status = r.status_code
+        except Exception as e:  # noqa: BLE001  (count it, keep the load on)
+            status = type(e).__name__
+        latencies.setdefault(op, []).append(time.perf_counter() - started)
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+
+
+async def load(args) -> dict:
+    """Run the file-request load until stdin closes; report what it saw."""
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=args.load, limits=limits, timeout=120) as client:
+        stop, latencies, errors = asyncio.Event(), {}, {}
+        workers = [asyncio.create_task(hammer(client, args.load_wids.split(","), args.preview_wids.split(","),
+                                              args.files, stop, latencies, errors, seed))
+                   for seed in range(args.concurrency)]
+        started = time.perf_counter()
+        await asyncio.to_thread(sys.stdin.read)
+        stop.set()
+        await asyncio.gather(*workers)
+    return {"elapsed_s": time.perf_counter() - started, "errors": errors, "latencies": latencies}
+
+
+async def run(args) -> dict:
+    import httpx
+
+    root = Path(tempfile.mkdtemp(prefix="appdev-aio-"))
+    proc, url = start_server(root, args)
+    try:
+        async with httpx.AsyncClient(base_url=url, timeout=120) as client:
+            for _ in range(200):
+                try:
+                    if (await client.get("/api/builds/stats")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("server did not start")
+
+            async def workspace() -> str:
+                r = await client.post("/api/workspaces")
+                r.raise_for_status()
+                return r.json()["workspaceId"]
+
+            stream_wids = [await workspace() for _ in range(args.streams)]
+            load_wids = [await workspace() for _ in range(args.load_workspaces)]
+            for wid in load_wids:
+                r = await client.put(f"/api/workspaces/{wid}/files", json={
+                    "durability": "none",
+                    "files": [{"path": f"lib/load/f{i}.dart", "content": f"// {i}\n" * 100}
+                              for i in range(args.files)]})
+                r.raise_for_status()
+            await run_streams(client, stream_wids, 0, args.tick)  # first builds: pub get, preview exists
+
+            idle = await run_streams(client, stream_wids, 1, args.tick)
+
+            # The load runs in its own process so its client work can't delay our SSE reads
+            loader = subprocess.Popen(
+                [sys.executable, __file__, "--load", url, "--load-wids", ",".join(load_wids),
+                 "--preview-wids", ",".join(stream_wids), "--concurrency", str(args.concurrency),
+                 "--files", str(args.files)],
+                cwd=BACKEND, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+            await asyncio.sleep(1.0)  # let the load ramp up first
+            loaded = await run_streams(client, stream_wids, 2, args.tick)
+            seen, _ = await asyncio.to_thread(loader.communicate, "")
+            io = (await client.get("/metrics")).text
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        shutil.rmtree(root, ignore_errors=True)
+
+    report = json.loads(seen)
+    total = sum(len(v) for v in report["latencies"].values())
+    loaded["requests"] = {
+        "concurrency": args.concurrency,
+        "completed": total,
+        "requests_per_s": round(total / report["elapsed_s"], 1),
+        "errors": report["errors"],
+        **{op: _ms(v) for op, v in sorted(report["latencies"].items())},
+    }
+    loaded["io_pool"] = [line for line in io.splitlines() if line.startswith("workspace_io_tasks")]
+    return {"idle": idle, "loaded": loaded}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--streams", type=int, default=10, help="concurrent build-log SSE streams")
+    ap.add_argument("--concurrency", type=int, default=200, help="concurrent file-request clients")
+    ap.add_argument("--tick", type=float, default=0.05, help="seconds between fake build progress lines")
+    ap.add_argument("--ticks", type=int, default=60, help="progress lines per fake build step")
+    ap.add_argument("--load-workspaces", type=int, default=4)
+    ap.add_argument("--files", type=int, default=200, help="files per load workspace")
+    ap.add_argument("--io-threads", type=int, help="WORKSPACE_IO_THREADS for the server")
+    ap.add_argument("--serve", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--root", type=Path, help=argparse.SUPPRESS)
+    ap.add_argument("--load", help=argparse.SUPPRESS)
+    ap.add_argument("--load-wids", help=argparse.SUPPRESS)
+    ap.add_argument("--preview-wids", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.serve:
+        serve(args.serve, args.root)
+    elif args.load:
+        print(json.dumps(asyncio.run(load(args))))
+    else:
+        print(json.dumps(asyncio.run(run(args)), indent=2))
@@ -0,0 +1,63 @@
+"""
+Code generation wall clock: one call per stage vs one call per screen.
+
+The fake model (fake_llm) is given a decoder-like latency
+(fixed overhead + output tokens / throughput), so a reply covering every
+screen takes proportionally longer than a reply for one screen. Only the
+codewriter → stylist part of the pipeline is timed.
+
+    python benchmarks/bench_fanout.py --screens 10 --tps 80
+"""
+from __future__ import annotations
+import argparse, asyncio, json, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import bench_structured  # noqa: E402,F401  (sets up the offline env)
+from fake_llm import FakeDesignLLM, replies
+
+import gemini_config
+import llm_pool
+from ai_agents.schemas import UXPlan
+
+
+async def run(screens: int, overhead: float, tps: float, concurrency: int) -> dict:
+    from ai_agents.coordinator import CoordinatorAgent
+
+    gemini_config.available_models = lambda: []
+    answers = replies(screens)
+    fake = FakeDesignLLM(answers, {}, latency=(overhead, tps))
+    llm_pool.pool.client = lambda model_id, **kw: fake
+    gemini_config.get_runnable_llm.cache_clear()
+
+    coordinator = CoordinatorAgent(codegen_concurrency=concurrency)
+    ux = UXPlan.from_text(answers["ux"])
+    tap = lambda *a: None  # noqa: E731
+
+    started = time.perf_counter()
+    code = await coordinator.codewriter.generate_code(ux)
+    single = await coordinator.stylist.apply_style(code)
+    single_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fanned = await coordinator._write_code(ux, tap)
+    fanout_s = time.perf_counter() - started
+
+    return {
+        "screens": screens,
+        "model": {"overhead_s": overhead, "tokens_per_s": tps},
+        "concurrency": concurrency,
+        "single_call": {"wall_s": round(single_s, 3), "files": len(single.files)},
+        "per_file": {"wall_s": round(fanout_s, 3), "files": len(fanned.files)},
+        "speedup": round(single_s / fanout_s, 2),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--screens", type=int, default=10)
+    ap.add_argument("--overhead", type=float, default=0.4, help="fixed seconds per call")
+    ap.add_argument("--tps", type=float, default=80.0, help="fake decode speed, output tokens/s")
+    ap.add_argument("--concurrency", type=int, default=12)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(run(args.screens, args.overhead, args.tps, args.concurrency)), indent=2))
@@ -0,0 +1,48 @@
+"""
+Import time of gemini_config and the agent package, offline.
+
+Each sample is a fresh interpreter with no API key and no proxy access, so
+nothing can hide behind a warm module cache or a fast network.
+
+    python benchmarks/bench_import.py --runs 10
+"""
+from __future__ import annotations
+import argparse, json, os, statistics, subprocess, sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+TARGETS = ["gemini_config", "ai_agents.coordinator"]
+
+SNIPPET = """
+import time, sys
+t = time.perf_counter()
+import {module}
+sys.stderr.write(str(time.perf_counter() - t))
+"""
+
+
+def sample(module: str) -> float:
+    env = {k: v for k, v in os.environ.items() if k != "GEMINI_API_KEY"}
+    env.update(LANGCHAIN_TRACING_V2="false", HTTPS_PROXY="http://127.0.0.1:9", HTTP_PROXY="http://127.0.0.1:9")
+    proc = subprocess.run([sys.executable, "-c", SNIPPET.format(module=module)], cwd=BACKEND,
+                          env=env, capture_output=True, text=True, check=True)
+    return float(proc.stderr.strip().splitlines()[-1]) * 1000
+
+
+def run(runs: int) -> dict:
+    out = {}
+    for module in TARGETS:
+        ms = [sample(module) for _ in range(runs)]
+        out[module] = {"runs": runs, "median_ms": round(statistics.median(ms), 2), "max_ms": round(max(ms), 2)}
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--budget-ms", type=float, default=100.0,
+                    help="exit non-zero if gemini_config's median import exceeds this")
+    args = ap.parse_args()
+    result = run(args.runs)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["gemini_config"]["median_ms"] <= args.budget_ms else 1)
@@ -0,0 +1,49 @@
+"""
+LLM response cache with a fake model (no network, no API key).
+
+Runs the same prompts through `prompt | CachedLLM(fake) | StrOutputParser()`
+several times and reports wall time per pass and cache counters.
+
+    python benchmarks/bench_llm_cache.py --latency 0.2 --passes 3
+"""
+from __future__ import annotations
+import argparse, asyncio, json, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from llm_cache import CachedLLM, LLMCache
+
+PROMPTS = ["finance tracker", "todo app", "tutoring app", "recipe book", "fitness log"]
+
+
+async def run(latency: float, passes: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = LLMCache(path=Path(tmp) / "cache.sqlite")
+        fake = FakeListChatModel(responses=[f'{{"screens": ["s{i}"]}}' for i in range(len(PROMPTS))],
+                                 sleep=latency)
+        chain = (ChatPromptTemplate.from_template("Design an app: {idea}")
+                 | CachedLLM(fake, "fake-model", {"temperature": 0.5}, cache)
+                 | StrOutputParser())
+
+        out = {"passes": []}
+        for _ in range(passes):
+            started = time.perf_counter()
+            await asyncio.gather(*(chain.ainvoke({"idea": p}) for p in PROMPTS))
+            out["passes"].append(round(time.perf_counter() - started, 3))
+
+        started = time.perf_counter()
+        await chain.ainvoke({"idea": PROMPTS[0]}, config={"configurable": {"llm_cache_bypass": True}})
+        out["bypass_call_s"] = round(time.perf_counter() - started, 3)
+        out["stats"] = cache.stats()
+        return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--latency", type=float, default=0.2, help="fake model latency per call (s)")
+    ap.add_argument("--passes", type=int, default=3)
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(run(args.latency, args.passes)), indent=2))
@@ -0,0 +1,106 @@
+"""
+Preview serving: naive re-read vs. precompressed + ETag layer.
+
+Synthesizes a build/web tree shaped like a typical Flutter release build and
+replays page loads against `preview.resolve` (no HTTP stack involved):
+first visits send `Accept-Encoding`, repeat visits also send `If-None-Match`.
+
+    python benchmarks/bench_preview.py --loads 200
+"""
+from __future__ import annotations
+import argparse, json, os, random, re, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import preview
+
+PAGE = ["index.html", "flutter.js", "flutter_bootstrap.js", "main.dart.js",
+        "assets/FontManifest.json", "assets/AssetManifest.bin.json",
+        "assets/fonts/MaterialIcons-Regular.otf", "canvaskit/canvaskit.wasm", "canvaskit/canvaskit.js"]
+
+
+def _js_like(size: int, rng: random.Random) -> bytes:
+    words = ["function", "return", "var", "const", "this", "prototype", "null", "A.", "B.", "$.", "=>", "{", "}", ";"]
+    out, n = [], 0
+    while n < size:
+        w = rng.choice(words) + rng.choice([" ", "", "\n"]) + f"a{rng.randrange(5000)}"
+        out.append(w)
+        n += len(w)
+    return "".join(out).encode()[:size]
+
+
+def make_build(root: Path) -> Path:
+    rng = random.Random(7)
+    web = root / "build" / "web-bench"
+    sizes = {"flutter.js": 9_000, "flutter_bootstrap.js": 10_000, "main.dart.js": 2_400_000,
+             "assets/FontManifest.json": 200, "assets/AssetManifest.bin.json": 300,
+             "canvaskit/canvaskit.js": 90_000}
+    for rel, size in sizes.items():
+        (web / rel).parent.mkdir(parents=True, exist_ok=True)
+        (web / rel).write_bytes(_js_like(size, rng))
+    (web / "assets/fonts").mkdir(parents=True, exist_ok=True)
+    (web / "assets/fonts/MaterialIcons-Regular.otf").write_bytes(rng.randbytes(1_600_000))
+    # wasm compresses roughly 2-3x in practice; mix structured and random bytes
+    (web / "canvaskit/canvaskit.wasm").write_bytes(_js_like(4_000_000, rng) + rng.randbytes(2_000_000))
+    (web / "index.html").write_text('<!DOCTYPE html><html><head><base href="/"><meta charset="UTF-8">'
+                                    + "<!-- padding -->" * 100 + '</head><body>'
+                                    '<script src="flutter_bootstrap.js" async></script></body></html>')
+    os.symlink(web.name, root / "build" / "web")
+    return web
+
+
+def naive(base: Path, rel: str) -> int:
+    f = base / "build" / "web" / rel
+    if not f.exists():
+        return 0
+    if rel == "index.html":
+        html = re.sub(r'<base href="[^"]*">', '<base href="/preview/x/build/web/">', f.read_text())
+        return len(html.encode())
+    return len(f.read_bytes())
+
+
+def layered(base: Path, rel: str, etags: dict, revisit: bool) -> int:
+    res = preview.resolve("bench", base, rel, accept_encoding="gzip, deflate, br",
+                          if_none_match=etags.get(rel) if revisit else None)
+    etags[rel] = res.headers.get("ETag")
+    if res.body is not None:
+        return len(res.body)
+    if res.path is not None:
+        return len(res.path.read_bytes())
+    return 0
+
+
+def run(loads: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        base = Path(tmp)
+        web = make_build(base)
+        started = time.perf_counter()
+        manifest = preview.precompress(web)
+        precompress_s = time.perf_counter() - started
+
+        results = {"precompress_s": round(precompress_s, 3), "brotli": preview.brotli is not None,
+                   "assets": len(manifest)}
+        etags: dict = {}
+        for name, serve in (
+            ("naive", lambda rel, i: naive(base, rel)),
+            ("layered_first_visit", lambda rel, i: layered(base, rel, etags, False)),
+            ("layered_repeat_visit", lambda rel, i: layered(base, rel, etags, i > 0)),
+        ):
+            served = 0
+            started = time.perf_counter()
+            for i in range(loads):
+                for rel in PAGE:
+                    served += serve(rel, i)
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                "requests": loads * len(PAGE),
+                "requests_per_s": round(loads * len(PAGE) / elapsed, 1),
+                "bytes_per_page_load": served // loads,
+            }
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--loads", type=int, default=50, help="page loads per strategy")
+    print(json.dumps(run(ap.parse_args().loads), indent=2))
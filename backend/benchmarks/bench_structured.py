@@ -0,0 +1,90 @@
+"""
+Prompt tokens per design-pipeline run: structured hand-off vs free text.
+
+The fake model (fake_llm) answers each agent with the kind of reply Gemini
+gives (a sentence of prose, a ```json fence, pretty-printed JSON). The pipeline
+runs twice:
+
+- structured: each stage gets the parsed output of the stages before it,
+  cut down to the fields it needs (ai_agents.context)
+- free-text:  each stage gets the previous replies verbatim, as before
+
+and the prompt tokens sent per stage (~4 chars per token) are compared.
+
+    python benchmarks/bench_structured.py --screens 6
+"""
+from __future__ import annotations
+import argparse, asyncio, json, os, sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.update(GEMINI_API_KEY="offline-benchmark", LLM_CACHE="false", LANGCHAIN_TRACING_V2="false")
+
+import gemini_config
+import llm_pool
+from ai_agents.context import ContextBudget
+from ai_agents.schemas import StageOutput
+from fake_llm import FakeDesignLLM, replies
+
+def _free_text(enabled: bool) -> None:
+    """Make every stage output hand its raw reply downstream, as before."""
+    if enabled:
+        def from_parsed(cls, value, text):
+            out = cls() if value is None else cls.from_value(value)
+            out.raw = text
+            return out
+
+        def render(self, stage, role, value, *args):
+            if isinstance(value, StageOutput) and value.raw is not None:
+                return value.raw
+            return value.model_dump_json() if hasattr(value, "model_dump_json") else str(value)
+
+        StageOutput.from_parsed = classmethod(from_parsed)
+        StageOutput.compact = lambda self: self.raw if self.raw is not None else _ORIGINAL[1](self)
+        ContextBudget.render = render
+    else:
+        StageOutput.from_parsed, StageOutput.compact, ContextBudget.render = _ORIGINAL
+
+
+_ORIGINAL = (StageOutput.__dict__["from_parsed"], StageOutput.compact, ContextBudget.render)
+
+
+async def run_mode(answers: dict, free_text: bool) -> dict:
+    from ai_agents.coordinator import CoordinatorAgent
+
+    sent: dict[str, int] = {}
+    fake = FakeDesignLLM(answers, sent)
+    llm_pool.pool.client = lambda model_id, **kw: fake
+    gemini_config.get_runnable_llm.cache_clear()
+    _free_text(free_text)
+    try:
+        result = json.loads(await CoordinatorAgent().generate_design(
+            "A tutoring app with teacher profiles and course videos"))
+    finally:
+        _free_text(False)
+    out = {"prompt_tokens": sum(sent.values()), "per_stage": sent}
+    if not free_text:
+        out["context_tokens"] = result["context_tokens"]
+    return out
+
+
+async def run(screens: int) -> dict:
+    gemini_config.available_models = lambda: []
+    answers = replies(screens)
+    structured = await run_mode(answers, free_text=False)
+    free = await run_mode(answers, free_text=True)
+    saved = free["prompt_tokens"] - structured["prompt_tokens"]
+    return {
+        "screens": screens,
+        "free_text": free,
+        "structured": structured,
+        "tokens_saved": saved,
+        "saved_pct": round(100 * saved / free["prompt_tokens"], 1),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--screens", type=int, default=6, help="screens in the fake UX plan")
+    args = ap.parse_args()
+    print(json.dumps(asyncio.run(run(args.screens)), indent=2))
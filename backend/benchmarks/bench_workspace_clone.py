@@ -0,0 +1,65 @@
+"""
+Workspace creation: full copy vs. shared base layer.
+
+Runs offline against a layer built from templates/blank (no `flutter create`)
+and prints creation time and bytes written for N workspaces per strategy.
+
+    python benchmarks/bench_workspace_clone.py -n 200
+"""
+from __future__ import annotations
+import argparse, json, os, shutil, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import workspace as ws
+
+
+def _tree_bytes(root: Path) -> tuple[int, int]:
+    """(apparent bytes, bytes on unique inodes) under root."""
+    apparent, unique, seen = 0, 0, set()
+    for r, _, files in os.walk(root):
+        for name in files:
+            st = os.lstat(os.path.join(r, name))
+            apparent += st.st_size
+            if st.st_ino not in seen:
+                seen.add(st.st_ino)
+                unique += st.st_size
+    return apparent, unique
+
+
+def run(n: int) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        layer = tmp / "layer"
+        shutil.copytree(ws.TEMPLATE, layer)
+        layer_bytes, _ = _tree_bytes(layer)
+
+        for name, clone in (
+            ("copytree", lambda dst: shutil.copytree(layer, dst)),
+            ("layer", lambda dst: ws.materialize(layer, dst)),
+        ):
+            out = tmp / f"out-{name}"
+            out.mkdir()
+            written = 0
+            started = time.perf_counter()
+            for i in range(n):
+                stats = clone(out / f"w{i}")
+                written += stats["bytes_copied"] if isinstance(stats, dict) else layer_bytes
+            elapsed = time.perf_counter() - started
+            apparent, unique = _tree_bytes(out)
+            results[name] = {
+                "workspaces": n,
+                "total_s": round(elapsed, 4),
+                "per_workspace_ms": round(elapsed / n * 1000, 3),
+                "bytes_written": written,
+                "apparent_bytes": apparent,
+                "unique_bytes_on_disk": unique,
+            }
+    return results
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("-n", type=int, default=100, help="workspaces per strategy")
+    print(json.dumps(run(ap.parse_args().n), indent=2))
@@ -0,0 +1,394 @@
+"""
+Offline benchmark suite: the design pipeline and the backend hot paths.
+
+Everything runs in a throwaway root with the fake model (fake_llm, given a
+decoder-like latency) and the fake flutter CLI (tools/fake_flutter.py), so
+no API key, SDK or network is involved and two runs on the same machine
+are comparable. Cases:
+
+- pipeline          CoordinatorAgent.generate_design wall time, writing
+                    into a workspace; mean seconds per stage; one run each
+                    of a reworded prompt (exact draft: vision and UX
+                    reused) and a similar one (near draft: vision reused)
+- workspace_create  base layer build, then new_workspace() per call
+- list_tree         a workspace with --tree-files files: cold scan, warm,
+                    one directory level, and after a single write
+- file_io           write_files per durability mode, read_files
+- build_logs        a fake build through the scheduler (time to first log
+                    line, total), the SSE endpoint, and ring-buffer fan-out
+                    to many subscribers
+- preview           first and repeat page loads through the HTTP app
+
+The result is one JSON document. Save it and pass it back as --baseline to
+list every timing that moved by more than --tolerance; the exit status is 1
+if anything got slower.
+
+    python benchmarks/suite.py --out before.json
+    python benchmarks/suite.py --baseline before.json --only pipeline,file_io
+"""
+from __future__ import annotations
+import argparse, asyncio, json, os, platform, shutil, statistics, subprocess, sys, tempfile, time
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent
+SCRATCH = Path(tempfile.mkdtemp(prefix="appdev-bench-"))
+
+# Progress, flutter output and the backend's prints go to stderr; stdout is the JSON
+RESULT_OUT = os.fdopen(os.dup(1), "w")
+os.dup2(2, 1)
+
+sys.path.insert(0, str(BACKEND))
+os.environ.update(
+    GEMINI_API_KEY="offline-benchmark", LLM_CACHE="false", LANGCHAIN_TRACING_V2="false",
+    FLUTTER_BIN=f"{sys.executable} {BACKEND / 'tools' / 'fake_flutter.py'}",
+    PUB_CACHE_DIR=str(SCRATCH / "pub-cache"), JOB_DB=str(SCRATCH / "jobs.sqlite"),
+    METRICS_DIR=str(SCRATCH / "metrics"), LIFECYCLE="false", TREE_WATCH="false",
+    SPECULATIVE_PATH=str(SCRATCH / "drafts.sqlite"), SPECULATIVE_REFINE="false",
+)
+
+import httpx  # noqa: E402
+
+import gemini_config  # noqa: E402
+import llm_pool  # noqa: E402
+import metrics  # noqa: E402
+import speculative  # noqa: E402
+import tree_index  # noqa: E402
+import workspace as ws  # noqa: E402
+import workspace_lifecycle  # noqa: E402
+import workspace_pool  # noqa: E402
+from build_scheduler import BuildJob, scheduler  # noqa: E402
+from fake_llm import FakeDesignLLM, replies  # noqa: E402
+
+CASES = ("pipeline", "workspace_create", "list_tree", "file_io", "build_logs", "preview")
+PROMPT = "A tutoring app with teacher profiles and course videos"
+REWORDED_PROMPT = "Build me a tutoring app with teacher profiles and course videos"
+SIMILAR_PROMPT = "Tutoring app with teacher profiles and course video lessons"
+
+
+def _isolate() -> None:
+    """Point every on-disk location of the backend into SCRATCH."""
+    ws.WORKSPACES = SCRATCH / "workspaces"
+    ws.LAYERS = SCRATCH / "layers"
+    workspace_lifecycle.ARCHIVE_DIR = SCRATCH / "archives"
+    workspace_lifecycle.ACCESS_DIR = SCRATCH / "access"
+    workspace_pool.POOL_DIR = SCRATCH / "pool"
+    # The shared pool was built at import time, with the old directory
+    workspace_pool.pool.pool_dir = workspace_pool.POOL_DIR
+    workspace_pool.pool.pool_dir.mkdir(parents=True)
+    ws.WORKSPACES.mkdir(parents=True)
+
+
+def _timings(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+    }
+
+
+def _timed(fn, runs: int, before=None) -> dict:
+    samples = []
+    for _ in range(runs):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return _timings(samples)
+
+
+# -------------------------------------------------------------------------
+# Cases
+# -------------------------------------------------------------------------
+async def bench_pipeline(args) -> dict:
+    from ai_agents.coordinator import CoordinatorAgent
+
+    gemini_config.available_models = lambda: []
+    fake = FakeDesignLLM(replies(args.screens), {}, latency=(args.llm_overhead, args.llm_tps))
+    llm_pool.pool.client = lambda model_id, **kw: fake
+    gemini_config.get_runnable_llm.cache_clear()
+    metrics.stage_seconds._values.clear()
+
+    wid = ws.new_workspace()["id"]
+    samples, files = [], 0
+    speculative.SPECULATIVE_ENABLED = False  # every run pays for the planner stages
+    for _ in range(args.pipeline_runs):
+        started = time.perf_counter()
+        result = json.loads(await CoordinatorAgent().generate_design(PROMPT, workspace_id=wid))
+        samples.append(time.perf_counter() - started)
+        files = len(result["final_code"])
+    stages = {key[0]: round(total / n, 4) for key, (_, total, n) in metrics.stage_seconds._values.items()}
+
+    speculative.SPECULATIVE_ENABLED = True
+    await CoordinatorAgent().plan(PROMPT, "warm-up")
+    drafted = {}
+    for name, prompt in (("exact", REWORDED_PROMPT), ("near", SIMILAR_PROMPT)):
+        started = time.perf_counter()
+        result = json.loads(await CoordinatorAgent().generate_design(prompt, workspace_id=wid))
+        elapsed = time.perf_counter() - started
+        drafted[name] = {"similarity": result.get("draft", {}).get("similarity"), "wall_s": round(elapsed, 4),
+                         "speedup": round(statistics.median(samples) / elapsed, 2)}
+    return {
+        "screens": args.screens, "files": files,
+        "model": {"overhead_s": args.llm_overhead, "tokens_per_s": args.llm_tps},
+        "wall": _timings(samples),
+        "stage_mean_s": dict(sorted(stages.items())),
+        "speculative": drafted,
+    }
+
+
+def bench_workspace_create(args) -> dict:
+    shutil.rmtree(ws.LAYERS, ignore_errors=True)  # earlier cases built it; workspaces keep their links
+    started = time.perf_counter()
+    ws.base_layer()
+    layer_s = time.perf_counter() - started
+    return {
+        "base_layer_s": round(layer_s, 4),
+        "new_workspace": _timed(ws.new_workspace, args.workspaces),
+    }
+
+
+def _count(nodes: list[dict]) -> int:
+    return sum(1 + _count(n.get("children") or []) for n in nodes)
+
+
+def bench_list_tree(args) -> dict:
+    wid = ws.new_workspace()["id"]
+    width = 50
+    for d in range(0, args.tree_files, 500):
+        ws.write_files(wid, [(f"lib/gen/d{i // width:03d}/f{i:05d}.dart", f"// {i}\n")
+                             for i in range(d, min(d + 500, args.tree_files))], durability="none", label="setup")
+    forget = lambda: tree_index.forget(wid)  # noqa: E731
+    entries = _count(ws.list_tree(wid))
+    counter = iter(range(10 ** 9))
+    return {
+        "entries": entries,
+        "cold": _timed(lambda: ws.list_tree(wid), args.runs, before=forget),
+        "warm": _timed(lambda: ws.list_tree(wid), args.runs),
+        "list_dir": _timed(lambda: ws.list_dir(wid, "lib/gen/d000"), args.runs),
+        "after_write": _timed(lambda: ws.list_tree(wid), args.runs,
+                              before=lambda: ws.write_files(wid, [(f"lib/gen/touch{next(counter)}.dart", "//\n")],
+                                                            durability="none")),
+    }
+
+
+def bench_file_io(args) -> dict:
+    wid = ws.new_workspace()["id"]
+    content = ("// generated\n" + "final x = 1;\n" * (args.file_bytes // 13))[:args.file_bytes]
+    out = {"file_bytes": len(content)}
+    for durability, n in (("none", args.io_files), ("batch", args.io_files), ("per-file", min(args.io_files, 20))):
+        batch = [(f"lib/io/{durability}/f{i}.dart", content) for i in range(n)]
+        started = time.perf_counter()
+        ws.write_files(wid, batch, durability=durability)
+        elapsed = time.perf_counter() - started
+        out[f"write_{durability}"] = {
+            "files": n, "total_s": round(elapsed, 4),
+            "files_per_s": round(n / elapsed, 1), "mb_per_s": round(n * len(content) / elapsed / 1e6, 2),
+        }
+    out["write_one"] = _timed(lambda: ws.write_file(wid, "lib/io/one.dart", content, durability="none"), args.runs)
+    paths = [f"lib/io/none/f{i}.dart" for i in range(args.io_files)]
+    started = time.perf_counter()
+    ws.read_files(wid, paths)
+    elapsed = time.perf_counter() - started
+    out["read_files"] = {"files": len(paths), "total_s": round(elapsed, 4),
+                         "files_per_s": round(len(paths) / elapsed, 1),
+                         "mb_per_s": round(len(paths) * len(content) / elapsed / 1e6, 2)}
+    return out
+
+
+async def _build(wid: str) -> dict:
+    job = scheduler.submit(wid, ws.ensure_workspace(wid))
+    started = time.perf_counter()
+    first, lines = None, 0
+    async for _, line in scheduler.subscribe(job):
+        if first is None and not line.startswith("Queued"):
+            first = time.perf_counter() - started
+        lines += 1
+    return {"state": job.state, "lines": lines, "total_s": round(time.perf_counter() - started, 4),
+            "first_line_s": round(first or 0.0, 4)}
+
+
+async def _fanout(subscribers: int, lines: int) -> dict:
+    job = BuildJob("fanout", SCRATCH)
+    received = [0] * subscribers
+
+    async def consume(i: int) -> None:
+        async for _ in scheduler.subscribe(job):
+            received[i] += 1
+
+    tasks = [asyncio.create_task(consume(i)) for i in range(subscribers)]
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    for n in range(lines):
+        job.publish(f"[{n}] Compiling lib/screens/screen_{n % 40}.dart for the Web...")
+        if n % 64 == 0:
+            await asyncio.sleep(0)  # a real build yields between lines
+    job.state = "done"
+    job.publish("__EXIT__ 0")
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {"subscribers": subscribers, "lines": lines, "total_s": round(elapsed, 4),
+            "deliveries_per_s": round(sum(received) / elapsed, 1)}
+
+
+async def bench_build_logs(args, client: httpx.AsyncClient, state: dict) -> dict:
+    os.environ["FAKE_FLUTTER_DELAY"] = str(args.flutter_delay)
+    wid = ws.new_workspace()["id"]
+    ws.write_files(wid, [(f"lib/{f['file']}", f["content"]) for f in replies(args.screens)["files"]["styled"]])
+    out = {"flutter_delay_s": args.flutter_delay, "cold": await _build(wid)}
+    ws.write_file(wid, "lib/screen0_screen.dart", "// edited\n", durability="none")
+    out["incremental"] = await _build(wid)
+
+    started = time.perf_counter()
+    resp = await client.get(f"/api/workspaces/{wid}/build/logs")
+    out["sse_unchanged"] = {"status": resp.status_code, "events": resp.text.count("\n\n"),
+                            "total_s": round(time.perf_counter() - started, 4)}
+    out["fanout"] = await _fanout(args.subscribers, args.log_lines)
+    state["built"] = wid
+    return out
+
+
+async def bench_preview(args, client: httpx.AsyncClient, state: dict) -> dict:
+    wid = state.get("built")
+    if wid is None:
+        wid = ws.new_workspace()["id"]
+        await _build(wid)
+    web = ws.WORKSPACES / wid / "build" / "web"
+    page = sorted(p.relative_to(web).as_posix() for p in web.rglob("*")
+                  if p.is_file() and not p.name.startswith(".") and p.suffix not in (".gz", ".br"))
+    etags: dict[str, str] = {}
+    out = {"assets": len(page)}
+    for name, revisit in (("first_visit", False), ("repeat_visit", True)):
+        served, statuses, samples = 0, {}, []
+        for _ in range(args.page_loads):
+            started = time.perf_counter()
+            for rel in page:
+                headers = {"accept-encoding": "gzip, br"}
+                if revisit and rel in etags:
+                    headers["if-none-match"] = etags[rel]
+                resp = await client.get(f"/preview/{wid}/build/web/{rel}", headers=headers)
+                served += len(resp.content)
+                statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+                if "etag" in resp.headers:
+                    etags[rel] = resp.headers["etag"]
+            samples.append(time.perf_counter() - started)
+        elapsed = sum(samples)
+        out[name] = {
+            "page_load": _timings(samples),
+            "requests_per_s": round(args.page_loads * len(page) / elapsed, 1),
+            "bytes_per_page_load": served // args.page_loads,
+            "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        }
+    return out
+
+
+# -------------------------------------------------------------------------
+# Running and comparing
+# -------------------------------------------------------------------------
+def _meta(args) -> dict:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND,
+                             capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        rev = None
+    return {"created": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "git": rev,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "args": {k: v for k, v in vars(args).items()
+                                             if k not in ("out", "baseline")}}
+
+
+async def run(args) -> dict:
+    import server
+
+    _isolate()
+    wanted = [c for c in CASES if c in args.only] if args.only else list(CASES)
+    results, state = {}, {}
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for case in wanted:
+            started = time.perf_counter()
+            if case == "pipeline":
+                results[case] = await bench_pipeline(args)
+            elif case in ("build_logs", "preview"):
+                results[case] = await globals()[f"bench_{case}"](args, client, state)
+            else:
+                results[case] = globals()[f"bench_{case}"](args)
+            print(f"{case}: {time.perf_counter() - started:.2f}s", file=sys.stderr)
+    return {"meta": _meta(args), "results": results}
+
+
+def _flatten(value, prefix: str = "") -> dict[str, float]:
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            out.update(_flatten(v, f"{prefix}.{k}" if prefix else k))
+        return out
+    return {prefix: value} if isinstance(value, (int, float)) and not isinstance(value, bool) else {}
+
+
+INPUTS = ("overhead_s", "tokens_per_s", "flutter_delay_s")
+NOISY = ("p95_ms", "min_ms")  # reported, but only medians and totals are compared
+
+
+def _direction(key: str) -> int:
+    """+1 if higher is better, -1 if lower is better, 0 if not a timing."""
+    parts = key.split(".")
+    if any(p in INPUTS for p in parts) or parts[-1] in NOISY:
+        return 0
+    if parts[-1].endswith("_per_s"):
+        return 1
+    if any(p.endswith(("_ms", "_s")) for p in parts):
+        return -1
+    return 0
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> dict:
+    old, new = _flatten(baseline.get("results", {})), _flatten(current["results"])
+    regressions, improvements = [], []
+    for key, now in new.items():
+        sign, was = _direction(key), old.get(key)
+        if not sign or not was or not now:
+            continue
+        change = (now - was) / was
+        entry = {"metric": key, "baseline": was, "current": now, "change_pct": round(change * 100, 1)}
+        if -sign * change > tolerance:
+            regressions.append(entry)
+        elif sign * change > tolerance:
+            improvements.append(entry)
+    return {"baseline": baseline.get("meta", {}).get("git"), "tolerance": tolerance,
+            "regressions": regressions, "improvements": improvements}
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--only", type=lambda s: s.split(","), help=f"comma-separated subset of {','.join(CASES)}")
+    ap.add_argument("--out", type=Path, help="also write the JSON result here")
+    ap.add_argument("--baseline", type=Path, help="earlier result to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="relative change reported (default 0.2)")
+    ap.add_argument("--runs", type=int, default=20, help="samples per micro-benchmark")
+    ap.add_argument("--screens", type=int, default=6)
+    ap.add_argument("--pipeline-runs", type=int, default=3)
+    ap.add_argument("--llm-overhead", type=float, default=0.05, help="fake model: fixed seconds per call")
+    ap.add_argument("--llm-tps", type=float, default=2000.0, help="fake model: output tokens/s (0 = instant)")
+    ap.add_argument("--workspaces", type=int, default=50)
+    ap.add_argument("--tree-files", type=int, default=5000)
+    ap.add_argument("--io-files", type=int, default=200)
+    ap.add_argument("--file-bytes", type=int, default=4096)
+    ap.add_argument("--flutter-delay", type=float, default=0.0, help="fake flutter: seconds per step")
+    ap.add_argument("--subscribers", type=int, default=50)
+    ap.add_argument("--log-lines", type=int, default=5000)
+    ap.add_argument("--page-loads", type=int, default=20)
+    args = ap.parse_args()
+    try:
+        result = asyncio.run(run(args))
+        if args.baseline:
+            result["comparison"] = compare(json.loads(args.baseline.read_text()), result, args.tolerance)
+    finally:
+        shutil.rmtree(SCRATCH, ignore_errors=True)
+    text = json.dumps(result, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n")
+    print(text, file=RESULT_OUT, flush=True)
+    sys.exit(1 if result.get("comparison", {}).get("regressions") else 0)
@@ -0,0 +1,223 @@
+"""
+Incremental Flutter web builds.
+-------------------------------
+- `pub get` is skipped while pubspec.yaml / pubspec.lock and the workspace's
+  pub cache mode are unchanged
+- the whole build is skipped while lib/, web/, assets/ and the pubspec
+  hash to the same fingerprint as the last successful build; the
+  fingerprint comes from the workspace's snapshot manifest, so only files
+  whose size or mtime changed are rehashed, and the log names the files
+  that changed since the last successful build
+- output goes to a fresh build/web-<id> directory and build/web is an
+  atomically swapped symlink, so previews keep serving the previous build
+  until the new one is complete
+
+`run_build` yields plain log lines; the last one is always `__EXIT__ <code>`.
+"""
+from __future__ import annotations
+import asyncio, hashlib, json, os, shutil, time, uuid
+from pathlib import Path
+from typing import AsyncIterator
+import workspace as ws
+import metrics
+import preview
+import pub_cache
+import snapshots
+
+STATE_FILE = Path("build") / ".build-state.json"
+DEP_FILES = ("pubspec.yaml", "pubspec.lock")
+SOURCE_DIRS = ("lib", "web", "assets")
+
+
+# -------------------------------------------------------------------------
+# Fingerprints
+# -------------------------------------------------------------------------
+def _hash_paths(base: Path, rels) -> str:
+    h = hashlib.sha256()
+    for rel in rels:
+        p = base / rel
+        if p.is_dir():
+            files = sorted(f for f in p.rglob("*") if f.is_file())
+        elif p.is_file():
+            files = [p]
+        else:
+            continue
+        for f in files:
+            h.update(f.relative_to(base).as_posix().encode())
+            h.update(b"\0")
+            h.update(f.read_bytes())
+            h.update(b"\0")
+    return h.hexdigest()
+
+
+def deps_fingerprint(base: Path) -> str:
+    # The cache mode is part of it: package_config.json points into the cache
+    # that resolved it, so switching caches has to re-run pub get
+    return f"{pub_cache.get_mode(base)}:{_hash_paths(base, DEP_FILES)}"
+
+
+def _is_source(rel: str) -> bool:
+    return rel in DEP_FILES or rel.split("/", 1)[0] in SOURCE_DIRS
+
+
+def source_fingerprint(base: Path) -> str:
+    if not snapshots.SNAPSHOTS_ENABLED:
+        return _hash_paths(base, SOURCE_DIRS + DEP_FILES)
+    store = snapshots.store(base)
+    store.commit("build")
+    h = hashlib.sha256()
+    for rel, blob in sorted(store.tree(store.head_tree()).items()):
+        if _is_source(rel):
+            h.update(f"{rel}\0{blob}\n".encode())
+    return h.hexdigest()
+
+
+def changed_since_build(base: Path, state: dict | None = None) -> dict[str, list[str]] | None:
+    """Source files added/modified/deleted since the last successful build (None if unknown)."""
+    state = load_state(base) if state is None else state
+    changes = snapshots.store(base).changed_since(state.get("tree"))
+    if changes is None:
+        return None
+    return {k: [rel for rel in v if _is_source(rel)] for k, v in changes.items()}
+
+
+def load_state(base: Path) -> dict:
+    try:
+        return json.loads((base / STATE_FILE).read_text())
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(base: Path, state: dict) -> None:
+    f = base / STATE_FILE
+    f.parent.mkdir(parents=True, exist_ok=True)
+    tmp = f.with_name(f.name + ".tmp")
+    tmp.write_text(json.dumps(state))
+    os.replace(tmp, f)
+
+
+# -------------------------------------------------------------------------
+# Output swapping
+# -------------------------------------------------------------------------
+def _publish(base: Path, out_dir: Path) -> None:
+    """Point build/web at `out_dir` with a single atomic rename."""
+    build = base / "build"
+    web = build / "web"
+    if web.is_dir() and not web.is_symlink():
+        # Legacy in-place output: move it aside so the symlink can take its name
+        web.rename(build / f"web-legacy-{uuid.uuid4().hex[:8]}")
+
+    link = build / f".web-link-{uuid.uuid4().hex[:8]}"
+    link.symlink_to(out_dir.name, target_is_directory=True)
+    os.replace(link, web)
+
+    for old in build.glob("web-*"):
+        if old != out_dir:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def current_build_id(base: Path) -> str | None:
+    return load_state(base).get("build_id")
+
+
+# -------------------------------------------------------------------------
+# Process streaming
+# -------------------------------------------------------------------------
+async def stream_process(cmd, cwd: Path, result: list[int]) -> AsyncIterator[str]:
+    """Yield output lines of `cmd`; its return code is appended to `result`."""
+    proc = await asyncio.create_subprocess_exec(
+        *cmd, cwd=str(cwd),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env=ws.flutter_env(cwd),
+    )
+    assert proc.stdout
+    try:
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            yield line.decode(errors="ignore").rstrip()
+    finally:
+        if proc.returncode is None and not proc.stdout.at_eof():
+            try:
+                proc.kill()  # consumer went away mid-build
+            except ProcessLookupError:
+                pass
+        result.append(await proc.wait())
+
+
+# -------------------------------------------------------------------------
+# Pipeline
+# -------------------------------------------------------------------------
+async def run_build(base: Path) -> AsyncIterator[str]:
+    state = await asyncio.to_thread(load_state, base)
+
+    deps = await asyncio.to_thread(deps_fingerprint, base)
+    if state.get("deps") == deps and (base / ".dart_tool" / "package_config.json").exists():
+        yield "Skipping flutter pub get (dependencies unchanged)"
+    else:
+        yield "Running flutter pub get..."
+        rc: list[int] = []
+        async with pub_cache.alocked(pub_cache.cache_dir_for(base)) as cache:
+            if pub_cache.OFFLINE:
+                seeded = await asyncio.to_thread(pub_cache.seed_from_mirror, cache)
+                if seeded:
+                    yield f"Linked {seeded} package(s) from local mirror"
+            before = await asyncio.to_thread(pub_cache.packages, cache)
+            started = time.perf_counter()
+            async for line in stream_process(pub_cache.pub_get_cmd(), base, rc):
+                yield line
+            metrics.flutter_seconds.observe(time.perf_counter() - started, command="pub_get",
+                                            outcome="ok" if rc and rc[0] == 0 else "error")
+            pub_cache.record_pub_get(before, await asyncio.to_thread(pub_cache.packages, cache))
+        if rc[0] != 0:
+            metrics.builds.inc(result="failed")
+            yield f"__EXIT__ {rc[0]}"
+            return
+        # pub get may have rewritten pubspec.lock
+        state["deps"] = await asyncio.to_thread(deps_fingerprint, base)
+        await asyncio.to_thread(save_state, base, state)
+
+    source = await asyncio.to_thread(source_fingerprint, base)
+    if state.get("source") == source and (base / "build" / "web" / "index.html").exists():
+        metrics.builds.inc(result="skipped")
+        yield "Skipping flutter build web (sources unchanged since last build)"
+        yield "__EXIT__ 0"
+        return
+    tree = await asyncio.to_thread(snapshots.store(base).head_tree) if snapshots.SNAPSHOTS_ENABLED else None
+    changes = await asyncio.to_thread(changed_since_build, base, state) if tree else None
+    if changes is not None:
+        paths = changes["added"] + changes["modified"] + changes["deleted"]
+        shown = ", ".join(paths[:10]) + (f" (+{len(paths) - 10} more)" if len(paths) > 10 else "")
+        yield f"{len(paths)} file(s) changed since last build: {shown}"
+
+    build_id = uuid.uuid4().hex[:12]
+    out_dir = base / "build" / f"web-{build_id}"
+    yield "Building web..."
+    cmd = [*pub_cache.FLUTTER_BIN, "build", "web", "--release", "--pwa-strategy=none", "--output", str(out_dir)]
+    rc = []
+    started = time.perf_counter()
+    try:
+        async for line in stream_process(cmd, base, rc):
+            yield line
+    finally:
+        if not rc or rc[0] != 0:
+            shutil.rmtree(out_dir, ignore_errors=True)
+    metrics.flutter_seconds.observe(time.perf_counter() - started, command="build_web",
+                                    outcome="ok" if rc[0] == 0 else "error")
+    if rc[0] != 0:
+        metrics.builds.inc(result="failed")
+        yield f"__EXIT__ {rc[0]}"
+        return
+
+    manifest = await asyncio.to_thread(preview.precompress, out_dir)
+    compressed = sum(1 for e in manifest.values() if "gzip" in e or "br" in e)
+    yield f"Precompressed {compressed} asset(s) for preview"
+
+    await asyncio.to_thread(_publish, base, out_dir)
+    state.update(source=source, build_id=build_id, tree=tree)
+    await asyncio.to_thread(save_state, base, state)
+    metrics.builds.inc(result="built")
+    yield "Build finished. Open preview URL."
+    yield "__EXIT__ 0"
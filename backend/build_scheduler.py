@@ -0,0 +1,253 @@
+"""
+Bounded build scheduler.
+------------------------
+At most BUILD_WORKERS builds run at once (default: CPU count). Requests
+are queued FIFO with one entry per workspace: a second request for a
+workspace that is already queued joins the existing job instead of
+starting another `flutter` process, which also keeps the queue fair
+across workspaces. A request while the workspace is building queues one
+follow-up build, since the running one may predate the latest edits; it
+starts once the running build ends (and is skipped by `run_build` if the
+sources didn't change meanwhile). A workspace never builds twice at once.
+
+Each job writes sequence-numbered lines into a ring buffer capped at
+BUILD_LOG_MAX_BYTES, so any number of subscribers fan out from one process
+and a reconnecting client resumes after the last sequence it saw. Finished
+jobs stay readable (the last BUILD_HISTORY of them). A job whose subscribers
+have all been gone for BUILD_CANCEL_GRACE seconds is cancelled, which kills
+its subprocess.
+"""
+from __future__ import annotations
+import asyncio, os, time, uuid
+from collections import OrderedDict, deque
+from contextlib import ExitStack
+from pathlib import Path
+from typing import AsyncIterator
+import build_manager as builds
+import workspace_lifecycle
+
+BUILD_WORKERS = int(os.getenv("BUILD_WORKERS") or os.cpu_count() or 2)
+BUILD_LOG_MAX_BYTES = int(os.getenv("BUILD_LOG_MAX_BYTES", str(1024 * 1024)))
+BUILD_HISTORY = int(os.getenv("BUILD_HISTORY", "50"))
+BUILD_CANCEL_GRACE = float(os.getenv("BUILD_CANCEL_GRACE", "10"))
+
+
+class BuildJob:
+    def __init__(self, wid: str, base: Path):
+        self.id = uuid.uuid4().hex[:12]
+        self.wid = wid
+        self.base = base
+        self.state = "queued"  # queued → running → done | failed | cancelled
+        self.exit_code: int | None = None
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.requests = 1
+        self.task: asyncio.Task | None = None
+        self.subscribers = 0
+        self._cancel_timer: asyncio.TimerHandle | None = None
+
+        self.log: deque[tuple[int, str]] = deque()
+        self.log_bytes = 0
+        self.next_seq = 1
+        self._tick = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def publish(self, line: str) -> None:
+        self.log.append((self.next_seq, line))
+        self.next_seq += 1
+        self.log_bytes += len(line)
+        while self.log_bytes > BUILD_LOG_MAX_BYTES and len(self.log) > 1:
+            self.log_bytes -= len(self.log.popleft()[1])
+        # Wake everyone waiting on the old event; later waiters get a fresh one
+        self._tick.set()
+        self._tick = asyncio.Event()
+
+    def lines_after(self, seq: int) -> list[tuple[int, str]]:
+        if not self.log or self.log[-1][0] <= seq:
+            return []
+        first = self.log[0][0]
+        start = max(0, seq + 1 - first)
+        out = [self.log[i] for i in range(start, len(self.log))]
+        if seq + 1 < first:
+            out.insert(0, (first - 1, f"... {first - 1 - seq} earlier log lines dropped"))
+        return out
+
+    def info(self) -> dict:
+        return {
+            "id": self.id, "workspace": self.wid, "state": self.state,
+            "exit_code": self.exit_code, "requests": self.requests,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "last_seq": self.next_seq - 1, "subscribers": self.subscribers,
+        }
+
+
+class BuildScheduler:
+    def __init__(self, workers: int = BUILD_WORKERS):
+        self.workers = max(1, workers)
+        self._queue: deque[BuildJob] = deque()
+        self._queued: dict[str, BuildJob] = {}   # wid → job waiting in _queue
+        self._running: dict[str, BuildJob] = {}  # wid → job building
+        self._history: OrderedDict[str, BuildJob] = OrderedDict()
+        self._has_work: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+        self.coalesced = 0
+        self.cancelled = 0
+
+    def _ensure_workers(self) -> None:
+        if self._tasks:
+            return
+        self._has_work = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    # ------------------------------------------------------------------
+    # Submission
+    # ------------------------------------------------------------------
+    def submit(self, wid: str, base: Path) -> BuildJob:
+        self._ensure_workers()
+        job = self._queued.get(wid)
+        if job is not None:
+            job.requests += 1
+            self.coalesced += 1
+            return job
+        job = BuildJob(wid, base)
+        self._queued[wid] = job
+        self._queue.append(job)
+        if wid in self._running:
+            job.publish("Queued to follow the running build, which started before this request")
+        else:
+            job.publish(f"Queued for build (position {len(self._queue)})")
+        self._has_work.set()
+        return job
+
+    def get(self, job_id: str) -> BuildJob | None:
+        for job in (*self._running.values(), *self._queued.values()):
+            if job.id == job_id:
+                return job
+        return self._history.get(job_id)
+
+    def jobs_for(self, wid: str) -> list[BuildJob]:
+        jobs = [j for j in self._history.values() if j.wid == wid]
+        jobs += [j for j in (self._running.get(wid), self._queued.get(wid)) if j is not None]
+        return jobs
+
+    def position(self, job: BuildJob) -> int | None:
+        try:
+            return self._queue.index(job) + 1
+        except ValueError:
+            return None
+
+    def _announce_positions(self) -> None:
+        for i, job in enumerate(self._queue, start=1):
+            job.publish(f"Queued for build (position {i})")
+
+    async def subscribe(self, job: BuildJob, after: int = 0) -> AsyncIterator[tuple[int, str]]:
+        """Yield `(seq, line)` for lines after `after` until the job exits."""
+        job.subscribers += 1
+        if job._cancel_timer:
+            job._cancel_timer.cancel()
+            job._cancel_timer = None
+        try:
+            while True:
+                tick = job._tick
+                for seq, line in job.lines_after(after):
+                    after = seq
+                    yield seq, line
+                # Lines may have landed while the consumer was busy; drain them first
+                if job.done and after >= job.next_seq - 1:
+                    return
+                await tick.wait()
+        finally:
+            job.subscribers -= 1
+            if not job.subscribers and not job.done:
+                job._cancel_timer = asyncio.get_running_loop().call_later(
+                    BUILD_CANCEL_GRACE, self._cancel_if_abandoned, job)
+
+    def _cancel_if_abandoned(self, job: BuildJob) -> None:
+        job._cancel_timer = None
+        if not job.subscribers:
+            self.cancel(job)
+
+    def cancel(self, job: BuildJob) -> None:
+        if job.done:
+            return
+        self.cancelled += 1
+        if job.state == "queued":
+            self._queue.remove(job)
+            del self._queued[job.wid]
+            self._finish(job, "cancelled", -1)
+            job.publish("__EXIT__ -1")
+            self._announce_positions()
+        elif job.task:
+            job.task.cancel()
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+    def _finish(self, job: BuildJob, state: str, code: int) -> None:
+        job.state, job.exit_code, job.finished = state, code, time.time()
+        if self._running.get(job.wid) is job:
+            del self._running[job.wid]
+            self._has_work.set()  # a follow-up build may be waiting for this one
+        self._history[job.id] = job
+        while len(self._history) > BUILD_HISTORY:
+            self._history.popitem(last=False)
+
+    async def _run(self, job: BuildJob) -> None:
+        try:
+            with ExitStack() as held:
+                # The workspace can't be archived from under the build
+                await asyncio.to_thread(held.enter_context, workspace_lifecycle.in_use(job.wid))
+                async for line in builds.run_build(job.base):
+                    if line.startswith("__EXIT__"):
+                        code = int(line.split()[1])
+                        # Mark finished before the exit line so woken subscribers stop
+                        self._finish(job, "done" if code == 0 else "failed", code)
+                    job.publish(line)
+        except asyncio.CancelledError:
+            job.publish("Build cancelled")
+            job.publish("__EXIT__ -1")
+            self._finish(job, "cancelled", -1)
+        except Exception as e:
+            job.publish(f"Build error: {e}")
+            job.publish("__EXIT__ -1")
+            self._finish(job, "failed", -1)
+
+    def _next(self) -> BuildJob | None:
+        """Take the oldest queued job whose workspace isn't building."""
+        for job in self._queue:
+            if job.wid not in self._running:
+                self._queue.remove(job)
+                del self._queued[job.wid]
+                self._running[job.wid] = job
+                return job
+        return None
+
+    async def _worker(self) -> None:
+        while True:
+            self._has_work.clear()
+            job = self._next()
+            if job is None:
+                await self._has_work.wait()
+                continue
+            self._announce_positions()
+            job.state, job.started = "running", time.time()
+            job.task = asyncio.create_task(self._run(job))
+            await asyncio.wait({job.task})
+
+    def stats(self) -> dict:
+        running = list(self._running.values())
+        return {
+            "workers": self.workers,
+            "queued": len(self._queue),
+            "running": len(running),
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "jobs": [j.info() for j in (*running, *self._queue)],
+        }
+
+
+scheduler = BuildScheduler()
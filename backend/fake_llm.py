@@ -0,0 +1,124 @@
+"""
+Offline stand-in for the Gemini models.
+---------------------------------------
+With LLM_FAKE=true, `gemini_config.get_runnable_llm` returns a
+`FakeDesignLLM` for every role: no API key, no network, deterministic
+output. It recognises each agent by its prompt and answers the way Gemini
+tends to (a line of prose, a ```json fence, pretty-printed JSON), so the
+parsing, fan-out and build paths all get exercised.
+
+- FAKE_LLM_SCREENS   screens in the fake UX plan (default 4)
+- FAKE_LLM_LATENCY   "overhead_s,tokens_per_s" decoder model (default "0,0" = instant)
+"""
+from __future__ import annotations
+import asyncio, json, os, re
+from typing import Any
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+
+from llm_pool import estimate_tokens
+
+FAKE_LLM_SCREENS = int(os.getenv("FAKE_LLM_SCREENS", "4"))
+FAKE_LLM_LATENCY = tuple(float(x) for x in os.getenv("FAKE_LLM_LATENCY", "0,0").split(","))
+
+STAGES = {  # prompt marker → stage
+    "Creative Director": "vision",
+    "UX Architect": "ux",
+    "UI designer": "ui",
+    "Design Critic": "critique",
+    "Flutter developer": "code",
+    "code stylist": "final_code",
+}
+
+
+def _fenced(value) -> str:
+    return f"Here is the result you asked for:\n\n```json\n{json.dumps(value, indent=4)}\n```\n"
+
+
+def replies(screens: int) -> dict:
+    names = [f"Screen{i}" for i in range(screens)]
+
+    def files(kind: str):
+        return [{"file": f"{n.lower()}_screen.dart",
+                 "content": f"import 'package:flutter/material.dart';\n\nclass {n} extends StatelessWidget {{\n"
+                            f"  const {n}({{super.key}});\n\n  @override\n  Widget build(BuildContext context) {{\n"
+                            f"    return Scaffold(appBar: AppBar(title: const Text('{n} {kind}')),\n"
+                            f"      body: ListView(children: const [Card(child: ListTile(title: Text('{n}')))]));\n  }}\n}}\n"}
+                for n in names]
+
+    return {
+        "files": {kind: files(kind) for kind in ("skeleton", "styled")},
+        "vision": _fenced({"theme_mood": "calm, focused", "color_palette": ["#0B6E4F", "#F2F5EA", "#2C363F"],
+                           "design_style": "Material 3, rounded cards", "tone": "friendly",
+                           "inspiration_references": ["Khan Academy", "Duolingo"]}),
+        "ux": _fenced({"screens": names, "navigation": "bottom navigation bar",
+                       "components": {n: ["AppBar", "ListView", "Card", "FAB"] for n in names},
+                       "accessibility": ["48dp touch targets", "semantic labels", "4.5:1 contrast"]}),
+        "ui": _fenced(files("layout")),
+        "critique": _fenced({"issues": ["Inconsistent padding on Screen0"], "suggestions": ["Use 16dp gutters"]}),
+        "code": _fenced(files("skeleton")),
+        "final_code": _fenced(files("styled")),
+        "other": "{}",
+    }
+
+
+def _prompt_text(value: Any) -> str:
+    if hasattr(value, "to_messages"):
+        value = value.to_messages()
+    if isinstance(value, (list, tuple)):
+        return "".join(str(getattr(m, "content", m)) for m in value)
+    return str(getattr(value, "content", value))
+
+
+class FakeDesignLLM(Runnable):
+    """Answers by agent; per-file code/style prompts get just that file.
+
+    With `latency`, each reply takes `latency[0]` seconds plus one second
+    per `latency[1]` output tokens, like a real decoder. Prompt tokens per
+    stage are added up in `sent`.
+    """
+
+    def __init__(self, answers: dict | None = None, sent: dict | None = None,
+                 latency: tuple[float, float] | None = None):
+        self.answers = answers or replies(FAKE_LLM_SCREENS)
+        self.sent = sent if sent is not None else {}
+        self.latency = latency
+
+    def _answer(self, text: str) -> str:
+        stage = next((s for marker, s in STAGES.items() if marker in text), "other")
+        self.sent[stage] = self.sent.get(stage, 0) + estimate_tokens(text)
+        single = re.search(r'\{"file": ?"([^"]+)"', text)
+        if stage in ("code", "final_code") and single and "[{" not in text.split("Return only")[-1]:
+            kind = "skeleton" if stage == "code" else "styled"
+            name = single.group(1)
+            match = [f for f in self.answers["files"][kind] if f["file"] == name]
+            return _fenced({"file": name, "content": (match or self.answers["files"][kind])[0]["content"]})
+        return self.answers[stage]
+
+    def _delay(self, answer: str) -> float:
+        if not self.latency or not self.latency[1]:
+            return self.latency[0] if self.latency else 0.0
+        return self.latency[0] + estimate_tokens(answer) / self.latency[1]
+
+    def invoke(self, input, config=None, **kwargs):
+        return AIMessage(content=self._answer(_prompt_text(input)))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        answer = self._answer(_prompt_text(input))
+        if delay := self._delay(answer):
+            await asyncio.sleep(delay)
+        return AIMessage(content=answer)
+
+    async def astream(self, input, config=None, **kwargs):
+        answer = self._answer(_prompt_text(input))
+        chunks = [answer[i:i + 64] for i in range(0, len(answer), 64)] or [""]
+        delay = self._delay(answer) / len(chunks)
+        for chunk in chunks:
+            if delay:
+                await asyncio.sleep(delay)
+            yield AIMessageChunk(content=chunk)
+
+
+def from_env() -> FakeDesignLLM:
+    return FakeDesignLLM(latency=FAKE_LLM_LATENCY if any(FAKE_LLM_LATENCY) else None)
@@ -4,10 +4,19 @@ Gemini + LangChain config with built-in LangSmith tracing.
 - Auto-selects best Gemini models for each agent role
 - Builds LangChain-native runnables
 - Enables LangSmith tracing for debugging and visualization
+
+Importing this module is cheap and offline: the model list is resolved on
+first use (and cached on disk for GEMINI_MODELS_TTL seconds), and runnables
+are built on first request and memoized per configuration.
 """
 
+import json
 import os
 import threading
+import time
+from collections.abc import Mapping
+from functools import lru_cache
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,11 +25,18 @@ load_dotenv()
 # 🧠 Environment Validation
 # -------------------------------------------------------------------------
 API_KEY = os.getenv("GEMINI_API_KEY")
-if not API_KEY:
-    raise EnvironmentError("❌ Missing GEMINI_API_KEY in environment (.env)")
+# Offline stand-in model for tests (see fake_llm.py)
+LLM_FAKE = os.getenv("LLM_FAKE", "false").lower() == "true"
+
+
+def _require_api_key() -> str:
+    if not API_KEY:
+        raise EnvironmentError("❌ Missing GEMINI_API_KEY in environment (.env)")
+    return API_KEY
+
 
 # LangSmith optional tracing (free tier available)
-LANGCHAIN_TRACING = os.getenv("LANGCHAIN_TRACING_V2", "true").lower() == "true"
+LANGCHAIN_TRACING = os.getenv("LANGCHAIN_TRACING_V2", "false" if LLM_FAKE else "true").lower() == "true"
 LANGCHAIN_API_KEY = os.getenv("LANGCHAIN_API_KEY")
 LANGCHAIN_PROJECT = os.getenv("LANGCHAIN_PROJECT", "GeminiDesignAI")
 
@@ -36,16 +52,24 @@ else:
 
 
 # -------------------------------------------------------------------------
-# 🔮 Gemini Configuration
+# 🔮 Gemini Model Discovery (lazy, cached on disk)
 # -------------------------------------------------------------------------
-import google.generativeai as genai
-from langchain_google_genai import ChatGoogleGenerativeAI
+MODELS_CACHE = Path(os.getenv(
+    "GEMINI_MODELS_CACHE", Path(__file__).parent.resolve() / ".cache" / "gemini_models.json"))
+MODELS_TTL = float(os.getenv("GEMINI_MODELS_TTL", str(24 * 3600)))
+# After a failed listing, don't try again for this long
+MODELS_RETRY_AFTER = 300.0
 
-genai.configure(api_key=API_KEY)
+_discovery_lock = threading.Lock()
+_available: list[str] | None = None
+_available_at = 0.0
 
 
 def _safe_list_models(timeout: float = 3.0):
     """Fetch model list safely without blocking startup."""
+    import google.generativeai as genai
+
+    genai.configure(api_key=_require_api_key())
     result, err = [], [None]
 
     def _fetch():
@@ -62,13 +86,48 @@ def _safe_list_models(timeout: float = 3.0):
     return result
 
 
-_all_models = _safe_list_models()
-_available = [m.name for m in _all_models] if _all_models else []
+def _load_models_cache() -> list[str] | None:
+    try:
+        data = json.loads(MODELS_CACHE.read_text())
+    except (FileNotFoundError, ValueError):
+        return None
+    if time.time() - data.get("fetched_at", 0) > MODELS_TTL:
+        return None
+    return data.get("models")
+
+
+def _save_models_cache(models: list[str]) -> None:
+    try:
+        MODELS_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp = MODELS_CACHE.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"fetched_at": time.time(), "models": models}))
+        os.replace(tmp, MODELS_CACHE)
+    except OSError:
+        pass
+
+
+def available_models() -> list[str]:
+    """Model names the API key can use; empty if discovery isn't possible."""
+    global _available, _available_at
+    with _discovery_lock:
+        now = time.monotonic()
+        if _available is not None and (_available or now - _available_at < MODELS_RETRY_AFTER):
+            return _available
+        cached = _load_models_cache()
+        if cached is not None:
+            _available, _available_at = cached, now
+            return _available
+        names = [m.name for m in _safe_list_models()] if API_KEY and not LLM_FAKE else []
+        if names:
+            _save_models_cache(names)
+        _available, _available_at = names, now
+        return _available
 
 
 def _pick(candidates):
+    available = available_models()
     for name in candidates:
-        if name in _available:
+        if name in available:
             return name
     return candidates[0]
 
@@ -76,29 +135,90 @@ def _pick(candidates):
 # -------------------------------------------------------------------------
 # 🎯 Model Selection per Role
 # -------------------------------------------------------------------------
-MODELS = {
-    "planner": _pick([
+MODEL_CANDIDATES = {
+    "planner": [
         "models/gemini-2.5-pro",
         "models/gemini-2.5-pro-preview-06-05",
         "models/gemini-pro-latest",
-    ]),
-    "codewriter": _pick([
+    ],
+    "codewriter": [
         "models/gemini-2.5-flash",
         "models/gemini-flash-latest",
-    ]),
-    "reviewer": _pick([
+    ],
+    "reviewer": [
         "models/gemini-2.5-pro",
         "models/gemini-pro-latest",
-    ]),
-    "stylist": _pick([
+    ],
+    "stylist": [
         "models/gemini-2.5-flash-lite",
         "models/gemini-flash-lite-latest",
-    ]),
-    "coordinator": _pick([
+    ],
+    "coordinator": [
         "models/gemini-pro-latest",
         "models/gemini-2.5-pro",
-    ]),
+    ],
+}
+
+
+# Per-model quotas for the shared client pool (llm_pool). Keys are matched
+# as prefixes of the resolved model name; the first match wins.
+MODEL_LIMITS = {
+    "models/gemini-2.5-pro": {"rpm": 150, "tpm": 2_000_000, "concurrency": 8},
+    "models/gemini-pro": {"rpm": 150, "tpm": 2_000_000, "concurrency": 8},
+    "models/gemini-2.5-flash-lite": {"rpm": 4_000, "tpm": 4_000_000, "concurrency": 32},
+    "models/gemini-flash-lite": {"rpm": 4_000, "tpm": 4_000_000, "concurrency": 32},
+    "models/gemini-2.5-flash": {"rpm": 1_000, "tpm": 1_000_000, "concurrency": 16},
+    "models/gemini-flash": {"rpm": 1_000, "tpm": 1_000_000, "concurrency": 16},
+}
+DEFAULT_LIMITS = {"rpm": 60, "tpm": 250_000, "concurrency": 4}
+
+
+def get_limits_for(model_id: str) -> dict:
+    for prefix, limits in MODEL_LIMITS.items():
+        if model_id.startswith(prefix):
+            return dict(limits)
+    return dict(DEFAULT_LIMITS)
+
+
+# Input context windows (tokens), matched the same way
+MODEL_CONTEXT_TOKENS = {
+    "models/gemini-2.5": 1_048_576,
+    "models/gemini-pro-latest": 1_048_576,
+    "models/gemini-flash": 1_048_576,
 }
+DEFAULT_CONTEXT_TOKENS = 32_768
+
+
+def get_context_window(model_id: str) -> int:
+    for prefix, tokens in MODEL_CONTEXT_TOKENS.items():
+        if model_id.startswith(prefix):
+            return tokens
+    return DEFAULT_CONTEXT_TOKENS
+
+
+class _ModelTable(Mapping):
+    """role → model name, resolved against the model list on first access."""
+
+    def __init__(self, candidates: dict):
+        self._candidates = candidates
+        self._resolved: dict[str, str] | None = None
+
+    def _table(self) -> dict[str, str]:
+        if self._resolved is None:
+            self._resolved = {role: _pick(c) for role, c in self._candidates.items()}
+        return self._resolved
+
+    def __getitem__(self, role):
+        return self._table()[role]
+
+    def __iter__(self):
+        return iter(self._candidates)
+
+    def __len__(self):
+        return len(self._candidates)
+
+
+MODELS = _ModelTable(MODEL_CANDIDATES)
 
 
 # -------------------------------------------------------------------------
@@ -109,6 +229,7 @@ def get_model_for(role: str) -> str:
     return MODELS.get(role, MODELS["coordinator"])
 
 
+@lru_cache(maxsize=None)
 def get_runnable_llm(
     role: str,
     *,
@@ -117,12 +238,22 @@ def get_runnable_llm(
     retry: int = 1,
     max_output_tokens: int | None = None,
 ):
-    """Builds and returns a ChatGoogleGenerativeAI runnable."""
+    """Builds and returns a ChatGoogleGenerativeAI runnable (memoized per arguments).
+
+    The underlying client comes from the process-wide pool, which applies
+    the model's rate limits and concurrency cap to every call.
+    """
+    from llm_cache import LLM_CACHE_ENABLED, CachedLLM
+    from llm_pool import MeteredLLM, pool
+
     model_id = get_model_for(role)
+    if LLM_FAKE:
+        import fake_llm
+        return MeteredLLM(fake_llm.from_env(), role, model_id)
 
-    llm = ChatGoogleGenerativeAI(
-        model=model_id,
-        api_key=API_KEY,
+    llm = pool.client(
+        model_id,
+        api_key=_require_api_key(),
         temperature=temperature,
         streaming=streaming,
     )
@@ -140,20 +271,39 @@ def get_runnable_llm(
     except Exception:
         pass
 
-    return llm
+    # Identical (model, prompt, params) calls are answered from the response cache
+    if LLM_CACHE_ENABLED:
+        llm = CachedLLM(llm, model_id, {
+            "temperature": temperature,
+            "max_output_tokens": max_output_tokens,
+        })
+
+    return MeteredLLM(llm, role, model_id)
 
 
 # -------------------------------------------------------------------------
-# 🚀 Prebuilt Runnables for All Roles
+# 🚀 Prebuilt Runnables for All Roles (built on first access)
 # -------------------------------------------------------------------------
-prebuilt_runnables = {}
-for role in MODELS.keys():
-    try:
-        prebuilt_runnables[role] = get_runnable_llm(
-            role, temperature=0.5, streaming=False, retry=1
-        )
-    except Exception:
-        prebuilt_runnables[role] = None
+class _PrebuiltRunnables(Mapping):
+    def __getitem__(self, role):
+        if role not in MODEL_CANDIDATES:
+            raise KeyError(role)
+        return get_runnable_llm(role, temperature=0.5, streaming=True, retry=1)
+
+    def get(self, role, default=None):
+        try:
+            return self[role]
+        except Exception:
+            return default
+
+    def __iter__(self):
+        return iter(MODEL_CANDIDATES)
+
+    def __len__(self):
+        return len(MODEL_CANDIDATES)
+
+
+prebuilt_runnables = _PrebuiltRunnables()
 
 
 # -------------------------------------------------------------------------
@@ -163,5 +313,5 @@ if __name__ == "__main__":
     print("\n✅ Gemini Models Configured:")
     for role, name in MODELS.items():
         print(f"  {role:12} → {name}")
-    ok = sum(v is not None for v in prebuilt_runnables.values())
+    ok = sum(prebuilt_runnables.get(role) is not None for role in prebuilt_runnables)
     print(f"Prebuilt runnables: {ok}/{len(prebuilt_runnables)} ready.")
@@ -0,0 +1,181 @@
+"""
+Generate-and-build jobs.
+------------------------
+One job takes a prompt all the way to a built preview:
+
+    claim workspace → design pipeline (files streamed into lib/, then
+                      lib/main.dart rewritten to route to them)
+                    → build queued the moment the code stage finishes
+
+The build overlaps with whatever design stages are still running (critique,
+UI revision). Jobs run as server-side tasks, independent of any HTTP
+request, so a client can disconnect and poll later. Progress is kept as
+sequence-numbered events (token events are only counted) plus a summary;
+the last GENERATION_HISTORY finished jobs stay readable.
+"""
+from __future__ import annotations
+import asyncio, os, time, uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+
+import workspace as ws
+from build_scheduler import scheduler as build_scheduler
+from workspace_pool import pool as workspace_pool
+
+GENERATION_HISTORY = int(os.getenv("GENERATION_HISTORY", "50"))
+GENERATION_EVENTS_MAX = int(os.getenv("GENERATION_EVENTS_MAX", "2000"))
+BUILD_AFTER_STAGE = "final_code"
+
+
+class GenerationJob:
+    logs_build = False  # record build log lines as "log" events
+
+    def __init__(self, prompt: str, wid: str | None = None):
+        self.id = uuid.uuid4().hex[:12]
+        self.prompt = prompt
+        self.wid = wid
+        self.state = "queued"  # queued → claiming → generating → building → done | failed | cancelled
+        self.error: str | None = None
+        self.created = time.time()
+        self.started: float | None = None
+        self.finished: float | None = None
+        self.stages: dict[str, dict] = {}
+        self.tokens: dict[str, int] = {}
+        self.files: list[str] = []
+        self.build_id: str | None = None
+        self.build_state: str | None = None
+        self.build_exit_code: int | None = None
+        self.result: dict | None = None
+        self.task: asyncio.Task | None = None
+
+        self.events: deque[tuple[int, dict]] = deque(maxlen=GENERATION_EVENTS_MAX)
+        self.next_seq = 1
+
+    @property
+    def done(self) -> bool:
+        return self.state in ("done", "failed", "cancelled")
+
+    def publish(self, event: dict) -> None:
+        self.events.append((self.next_seq, {**event, "t": round(time.time() - self.created, 3)}))
+        self.next_seq += 1
+
+    def events_after(self, seq: int) -> list[dict]:
+        return [{"seq": s, **e} for s, e in self.events if s > seq]
+
+    def info(self) -> dict:
+        return {
+            "id": self.id, "state": self.state, "error": self.error,
+            "workspace": self.wid,
+            "preview": f"/preview/{self.wid}/build/web/index.html" if self.wid else None,
+            "created": self.created, "started": self.started, "finished": self.finished,
+            "stages": self.stages, "tokens": self.tokens, "files": self.files,
+            "build": {"id": self.build_id, "state": self.build_state, "exit_code": self.build_exit_code},
+            "last_seq": self.next_seq - 1,
+        }
+
+
+class GenerationJobs:
+    def __init__(self):
+        self._jobs: OrderedDict[str, GenerationJob] = OrderedDict()
+
+    def submit(self, prompt: str, wid: str | None = None) -> GenerationJob:
+        job = GenerationJob(prompt, wid)
+        self._jobs[job.id] = job
+        job.publish({"event": "queued"})
+        job.task = asyncio.create_task(self._run(job))
+        self._prune()
+        return job
+
+    def get(self, job_id: str) -> GenerationJob | None:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> list[GenerationJob]:
+        return list(self._jobs.values())
+
+    def cancel(self, job: GenerationJob) -> None:
+        if not job.done and job.task:
+            job.task.cancel()
+
+    def _prune(self) -> None:
+        finished = [j for j in self._jobs.values() if j.done]
+        for job in finished[:max(0, len(finished) - GENERATION_HISTORY)]:
+            del self._jobs[job.id]
+
+    # ------------------------------------------------------------------
+    # Execution
+    # ------------------------------------------------------------------
+    async def _build(self, job: GenerationJob, base: Path) -> int:
+        build = build_scheduler.submit(job.wid, base)
+        job.build_id, job.build_state = build.id, build.state
+        job.publish({"event": "build_queued", "build": build.id})
+        try:
+            # Staying subscribed keeps the build alive without any HTTP client
+            async for _, line in build_scheduler.subscribe(build):
+                job.build_state = build.state
+                if job.logs_build:
+                    await asyncio.to_thread(job.publish, {"event": "log", "line": line})
+        finally:
+            job.build_state, job.build_exit_code = build.state, build.exit_code
+        job.publish({"event": "build_done", "build": build.id, "exit_code": build.exit_code})
+        return build.exit_code
+
+    def _track(self, job: GenerationJob, event: dict) -> None:
+        kind, stage = event["event"], event.get("stage")
+        if kind == "stage_start":
+            job.stages[stage] = {"state": "running"}
+        elif kind == "stage_done":
+            job.stages[stage] = {"state": "done", **{k: v for k, v in event.items() if k not in ("event", "stage")}}
+        elif kind == "file_done":
+            job.files.append(event["file"])
+        elif kind == "done":
+            job.result = event["result"]
+
+    async def _run(self, job: GenerationJob) -> None:
+        # Imported lazily: the agents pull in the LLM stack
+        from ai_agents.coordinator import CoordinatorAgent
+
+        build_task: asyncio.Task | None = None
+        job.started = time.time()
+        try:
+            job.state = "claiming"
+            if job.wid is None:
+                job.wid = (await ws.run_io(workspace_pool.claim))["id"]
+            base = await ws.aensure_workspace(job.wid)
+            job.publish({"event": "workspace", "workspace": job.wid})
+
+            job.state = "generating"
+            async for event in CoordinatorAgent().stream_design(job.prompt, workspace_id=job.wid):
+                if event["event"] == "token":
+                    job.tokens[event["stage"]] = job.tokens.get(event["stage"], 0) + 1
+                    continue
+                if event["event"] == "error":
+                    raise RuntimeError(event["error"])
+                self._track(job, event)
+                job.publish({"event": "done"} if event["event"] == "done" else event)
+                if event["event"] == "stage_done" and event["stage"] == BUILD_AFTER_STAGE:
+                    build_task = asyncio.create_task(self._build(job, base))
+
+            job.state = "building"
+            if build_task is None:
+                build_task = asyncio.create_task(self._build(job, base))
+            code = await build_task
+            job.state = "done" if code == 0 else "failed"
+            if code != 0:
+                job.error = f"build exited with {code}"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+        except Exception as e:
+            job.state, job.error = "failed", str(e)
+        finally:
+            if build_task is not None and not build_task.done():
+                build_task.cancel()
+            if job.state == "cancelled" and job.build_id:
+                build = build_scheduler.get(job.build_id)
+                if build is not None:
+                    build_scheduler.cancel(build)
+            job.finished = time.time()
+            job.publish({"event": "job_done", "state": job.state, "error": job.error})
+            self._prune()
+
+
+jobs = GenerationJobs()
@@ -0,0 +1,272 @@
+"""
+Persistent job queue.
+---------------------
+Generation and build jobs live in a SQLite file (WAL mode, so the API
+process and every worker process can read and write it at once) and
+survive restarts. A job moves
+
+    queued → running (claimed by one worker) → done | failed | cancelled
+
+Claiming is a single `BEGIN IMMEDIATE` transaction, so two workers never
+get the same job, and at most one job per workspace runs at a time. The
+worker owning a job heartbeats it; a job whose worker stopped
+heartbeating (crashed, killed) is put back in the queue by `recover()`,
+up to JOB_MAX_ATTEMPTS claims, then failed. Cancelling a running job sets
+a flag the worker picks up on its next heartbeat.
+
+Progress is stored as sequence-numbered events per job (the last
+JOB_EVENTS_MAX are kept); finished jobs beyond JOB_HISTORY are deleted.
+"""
+from __future__ import annotations
+import json, os, sqlite3, threading, time, uuid
+from pathlib import Path
+from typing import Any
+
+ROOT = Path(__file__).parent.resolve()
+JOB_DB = Path(os.getenv("JOB_DB", ROOT / ".cache" / "jobs.sqlite"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_EVENTS_MAX = int(os.getenv("JOB_EVENTS_MAX", "5000"))
+JOB_HISTORY = int(os.getenv("JOB_HISTORY", "500"))
+
+KINDS = ("generate", "build")
+FINISHED = ("done", "failed", "cancelled")
+
+
+class JobStore:
+    def __init__(self, path: Path = JOB_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,
+                workspace TEXT, state TEXT NOT NULL, worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0, requests INTEGER NOT NULL DEFAULT 1,
+                cancel INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL, started REAL, finished REAL, heartbeat REAL,
+                summary TEXT, result TEXT, error TEXT);
+            CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, created);
+            CREATE INDEX IF NOT EXISTS jobs_workspace ON jobs(workspace, state);
+            CREATE TABLE IF NOT EXISTS events (
+                job_id TEXT NOT NULL, seq INTEGER NOT NULL, body TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq));
+        """)
+
+    def _tx(self, fn):
+        """Run `fn(db)` in a write transaction that locks out other processes."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return out
+
+    @staticmethod
+    def _add_event(db, job_id: str, event: dict) -> int:
+        seq = db.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM events WHERE job_id = ?",
+                         (job_id,)).fetchone()[0]
+        db.execute("INSERT INTO events VALUES (?, ?, ?)",
+                   (job_id, seq, json.dumps({**event, "t": round(time.time(), 3)})))
+        return seq
+
+    # ------------------------------------------------------------------
+    # Producer side
+    # ------------------------------------------------------------------
+    def enqueue(self, kind: str, payload: dict, workspace: str | None = None) -> dict:
+        """Queue a job. A build joins the workspace's queued build, if any; a
+        running one may predate the latest edits, so it gets a follow-up."""
+        if kind not in KINDS:
+            raise ValueError(f"unknown job kind {kind!r}")
+
+        def run(db):
+            if kind == "build":
+                row = db.execute(
+                    "SELECT id FROM jobs WHERE kind = 'build' AND workspace = ? AND state = 'queued'",
+                    (workspace,)).fetchone()
+                if row:
+                    db.execute("UPDATE jobs SET requests = requests + 1 WHERE id = ?", (row["id"],))
+                    return row["id"]
+            job_id = uuid.uuid4().hex[:12]
+            db.execute("INSERT INTO jobs (id, kind, payload, workspace, state, created) VALUES (?, ?, ?, ?, 'queued', ?)",
+                       (job_id, kind, json.dumps(payload), workspace, time.time()))
+            self._add_event(db, job_id, {"event": "queued"})
+            return job_id
+
+        return self.get(self._tx(run))
+
+    def request_cancel(self, job_id: str) -> dict | None:
+        def run(db):
+            db.execute("UPDATE jobs SET cancel = 1 WHERE id = ? AND state = 'running'", (job_id,))
+            cur = db.execute("UPDATE jobs SET state = 'cancelled', finished = ? WHERE id = ? AND state = 'queued'",
+                             (time.time(), job_id))
+            if cur.rowcount:
+                self._add_event(db, job_id, {"event": "job_done", "state": "cancelled", "error": None})
+
+        self._tx(run)
+        return self.get(job_id)
+
+    # ------------------------------------------------------------------
+    # Worker side
+    # ------------------------------------------------------------------
+    def claim(self, worker: str, kinds: tuple[str, ...] = KINDS) -> dict | None:
+        """Oldest queued job whose workspace has nothing else running."""
+        marks = ",".join("?" * len(kinds))
+
+        def run(db):
+            row = db.execute(f"""
+                SELECT id FROM jobs WHERE state = 'queued' AND kind IN ({marks})
+                  AND (workspace IS NULL OR workspace NOT IN (
+                       SELECT workspace FROM jobs WHERE state = 'running' AND workspace IS NOT NULL))
+                ORDER BY created LIMIT 1""", kinds).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            db.execute("""UPDATE jobs SET state = 'running', worker = ?, attempts = attempts + 1,
+                          started = ?, heartbeat = ? WHERE id = ?""", (worker, now, now, row["id"]))
+            self._add_event(db, row["id"], {"event": "claimed", "worker": worker})
+            return row["id"]
+
+        job_id = self._tx(run)
+        return self.get(job_id) if job_id else None
+
+    def heartbeat(self, job_id: str, worker: str, summary: dict | None = None) -> str:
+        """'ok', 'cancel' (cancellation requested) or 'lost' (no longer ours)."""
+        with self._lock:
+            cur = self._db.execute(
+                "UPDATE jobs SET heartbeat = ?, summary = COALESCE(?, summary) WHERE id = ? AND worker = ? AND state = 'running'",
+                (time.time(), json.dumps(summary) if summary is not None else None, job_id, worker))
+            if not cur.rowcount:
+                return "lost"
+            cancel = self._db.execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        return "cancel" if cancel else "ok"
+
+    def add_event(self, job_id: str, event: dict) -> int:
+        return self._tx(lambda db: self._add_event(db, job_id, event))
+
+    def finish(self, job_id: str, worker: str, state: str, error: str | None = None,
+               summary: dict | None = None, result: Any = None) -> bool:
+        """Record the outcome; a no-op if the job was meanwhile given to another worker."""
+        def run(db):
+            cur = db.execute("""UPDATE jobs SET state = ?, error = ?, finished = ?,
+                                summary = COALESCE(?, summary), result = ?
+                                WHERE id = ? AND worker = ? AND state = 'running'""",
+                             (state, error, time.time(), json.dumps(summary) if summary is not None else None,
+                              json.dumps(result) if result is not None else None, job_id, worker))
+            if not cur.rowcount:
+                return False
+            db.execute("DELETE FROM events WHERE job_id = ? AND seq <= (SELECT MAX(seq) FROM events WHERE job_id = ?) - ?",
+                       (job_id, job_id, JOB_EVENTS_MAX))
+            self._prune(db)
+            return True
+
+        return self._tx(run)
+
+    def release(self, job_id: str, worker: str, reason: str) -> bool:
+        """Put a running job back in the queue without counting the attempt."""
+        def run(db):
+            cur = db.execute("""UPDATE jobs SET state = 'queued', worker = NULL, attempts = MAX(attempts - 1, 0)
+                                WHERE id = ? AND worker = ? AND state = 'running'""", (job_id, worker))
+            if cur.rowcount:
+                self._add_event(db, job_id, {"event": "requeued", "reason": reason})
+            return bool(cur.rowcount)
+
+        return self._tx(run)
+
+    def recover(self, stale_after: float, max_attempts: int = JOB_MAX_ATTEMPTS,
+                dead_workers: list[str] = ()) -> dict:
+        """Requeue (or fail, once out of attempts) jobs whose worker is gone."""
+        def run(db):
+            marks = ",".join("?" * len(dead_workers))
+            rows = db.execute(
+                f"""SELECT id, attempts FROM jobs WHERE state = 'running'
+                    AND (heartbeat < ? {f'OR worker IN ({marks})' if dead_workers else ''})""",
+                (time.time() - stale_after, *dead_workers)).fetchall()
+            out = {"requeued": [], "failed": []}
+            for row in rows:
+                if row["attempts"] >= max_attempts:
+                    db.execute("UPDATE jobs SET state = 'failed', error = ?, finished = ? WHERE id = ?",
+                               (f"worker lost ({row['attempts']} attempts)", time.time(), row["id"]))
+                    self._add_event(db, row["id"], {"event": "job_done", "state": "failed", "error": "worker lost"})
+                    out["failed"].append(row["id"])
+                else:
+                    db.execute("UPDATE jobs SET state = 'queued', worker = NULL WHERE id = ?", (row["id"],))
+                    self._add_event(db, row["id"], {"event": "requeued", "reason": "worker lost"})
+                    out["requeued"].append(row["id"])
+            return out
+
+        return self._tx(run)
+
+    def _prune(self, db) -> None:
+        old = [r[0] for r in db.execute(
+            f"SELECT id FROM jobs WHERE state IN {FINISHED} ORDER BY finished DESC LIMIT -1 OFFSET ?",
+            (JOB_HISTORY,))]
+        for job_id in old:
+            db.execute("DELETE FROM events WHERE job_id = ?", (job_id,))
+            db.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _info(row: sqlite3.Row) -> dict:
+        info = dict(row)
+        for key in ("payload", "summary", "result"):
+            info[key] = json.loads(info[key]) if info[key] else None
+        info["cancel"] = bool(info["cancel"])
+        return info
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            last = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM events WHERE job_id = ?",
+                                    (job_id,)).fetchone()[0]
+        return {**self._info(row), "last_seq": last} if row else None
+
+    def active_for(self, workspace: str) -> dict | None:
+        """The workspace's running job, else its oldest queued one."""
+        with self._lock:
+            row = self._db.execute(
+                """SELECT id FROM jobs WHERE workspace = ? AND state IN ('queued', 'running')
+                   ORDER BY state = 'running' DESC, created LIMIT 1""", (workspace,)).fetchone()
+        return self.get(row["id"]) if row else None
+
+    def events_after(self, job_id: str, seq: int = 0, limit: int = 1000) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, body FROM events WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, seq, limit)).fetchall()
+        return [{"seq": s, **json.loads(body)} for s, body in rows]
+
+    def list(self, state: str | None = None, limit: int = 100) -> list[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE ? IS NULL OR state = ? ORDER BY created DESC LIMIT ?",
+                (state, state, limit)).fetchall()
+        return [self._info(r) for r in rows]
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state").fetchall()
+            oldest = self._db.execute("SELECT MIN(created) FROM jobs WHERE state = 'queued'").fetchone()[0]
+        counts: dict[str, dict[str, int]] = {}
+        for kind, state, n in rows:
+            counts.setdefault(kind, {})[state] = n
+        return {"jobs": counts, "oldest_queued_s": round(time.time() - oldest, 3) if oldest else None}
+
+
+_store: JobStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> JobStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = JobStore()
+        return _store
@@ -0,0 +1,270 @@
+"""
+Worker processes for queued jobs.
+---------------------------------
+With JOB_WORKERS > 0 the API process starts that many worker processes
+(`python -m job_workers`), each running up to JOB_WORKER_CONCURRENCY jobs
+from the `job_store` queue on its own event loop. LLM pipelines, `flutter`
+supervision and file I/O then stay off the API's loop, and workers spread
+over cores. JOB_WORKERS=0 (default) keeps the in-process jobs.
+
+A worker heartbeats each job every JOB_HEARTBEAT seconds, which is also
+when it notices a cancellation. The supervisor thread in the API process
+restarts workers that exit and requeues their jobs at once; jobs whose
+heartbeat is older than JOB_STALE_AFTER (a worker that hung, or one from a
+previous server run) are requeued too. Workers exit when their parent
+goes away; on SIGTERM they hand their running jobs back to the queue.
+
+A requeued generation job reruns the pipeline from the start; the LLM
+cache answers the stages that had already finished.
+"""
+from __future__ import annotations
+import argparse, asyncio, os, shutil, signal, socket, subprocess, sys, threading, time, uuid
+from pathlib import Path
+
+import metrics
+import workspace as ws
+from build_scheduler import scheduler as build_scheduler
+from generation_jobs import GenerationJob, GenerationJobs
+from job_store import JOB_MAX_ATTEMPTS, JobStore, get_store
+
+ROOT = Path(__file__).parent.resolve()
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "0"))
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", "1"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "15"))
+JOB_POLL = float(os.getenv("JOB_POLL", "0.2"))
+JOB_STOP_GRACE = float(os.getenv("JOB_STOP_GRACE", "10"))
+METRICS_DUMP_INTERVAL = 5.0
+
+
+def enabled() -> bool:
+    return JOB_WORKERS > 0
+
+
+class _StoredGeneration(GenerationJob):
+    """A generation job whose events go to the store instead of memory."""
+
+    # The build runs in this worker's scheduler, which the API process can't
+    # subscribe to; its log reaches /build/logs through the store
+    logs_build = True
+
+    def __init__(self, store: JobStore, row: dict):
+        super().__init__(row["payload"]["prompt"], row["workspace"])
+        self.id = row["id"]
+        self.store = store
+        self.detached = False
+
+    def publish(self, event: dict) -> None:
+        if not self.detached:
+            self.store.add_event(self.id, event)
+
+    def summary(self) -> dict:
+        info = self.info()
+        del info["id"], info["last_seq"]
+        return info
+
+
+class _StoredBuild:
+    def __init__(self, store: JobStore, row: dict):
+        self.id = row["id"]
+        self.wid = row["workspace"]
+        self.store = store
+        self.detached = False
+        self.build = None
+        self.state, self.error, self.result = "running", None, None
+
+    def summary(self) -> dict:
+        return {"build": self.build.info() if self.build else None}
+
+    async def run(self) -> None:
+        try:
+            self.build = build_scheduler.submit(self.wid, await ws.aensure_workspace(self.wid))
+            try:
+                async for _, line in build_scheduler.subscribe(self.build):
+                    if not self.detached:
+                        await asyncio.to_thread(self.store.add_event, self.id, {"event": "log", "line": line})
+            finally:
+                if not self.build.done:
+                    build_scheduler.cancel(self.build)
+        except asyncio.CancelledError:
+            self.state = "cancelled"
+            raise
+        except Exception as e:
+            self.state, self.error = "failed", str(e)
+            return
+        code = self.build.exit_code
+        self.state = {"done": "done", "cancelled": "cancelled"}.get(self.build.state, "failed")
+        self.error = f"build exited with {code}" if self.state == "failed" else None
+        self.result = {"exit_code": code, "preview": f"/preview/{self.wid}/build/web/index.html"}
+
+
+class Worker:
+    def __init__(self, worker_id: str, concurrency: int = JOB_WORKER_CONCURRENCY,
+                 store: JobStore | None = None):
+        self.id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.store = store or get_store()
+        self._running: dict[str, asyncio.Task] = {}
+        self._stop: asyncio.Event | None = None
+
+    async def _execute(self, row: dict) -> None:
+        if row["kind"] == "generate":
+            job = _StoredGeneration(self.store, row)
+            runner = asyncio.create_task(GenerationJobs()._run(job))
+        else:
+            job = _StoredBuild(self.store, row)
+            runner = asyncio.create_task(job.run())
+
+        outcome = "ok"
+        try:
+            while not runner.done():
+                await asyncio.wait({runner}, timeout=JOB_HEARTBEAT)
+                if runner.done():
+                    break
+                outcome = await asyncio.to_thread(self.store.heartbeat, job.id, self.id, job.summary())
+                if outcome != "ok":
+                    break
+        except asyncio.CancelledError:
+            outcome = "stopping"
+
+        if outcome != "ok":
+            # A cancelled job still reports its end; a lost or handed-back one doesn't
+            job.detached = outcome != "cancel"
+            runner.cancel()
+            await asyncio.wait({runner})
+        # A job that died before recording its own end must not finish as "running"
+        if runner.cancelled():
+            if job.state not in ("done", "failed", "cancelled"):
+                job.state = "cancelled"
+        elif runner.exception() is not None:
+            job.state, job.error = "failed", str(runner.exception())
+        if outcome == "stopping":
+            await asyncio.to_thread(self.store.release, job.id, self.id, "worker stopped")
+        elif outcome != "lost":
+            await asyncio.to_thread(self.store.finish, job.id, self.id, job.state, job.error,
+                                    job.summary(), job.result)
+
+    async def serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stop.set)
+        parent = os.getppid()
+        print(f"👷 Job worker {self.id} ready (concurrency {self.concurrency})", flush=True)
+        dumped = 0.0
+
+        while not self._stop.is_set():
+            if os.getppid() != parent:
+                break  # the API process is gone; don't outlive it
+            if time.monotonic() - dumped > METRICS_DUMP_INTERVAL:
+                # The API process adds these into /metrics
+                await asyncio.to_thread(metrics.registry.dump)
+                dumped = time.monotonic()
+            while len(self._running) < self.concurrency:
+                row = await asyncio.to_thread(self.store.claim, self.id)
+                if row is None:
+                    break
+                task = asyncio.create_task(self._execute(row))
+                task.add_done_callback(lambda _, job_id=row["id"]: self._running.pop(job_id, None))
+                self._running[row["id"]] = task
+            stop = asyncio.create_task(self._stop.wait())
+            await asyncio.wait({stop, *self._running.values()}, timeout=JOB_POLL,
+                               return_when=asyncio.FIRST_COMPLETED)
+            stop.cancel()
+
+        tasks = list(self._running.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        metrics.registry.dump()
+
+
+# -------------------------------------------------------------------------
+# Supervisor (runs in the API process)
+# -------------------------------------------------------------------------
+class WorkerPool:
+    def __init__(self, size: int = JOB_WORKERS, concurrency: int = JOB_WORKER_CONCURRENCY):
+        self.size = max(0, size)
+        self.concurrency = concurrency
+        self._procs: list[tuple[str, subprocess.Popen]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.restarts = 0
+        self.requeued = 0
+        self.failed = 0
+
+    def _spawn(self) -> tuple[str, subprocess.Popen]:
+        worker_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:6]}"
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "job_workers", "--worker-id", worker_id,
+             "--concurrency", str(self.concurrency)], cwd=ROOT)
+        return worker_id, proc
+
+    def start(self) -> None:
+        if self._thread or self.size == 0:
+            return
+        self._stop.clear()
+        # Dumps from a previous run would be added to this run's counters
+        shutil.rmtree(metrics.METRICS_DIR, ignore_errors=True)
+        with self._lock:
+            self._procs = [self._spawn() for _ in range(self.size)]
+        self._thread = threading.Thread(target=self._supervise, name="job-workers", daemon=True)
+        self._thread.start()
+
+    def _supervise(self) -> None:
+        store = get_store()
+        while not self._stop.wait(JOB_HEARTBEAT):
+            dead = []
+            with self._lock:
+                for i, (worker_id, proc) in enumerate(self._procs):
+                    if proc.poll() is not None:
+                        print(f"⚠️ Job worker {worker_id} exited with {proc.returncode}; restarting")
+                        dead.append(worker_id)
+                        self._procs[i] = self._spawn()
+                        self.restarts += 1
+            try:
+                out = store.recover(JOB_STALE_AFTER, JOB_MAX_ATTEMPTS, dead)
+            except Exception as e:
+                print(f"⚠️ Job recovery failed: {e}")
+                continue
+            self.requeued += len(out["requeued"])
+            self.failed += len(out["failed"])
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=JOB_HEARTBEAT + 1)
+            self._thread = None
+        with self._lock:
+            procs, self._procs = self._procs, []
+        for _, proc in procs:
+            proc.terminate()
+        deadline = time.monotonic() + JOB_STOP_GRACE
+        for _, proc in procs:
+            try:
+                proc.wait(timeout=max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    def stats(self) -> dict:
+        with self._lock:
+            workers = [{"id": w, "pid": p.pid, "alive": p.poll() is None} for w, p in self._procs]
+        return {"size": self.size, "concurrency": self.concurrency, "workers": workers,
+                "restarts": self.restarts, "requeued": self.requeued, "failed": self.failed,
+                "queue": get_store().stats()}
+
+
+pool = WorkerPool()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run queued generation and build jobs.")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY)
+    args = parser.parse_args(argv)
+    asyncio.run(Worker(args.worker_id, args.concurrency).serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Content-addressed LLM response cache.
+-------------------------------------
+`CachedLLM` wraps any chat runnable (what `get_runnable_llm` returns) and
+keys responses by sha256(model id, rendered messages, generation params).
+Lookups go to an in-memory LRU first, then to a SQLite file; entries
+expire after LLM_CACHE_TTL seconds and the file is trimmed to
+LLM_CACHE_MAX_BYTES, least recently used first.
+
+Bypass for a single call with
+    chain.ainvoke(inputs, config={"configurable": {"llm_cache_bypass": True}})
+or disable entirely with LLM_CACHE=false. A callable under
+`llm_cache_accept` in the same dict vets each reply before it is stored
+(e.g. only replies that parse), so a bad reply isn't served again.
+"""
+from __future__ import annotations
+import asyncio, hashlib, json, os, sqlite3, threading, time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.runnables import Runnable, RunnableConfig
+
+ROOT = Path(__file__).parent.resolve()
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "true").lower() == "true"
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", ROOT / ".cache" / "llm_cache.sqlite"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_MEMORY = int(os.getenv("LLM_CACHE_MEMORY", "512"))
+
+
+class LLMCache:
+    def __init__(self, path: Path | None = LLM_CACHE_PATH, ttl: float = LLM_CACHE_TTL,
+                 max_bytes: int = LLM_CACHE_MAX_BYTES, memory_entries: int = LLM_CACHE_MEMORY):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._mem: OrderedDict[str, tuple[str, float, float]] = OrderedDict()  # key → (text, created, latency)
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL,
+                accessed REAL NOT NULL, size INTEGER NOT NULL, latency REAL NOT NULL)""")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self.counters = {"hits_memory": 0, "hits_disk": 0, "misses": 0, "bypassed": 0,
+                         "stores": 0, "evictions": 0, "latency_saved_s": 0.0}
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+    def _count(self, key: str, by: float = 1) -> None:
+        with self._lock:
+            self.counters[key] += by
+
+    def _remember(self, key: str, entry: tuple[str, float, float]) -> None:
+        with self._lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.memory_entries:
+                self._mem.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._mem[key]
+                entry = None
+            if entry is not None:
+                self._mem.move_to_end(key)
+        if entry is not None:
+            self._count("hits_memory")
+            self._count("latency_saved_s", entry[2])
+            return entry[0]
+
+        if self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT text, created, latency FROM responses WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] > self.ttl:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    row = None
+                if row:
+                    self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            if row:
+                self._remember(key, (row[0], row[1], row[2]))
+                self._count("hits_disk")
+                self._count("latency_saved_s", row[2])
+                return row[0]
+
+        self._count("misses")
+        return None
+
+    def put(self, key: str, text: str, latency: float) -> None:
+        now = time.time()
+        self._remember(key, (text, now, latency))
+        self._count("stores")
+        if self._db is None:
+            return
+        size = len(text.encode())
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, text, now, now, size, latency))
+            self._evict_locked(now)
+
+    def _evict_locked(self, now: float) -> None:
+        cur = self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        evicted = cur.rowcount
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            row = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 1").fetchone()
+            if not row:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            total -= row[1]
+            evicted += 1
+        self.counters["evictions"] += max(evicted, 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self.counters)
+            s["memory_entries"] = len(self._mem)
+            if self._db is not None:
+                n, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+                s.update(disk_entries=n, disk_bytes=size)
+        lookups = s["hits_memory"] + s["hits_disk"] + s["misses"]
+        s["hit_rate"] = round((s["hits_memory"] + s["hits_disk"]) / lookups, 4) if lookups else None
+        s["latency_saved_s"] = round(s["latency_saved_s"], 3)
+        return s
+
+
+# -------------------------------------------------------------------------
+# Runnable wrapper
+# -------------------------------------------------------------------------
+def _messages(value: Any) -> list:
+    if hasattr(value, "to_messages"):  # PromptValue from a prompt template
+        value = value.to_messages()
+    if isinstance(value, str):
+        return [["human", value]]
+    if isinstance(value, BaseMessage):
+        value = [value]
+    if isinstance(value, (list, tuple)):
+        out = []
+        for m in value:
+            if isinstance(m, BaseMessage):
+                out.append([m.type, m.content])
+            elif isinstance(m, (list, tuple)) and len(m) == 2:
+                out.append([str(m[0]), m[1]])
+            else:
+                out.append(["human", str(m)])
+        return out
+    return [["human", str(value)]]
+
+
+def _text(result: Any) -> str:
+    return result.content if hasattr(result, "content") else str(result)
+
+
+def _configurable(config: RunnableConfig | None) -> dict:
+    return (config or {}).get("configurable") or {}
+
+
+def _bypassed(config: RunnableConfig | None) -> bool:
+    return bool(_configurable(config).get("llm_cache_bypass"))
+
+
+def _storable(config: RunnableConfig | None, text: str) -> bool:
+    accept = _configurable(config).get("llm_cache_accept")
+    return accept is None or accept(text)
+
+
+class CachedLLM(Runnable):
+    """Drop-in replacement for a chat runnable that answers repeats from cache."""
+
+    def __init__(self, inner: Runnable, model_id: str, params: dict | None = None,
+                 cache: LLMCache | None = None):
+        self.inner = inner
+        self.model_id = model_id
+        self.params = params or {}
+        self.cache = cache or get_cache()
+
+    def key(self, value: Any) -> str:
+        payload = json.dumps({"model": self.model_id, "params": self.params,
+                              "messages": _messages(value)}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs) -> AIMessage:
+        if _bypassed(config):
+            self.cache._count("bypassed")
+            return self.inner.invoke(input, config, **kwargs)
+        key = self.key(input)
+        hit = self.cache.get(key)
+        if hit is not None:
+            return AIMessage(content=hit)
+        started = time.perf_counter()
+        result = self.inner.invoke(input, config, **kwargs)
+        if _storable(config, _text(result)):
+            self.cache.put(key, _text(result), time.perf_counter() - started)
+        return result
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs) -> AIMessage:
+        if _bypassed(config):
+            self.cache._count("bypassed")
+            return await self.inner.ainvoke(input, config, **kwargs)
+        key = self.key(input)
+        hit = await asyncio.to_thread(self.cache.get, key)
+        if hit is not None:
+            return AIMessage(content=hit)
+        started = time.perf_counter()
+        result = await self.inner.ainvoke(input, config, **kwargs)
+        if _storable(config, _text(result)):
+            await asyncio.to_thread(self.cache.put, key, _text(result), time.perf_counter() - started)
+        return result
+
+    def stream(self, input: Any, config: RunnableConfig | None = None, **kwargs) -> Iterator[AIMessageChunk]:
+        if _bypassed(config):
+            self.cache._count("bypassed")
+            yield from self.inner.stream(input, config, **kwargs)
+            return
+        key = self.key(input)
+        hit = self.cache.get(key)
+        if hit is not None:
+            yield AIMessageChunk(content=hit)
+            return
+        started, parts = time.perf_counter(), []
+        for chunk in self.inner.stream(input, config, **kwargs):
+            parts.append(_text(chunk))
+            yield chunk
+        text = "".join(parts)
+        if _storable(config, text):
+            self.cache.put(key, text, time.perf_counter() - started)
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs) -> AsyncIterator[AIMessageChunk]:
+        if _bypassed(config):
+            self.cache._count("bypassed")
+            async for chunk in self.inner.astream(input, config, **kwargs):
+                yield chunk
+            return
+        key = self.key(input)
+        hit = await asyncio.to_thread(self.cache.get, key)
+        if hit is not None:
+            yield AIMessageChunk(content=hit)
+            return
+        started, parts = time.perf_counter(), []
+        async for chunk in self.inner.astream(input, config, **kwargs):
+            parts.append(_text(chunk))
+            yield chunk
+        # Only a fully consumed stream is stored
+        text = "".join(parts)
+        if _storable(config, text):
+            await asyncio.to_thread(self.cache.put, key, text, time.perf_counter() - started)
+
+
+_cache: LLMCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
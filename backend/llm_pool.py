@@ -0,0 +1,280 @@
+"""
+Process-wide LLM client pool with per-model rate limiting.
+----------------------------------------------------------
+- one ChatGoogleGenerativeAI client per (model, settings), shared by every
+  agent in the process
+- per model: a requests/min and a tokens/min token bucket, a concurrency
+  semaphore, and an adaptive cooldown that grows on 429 / RESOURCE_EXHAUSTED
+  and decays on success
+- queue depth, wait time and throttle counters per model for `stats()`
+
+Limits come from `gemini_config.MODEL_LIMITS`.
+"""
+from __future__ import annotations
+import asyncio, random, threading, time
+from typing import Any, AsyncIterator
+
+from langchain_core.runnables import Runnable, RunnableConfig
+
+import metrics
+
+LLM_POOL_RETRIES = 4
+EXPECTED_OUTPUT_TOKENS = 1024
+
+
+def estimate_tokens(value: Any) -> int:
+    """Rough token count (~4 chars per token) of a prompt or response."""
+    if hasattr(value, "to_messages"):
+        value = value.to_messages()
+    if isinstance(value, (list, tuple)):
+        return sum(estimate_tokens(v) for v in value)
+    if hasattr(value, "content"):
+        value = value.content
+    return max(1, len(str(value)) // 4)
+
+
+def _is_rate_limit(e: BaseException) -> bool:
+    text = f"{type(e).__name__} {e}"
+    return "429" in text or "ResourceExhausted" in text or "RESOURCE_EXHAUSTED" in text
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def take(self, amount: float) -> None:
+        amount = min(amount, self.capacity)  # oversized requests wait for a full bucket
+        async with self._lock:  # FIFO: later callers queue behind this one
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def charge(self, amount: float) -> None:
+        """Adjust after the fact (may go negative, i.e. into debt)."""
+        self._refill()
+        self.tokens -= amount
+
+
+class ModelSlot:
+    def __init__(self, model_id: str, rpm: int, tpm: int, concurrency: int):
+        self.model_id = model_id
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limits = {"rpm": rpm, "tpm": tpm, "concurrency": concurrency}
+        self._loop = None
+        self.cooldown_until = 0.0
+        self.backoff = 0.0
+
+        self.waiting = 0
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.tokens_used = 0
+
+    def _bind_loop(self) -> None:
+        # asyncio primitives belong to one loop; scripts may run several in turn
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.semaphore = asyncio.Semaphore(self.limits["concurrency"])
+            self.requests._lock = asyncio.Lock()
+            self.tokens._lock = asyncio.Lock()
+
+    async def acquire(self, est_tokens: int) -> float:
+        self._bind_loop()
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+            try:
+                while (delay := self.cooldown_until - time.monotonic()) > 0:
+                    await asyncio.sleep(delay)
+                await self.requests.take(1)
+                await self.tokens.take(est_tokens)
+            except BaseException:
+                self.semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        self.in_flight += 1
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+        return waited
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self.semaphore.release()
+
+    def on_success(self, used: int, reserved: int) -> None:
+        self.calls += 1
+        self.backoff = self.backoff / 2 if self.backoff > 0.5 else 0.0
+        self.tokens.charge(used - reserved)
+        self.tokens_used += used
+
+    def on_rate_limited(self) -> float:
+        self.throttled += 1
+        now = time.monotonic()
+        if now < self.cooldown_until:
+            # A burst of in-flight calls failing together counts as one signal
+            return self.cooldown_until - now
+        self.backoff = min(max(self.backoff * 2, 1.0), 60.0)
+        delay = self.backoff * (1 + random.random() * 0.25)
+        self.cooldown_until = now + delay
+        return delay
+
+    def stats(self) -> dict:
+        done = self.calls + self.errors
+        return {
+            **self.limits,
+            "queue_depth": self.waiting,
+            "in_flight": self.in_flight,
+            "calls": self.calls,
+            "errors": self.errors,
+            "throttled": self.throttled,
+            "backoff_s": round(self.backoff, 2),
+            "wait_avg_s": round(self.wait_total / done, 4) if done else None,
+            "wait_max_s": round(self.wait_max, 4),
+            "tokens_used_est": self.tokens_used,
+        }
+
+
+class RateLimitedLLM(Runnable):
+    """Runs every call to `inner` through its model's slot."""
+
+    def __init__(self, inner: Runnable, slot: ModelSlot):
+        self.inner = inner
+        self.slot = slot
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs):
+        # Sync callers (scripts) bypass the asyncio limiter
+        return self.inner.invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs):
+        est = estimate_tokens(input) + EXPECTED_OUTPUT_TOKENS
+        for attempt in range(LLM_POOL_RETRIES + 1):
+            await self.slot.acquire(est)
+            try:
+                result = await self.inner.ainvoke(input, config, **kwargs)
+            except Exception as e:
+                if _is_rate_limit(e) and attempt < LLM_POOL_RETRIES:
+                    self.slot.on_rate_limited()
+                    continue
+                self.slot.errors += 1
+                raise
+            finally:
+                self.slot.release()
+            self.slot.on_success(estimate_tokens(input) + estimate_tokens(result), est)
+            return result
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs) -> AsyncIterator:
+        est = estimate_tokens(input) + EXPECTED_OUTPUT_TOKENS
+        for attempt in range(LLM_POOL_RETRIES + 1):
+            await self.slot.acquire(est)
+            out_chars, started = 0, False
+            try:
+                async for chunk in self.inner.astream(input, config, **kwargs):
+                    started = True
+                    out_chars += len(str(getattr(chunk, "content", chunk)))
+                    yield chunk
+            except Exception as e:
+                # Once output has reached the caller a retry would duplicate it
+                if _is_rate_limit(e) and not started and attempt < LLM_POOL_RETRIES:
+                    self.slot.on_rate_limited()
+                    continue
+                self.slot.errors += 1
+                raise
+            finally:
+                self.slot.release()
+            self.slot.on_success(estimate_tokens(input) + out_chars // 4, est)
+            return
+
+
+class MeteredLLM(Runnable):
+    """Records latency and estimated prompt/completion tokens per role."""
+
+    def __init__(self, inner: Runnable, role: str, model_id: str):
+        self.inner = inner
+        self.labels = {"role": role, "model": model_id}
+
+    def _record(self, input: Any, out_tokens: int, started: float) -> None:
+        metrics.llm_seconds.observe(time.perf_counter() - started, **self.labels)
+        metrics.llm_tokens.observe(estimate_tokens(input), kind="prompt", **self.labels)
+        metrics.llm_tokens.observe(out_tokens, kind="completion", **self.labels)
+
+    def invoke(self, input: Any, config: RunnableConfig | None = None, **kwargs):
+        started = time.perf_counter()
+        result = self.inner.invoke(input, config, **kwargs)
+        self._record(input, estimate_tokens(result), started)
+        return result
+
+    async def ainvoke(self, input: Any, config: RunnableConfig | None = None, **kwargs):
+        started = time.perf_counter()
+        result = await self.inner.ainvoke(input, config, **kwargs)
+        self._record(input, estimate_tokens(result), started)
+        return result
+
+    async def astream(self, input: Any, config: RunnableConfig | None = None, **kwargs) -> AsyncIterator:
+        started, out_chars = time.perf_counter(), 0
+        async for chunk in self.inner.astream(input, config, **kwargs):
+            out_chars += len(str(getattr(chunk, "content", chunk)))
+            yield chunk
+        self._record(input, max(1, out_chars // 4), started)
+
+
+class ClientPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: dict[tuple, Any] = {}
+        self._slots: dict[str, ModelSlot] = {}
+
+    def slot(self, model_id: str) -> ModelSlot:
+        from gemini_config import get_limits_for
+
+        with self._lock:
+            slot = self._slots.get(model_id)
+            if slot is None:
+                slot = self._slots[model_id] = ModelSlot(model_id, **get_limits_for(model_id))
+            return slot
+
+    def client(self, model_id: str, *, api_key: str, temperature: float, streaming: bool) -> RateLimitedLLM:
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        key = (model_id, temperature, streaming)
+        with self._lock:
+            client = self._clients.get(key)
+        if client is None:
+            raw = ChatGoogleGenerativeAI(
+                model=model_id,
+                api_key=api_key,
+                temperature=temperature,
+                streaming=streaming,
+            )
+            client = RateLimitedLLM(raw, self.slot(model_id))
+            with self._lock:
+                client = self._clients.setdefault(key, client)
+        return client
+
+    def stats(self) -> dict:
+        with self._lock:
+            slots = dict(self._slots)
+        return {"clients": len(self._clients), "models": {m: s.stats() for m, s in slots.items()}}
+
+
+pool = ClientPool()
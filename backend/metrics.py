@@ -0,0 +1,244 @@
+"""
+In-process metrics in Prometheus text format.
+---------------------------------------------
+A small registry of counters, gauges and histograms with labels, rendered
+by `/metrics`. No client library needed. Instrumented code records into
+the module-level metrics below; subsystems that already keep their own
+counters (LLM cache, pub cache, workspace pool, build queue) are read at
+scrape time through collectors.
+
+Worker processes (job_workers) dump their counters and histograms to
+METRICS_DIR/<pid>.json; the API process adds those into what it serves,
+so stage and build metrics from workers show up in one scrape.
+
+    with metrics.flutter_seconds.time(command="build_web"):
+        ...
+    metrics.llm_tokens.observe(812, role="codewriter", model=m, kind="prompt")
+"""
+from __future__ import annotations
+import json, os, threading, time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterable
+
+ROOT = Path(__file__).parent.resolve()
+METRICS_DIR = Path(os.getenv("METRICS_DIR", ROOT / ".cache" / "metrics"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+Sample = tuple[dict, float]  # (labels, value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels: dict, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in labels.items()]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _num(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, by: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + by
+
+    def lines(self, values: dict) -> list[str]:
+        return [f"{self.name}{_labels(dict(zip(self.labelnames, k)))} {_num(v)}" for k, v in sorted(values.items())]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            h = self._values.get(key)
+            if h is None:
+                h = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    h[0][i] += 1
+                    break
+            h[1] += value
+            h[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def lines(self, values: dict) -> list[str]:
+        out = []
+        for key, (counts, total, n) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            running = 0
+            for bound, c in zip(self.buckets, counts):
+                running += c
+                le = _labels(labels, 'le="%s"' % _num(bound))
+                out.append(f"{self.name}_bucket{le} {running}")
+            le = _labels(labels, 'le="+Inf"')
+            out.append(f"{self.name}_bucket{le} {n}")
+            out.append(f"{self.name}_sum{_labels(labels)} {_num(round(total, 6))}")
+            out.append(f"{self.name}_count{_labels(labels)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+        self._collectors: list[Callable[[], Iterable[tuple[str, str, str, list[Sample]]]]] = []
+
+    def _add(self, metric: _Metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn: Callable[[], Iterable[tuple[str, str, str, list[Sample]]]]) -> None:
+        """`fn()` yields `(name, kind, help, [(labels, value), ...])` at scrape time."""
+        self._collectors.append(fn)
+
+    # ------------------------------------------------------------------
+    # Cross-process
+    # ------------------------------------------------------------------
+    def snapshot(self) -> dict:
+        out = {}
+        for m in self._metrics.values():
+            if m.kind == "gauge":
+                continue  # a worker's gauges mean nothing once summed
+            with m._lock:
+                out[m.name] = [[list(k), json.loads(json.dumps(v))] for k, v in m._values.items()]
+        return out
+
+    def dump(self, directory: Path = METRICS_DIR) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        tmp = directory / f".{os.getpid()}.tmp"
+        tmp.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp, directory / f"{os.getpid()}.json")
+
+    @staticmethod
+    def _dumps(directory: Path | None) -> list[dict]:
+        if directory is None:
+            return []
+        out = []
+        for f in directory.glob("*.json"):
+            if f.stem == str(os.getpid()):
+                continue
+            try:
+                out.append(json.loads(f.read_text()))
+            except (OSError, ValueError):
+                continue
+        return out
+
+    def _merged(self, m: _Metric, others: list[dict]) -> dict:
+        with m._lock:
+            values = {k: json.loads(json.dumps(v)) for k, v in m._values.items()}
+        if m.kind == "gauge":
+            return values
+        for other in others:
+            for key, v in other.get(m.name, []):
+                key = tuple(key)
+                if m.kind == "counter":
+                    values[key] = values.get(key, 0) + v
+                elif key not in values:
+                    values[key] = v
+                else:
+                    mine = values[key]
+                    mine[0] = [a + b for a, b in zip(mine[0], v[0])]
+                    mine[1] += v[1]
+                    mine[2] += v[2]
+        return values
+
+    # ------------------------------------------------------------------
+    # Exposition
+    # ------------------------------------------------------------------
+    def render(self, directory: Path | None = None) -> str:
+        """Exposition text; with `directory`, other processes' dumps are added in."""
+        others = self._dumps(directory)
+        lines: list[str] = []
+        for m in self._metrics.values():
+            lines += m.header() + m.lines(self._merged(m, others))
+        for fn in self._collectors:
+            try:
+                families = list(fn())
+            except Exception as e:
+                lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {_escape(e)}")
+                continue
+            for name, kind, help, samples in families:
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{_labels(labels)} {_num(value)}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# -------------------------------------------------------------------------
+# Metrics
+# -------------------------------------------------------------------------
+http_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP handler latency (until response headers)", ("method", "route", "status"))
+stage_seconds = registry.histogram(
+    "agent_stage_duration_seconds", "Design pipeline stage latency", ("stage",))
+llm_seconds = registry.histogram(
+    "llm_call_duration_seconds", "LLM call latency, cache hits included", ("role", "model"))
+llm_tokens = registry.histogram(
+    "llm_tokens", "Estimated tokens per LLM call", ("role", "model", "kind"), TOKEN_BUCKETS)
+flutter_seconds = registry.histogram(
+    "flutter_command_duration_seconds", "flutter pub get / build web duration", ("command", "outcome"))
+builds = registry.counter("builds_total", "Build requests by result", ("result",))
+preview_bytes = registry.counter("preview_bytes_total", "Preview bytes served", ("encoding",))
+preview_responses = registry.counter("preview_responses_total", "Preview responses", ("status",))
+files_written = registry.counter("workspace_files_written_total", "Files written through write_files")
+bytes_written = registry.counter("workspace_bytes_written_total", "Bytes written through write_files")
@@ -0,0 +1,191 @@
+"""
+Preview static layer.
+---------------------
+- `precompress()` runs once per build: it writes .gz (and .br when the
+  `brotli` package is installed) siblings for text/wasm assets and a
+  manifest of strong ETags, so requests never hash or compress anything
+- index.html with the rewritten `<base href>` is kept in an LRU keyed by
+  (workspace, build id)
+- `resolve()` honors Accept-Encoding and If-None-Match; content-hashed
+  asset names are served `immutable`, everything else revalidates. It
+  stats and reads files, so the server calls it on the workspace I/O pool;
+  the caches are shared between those threads
+"""
+from __future__ import annotations
+import gzip, hashlib, json, mimetypes, os, re, threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+mimetypes.add_type("application/wasm", ".wasm")
+mimetypes.add_type("text/javascript", ".mjs")
+
+MANIFEST = ".preview-manifest.json"
+COMPRESSIBLE = {".js", ".mjs", ".wasm", ".css", ".html", ".json", ".svg", ".map", ".txt", ".otf", ".ttf"}
+MIN_COMPRESS_BYTES = 1024
+INDEX_CACHE_SIZE = int(os.getenv("PREVIEW_INDEX_CACHE", "256"))
+
+HASHED_NAME = re.compile(r"[.-][0-9a-f]{8,}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_index_cache: OrderedDict[tuple[str, str], tuple[bytes, bytes | None, str]] = OrderedDict()
+_manifests: OrderedDict[str, dict] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+@dataclass
+class PreviewResult:
+    status: int = 200
+    path: Path | None = None          # serve from disk …
+    stat: os.stat_result | None = None  # (of `path`, so the response needn't stat again)
+    body: bytes | None = None         # … or from memory
+    media_type: str | None = None
+    headers: dict[str, str] = field(default_factory=dict)
+
+
+# -------------------------------------------------------------------------
+# Build-time work
+# -------------------------------------------------------------------------
+def precompress(out_dir: Path) -> dict:
+    """Write compressed variants and the ETag manifest for a finished build."""
+    manifest: dict[str, dict] = {}
+    for f in sorted(out_dir.rglob("*")):
+        if not f.is_file() or f.name == MANIFEST or f.suffix in (".gz", ".br"):
+            continue
+        data = f.read_bytes()
+        entry = {"etag": hashlib.sha256(data).hexdigest()[:32], "size": len(data)}
+        if f.suffix in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+            gz = gzip.compress(data, compresslevel=9, mtime=0)
+            if len(gz) < len(data):
+                f.with_name(f.name + ".gz").write_bytes(gz)
+                entry["gzip"] = len(gz)
+            if brotli is not None:
+                br = brotli.compress(data, quality=11)
+                if len(br) < len(data):
+                    f.with_name(f.name + ".br").write_bytes(br)
+                    entry["br"] = len(br)
+        manifest[f.relative_to(out_dir).as_posix()] = entry
+    (out_dir / MANIFEST).write_text(json.dumps(manifest))
+    return manifest
+
+
+# -------------------------------------------------------------------------
+# Request-time lookup
+# -------------------------------------------------------------------------
+def _remember(cache: OrderedDict, key, value):
+    with _cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > INDEX_CACHE_SIZE:
+            cache.popitem(last=False)
+    return value
+
+
+def _recall(cache: OrderedDict, key):
+    with _cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+
+def _manifest(web_dir: Path) -> tuple[str, dict]:
+    """(build id, manifest) for the build currently behind build/web."""
+    try:
+        build_id = os.readlink(web_dir)
+    except OSError:
+        # Not a swapped build; key on the directory mtime instead
+        build_id = f"legacy-{web_dir.stat().st_mtime_ns}"
+    key = f"{web_dir}:{build_id}"
+    cached = _recall(_manifests, key)
+    if cached is not None:
+        return build_id, cached
+    try:
+        manifest = json.loads((web_dir / MANIFEST).read_text())
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+    return build_id, _remember(_manifests, key, manifest)
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() in (coding, "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+def _not_modified(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {t.strip() for t in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def _render_index(wid: str, index: Path) -> bytes:
+    html = index.read_text()
+    base_href = f'/preview/{wid}/build/web/'
+    if '<base href="' in html:
+        html = re.sub(r'<base href="[^"]*">', f'<base href="{base_href}">', html)
+    else:
+        html = html.replace("<head>", f"<head><base href='{base_href}'>")
+    return html.encode()
+
+
+def resolve(wid: str, base: Path, path: str, accept_encoding: str = "",
+            if_none_match: str | None = None) -> PreviewResult:
+    web_dir = base / "build" / "web"
+    rel = path or "index.html"
+    target = web_dir / rel
+    if Path(rel).is_absolute() or ".." in Path(rel).parts or not target.is_file():
+        return PreviewResult(404, body=b"Not Found", media_type="text/plain")
+
+    build_id, manifest = _manifest(web_dir)
+
+    # Inject correct <base href> into index.html
+    if rel == "index.html":
+        key = (wid, build_id)
+        cached = _recall(_index_cache, key)
+        if cached is None:
+            html = _render_index(wid, target)
+            gz = gzip.compress(html, mtime=0) if len(html) >= MIN_COMPRESS_BYTES else None
+            cached = _remember(_index_cache, key, (html, gz, f'"{hashlib.sha256(html).hexdigest()[:32]}"'))
+        html, gz, etag = cached
+        headers = {"ETag": etag, "Cache-Control": REVALIDATE, "Vary": "Accept-Encoding"}
+        if _not_modified(if_none_match, etag):
+            return PreviewResult(304, headers=headers)
+        if gz is not None and _accepts(accept_encoding, "gzip"):
+            return PreviewResult(body=gz, media_type="text/html",
+                                 headers={**headers, "Content-Encoding": "gzip"})
+        return PreviewResult(body=html, media_type="text/html", headers=headers)
+
+    entry = manifest.get(rel)
+    st = None
+    if entry:
+        etag = f'"{entry["etag"]}"'
+    else:
+        st = target.stat()
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE if HASHED_NAME.search(rel) else REVALIDATE,
+    }
+    media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+    if entry and ("br" in entry or "gzip" in entry):
+        headers["Vary"] = "Accept-Encoding"
+    if _not_modified(if_none_match, etag):
+        return PreviewResult(304, headers=headers)
+
+    if entry:
+        for coding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if coding in entry and _accepts(accept_encoding, coding):
+                variant = target.with_name(target.name + suffix)
+                return PreviewResult(path=variant, stat=variant.stat(), media_type=media_type,
+                                     headers={**headers, "Content-Encoding": coding})
+    return PreviewResult(path=target, stat=st or target.stat(), media_type=media_type, headers=headers)
@@ -0,0 +1,97 @@
+"""
+Opt-in sampling profiler for single requests.
+---------------------------------------------
+With PROFILER=true, a request carrying `?profile=1` (or `X-Profile: 1`) is
+sampled every PROFILE_INTERVAL seconds while its handler runs. The
+response gets an `X-Profile` header pointing at
+`/debug/profiles/<id>`, which returns folded stacks:
+
+    server.py:generate;generation_jobs.py:submit;... 12
+
+one line per distinct stack with its sample count, ready for
+flamegraph.pl, inferno or speedscope. Every thread is sampled (sync
+handlers run on the threadpool, LLM and file work on `to_thread`), but
+only stacks passing through backend code are kept, which drops idle
+event-loop and pool threads. Concurrent requests show up too, so profile
+on a quiet server. The last PROFILE_KEEP profiles are kept in memory.
+"""
+from __future__ import annotations
+import os, sys, threading, time, uuid
+from collections import Counter, OrderedDict
+from pathlib import Path
+
+ROOT = str(Path(__file__).parent.resolve())
+PROFILER_ENABLED = os.getenv("PROFILER", "false").lower() == "true"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+_profiles: OrderedDict[str, dict] = OrderedDict()
+_lock = threading.Lock()
+
+
+def _ours(filename: str) -> bool:
+    return filename.startswith(ROOT) and "site-packages" not in filename
+
+
+class Sampler:
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.started = time.time()
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> Counter[str]:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        me = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                names, ours = [], False
+                while frame is not None:
+                    code = frame.f_code
+                    ours = ours or _ours(code.co_filename)
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                if ours:
+                    self.stacks[";".join(reversed(names))] += 1
+
+
+def wanted(query: dict, headers: dict) -> bool:
+    return PROFILER_ENABLED and (query.get("profile") == "1" or headers.get("x-profile") == "1")
+
+
+def finish(sampler: Sampler, label: str) -> str:
+    stacks = sampler.stop()
+    profile_id = uuid.uuid4().hex[:12]
+    with _lock:
+        _profiles[profile_id] = {
+            "id": profile_id, "label": label, "started": sampler.started,
+            "duration_s": round(time.time() - sampler.started, 4),
+            "samples": sampler.samples, "interval_s": sampler.interval,
+            "folded": "\n".join(f"{stack} {n}" for stack, n in stacks.most_common()) + "\n",
+        }
+        while len(_profiles) > PROFILE_KEEP:
+            _profiles.popitem(last=False)
+    return profile_id
+
+
+def get(profile_id: str) -> dict | None:
+    with _lock:
+        return _profiles.get(profile_id)
+
+
+def list_profiles() -> list[dict]:
+    with _lock:
+        return [{k: v for k, v in p.items() if k != "folded"} for p in _profiles.values()]
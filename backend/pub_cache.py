@@ -0,0 +1,192 @@
+"""
+Shared pub package cache.
+-------------------------
+All workspaces resolve packages into one `PUB_CACHE` so each package
+version is downloaded and stored once. Writers (`pub get`) hold an
+exclusive file lock on the cache, which also serializes processes.
+
+- PUB_CACHE_DIR   shared cache location (default: backend/.pub-cache)
+- PUB_OFFLINE     "true" → `pub get --offline`
+- PUB_MIRROR_DIR  directory laid out like a pub cache; missing packages are
+                  linked into the shared cache before an offline `pub get`
+- FLUTTER_BIN     flutter command used for every invocation (default
+                  "flutter"; "python tools/fake_flutter.py" for tests)
+
+A workspace can opt out with `set_mode(base, "isolated")`, which keeps
+its cache in `<workspace>/.pub-cache` as before.
+"""
+from __future__ import annotations
+import asyncio, os, shlex, shutil, threading, time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX dev boxes: in-process locking only
+    fcntl = None
+
+ROOT = Path(__file__).parent.resolve()
+SHARED_CACHE = Path(os.getenv("PUB_CACHE_DIR") or os.getenv("PUB_CACHE") or ROOT / ".pub-cache")
+OFFLINE = os.getenv("PUB_OFFLINE", "false").lower() == "true"
+MIRROR_DIR = Path(os.environ["PUB_MIRROR_DIR"]) if os.getenv("PUB_MIRROR_DIR") else None
+# Relative script paths are taken from the backend dir, since commands run in workspaces
+FLUTTER_BIN = [str(ROOT / a) if not os.path.isabs(a) and (ROOT / a).is_file() else a
+               for a in shlex.split(os.getenv("FLUTTER_BIN", "flutter"))]
+
+MODE_FILE = ".pub-cache-mode"
+MODES = ("shared", "isolated")
+_SIZE_TTL = 30.0
+
+_stats_lock = threading.Lock()
+_stats = {"pub_gets": 0, "hits": 0, "misses": 0, "packages_downloaded": 0,
+          "packages_from_mirror": 0, "lock_wait_s": 0.0}
+_size_cache: dict[Path, tuple[float, int, int]] = {}
+
+
+# -------------------------------------------------------------------------
+# Per-workspace selection
+# -------------------------------------------------------------------------
+def get_mode(base: Path) -> str:
+    try:
+        mode = (base / MODE_FILE).read_text().strip()
+    except FileNotFoundError:
+        return "shared"
+    return mode if mode in MODES else "shared"
+
+
+def set_mode(base: Path, mode: str) -> None:
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    (base / MODE_FILE).write_text(mode)
+
+
+def cache_dir_for(base: Path) -> Path:
+    return base / ".pub-cache" if get_mode(base) == "isolated" else SHARED_CACHE
+
+
+def env_for(base: Path) -> dict:
+    env = os.environ.copy()
+    env["PUB_CACHE"] = str(cache_dir_for(base))
+    return env
+
+
+def pub_get_cmd() -> list[str]:
+    return [*FLUTTER_BIN, "pub", "get"] + (["--offline"] if OFFLINE else [])
+
+
+# -------------------------------------------------------------------------
+# Locking
+# -------------------------------------------------------------------------
+def _open_lock(cache: Path):
+    cache.mkdir(parents=True, exist_ok=True)
+    return open(cache / ".lock", "a+")
+
+
+@contextmanager
+def locked(cache: Path):
+    """Exclusive write lock on `cache` (blocking)."""
+    started = time.perf_counter()
+    with _open_lock(cache) as fh:
+        if fcntl:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+        _bump("lock_wait_s", time.perf_counter() - started)
+        try:
+            yield cache
+        finally:
+            if fcntl:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+@asynccontextmanager
+async def alocked(cache: Path):
+    """Exclusive write lock on `cache` without blocking the event loop."""
+    started = time.perf_counter()
+    fh = await asyncio.to_thread(_open_lock, cache)
+    try:
+        while fcntl:
+            try:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(0.1)
+        _bump("lock_wait_s", time.perf_counter() - started)
+        yield cache
+    finally:
+        fh.close()  # closing the descriptor releases the flock
+
+
+# -------------------------------------------------------------------------
+# Mirror + accounting
+# -------------------------------------------------------------------------
+def _bump(key: str, by: float = 1) -> None:
+    with _stats_lock:
+        _stats[key] += by
+
+
+def packages(cache: Path) -> set[str]:
+    """Package directories (`hosted/<host>/<name>-<version>`) present in `cache`."""
+    hosted = cache / "hosted"
+    if not hosted.is_dir():
+        return set()
+    return {f"{host.name}/{pkg.name}" for host in hosted.iterdir() if host.is_dir()
+            for pkg in host.iterdir() if pkg.is_dir()}
+
+
+def seed_from_mirror(cache: Path) -> int:
+    """Link packages from MIRROR_DIR that the cache doesn't have yet. Call under `locked`."""
+    if not MIRROR_DIR or not MIRROR_DIR.is_dir():
+        return 0
+
+    def _link(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    missing = packages(MIRROR_DIR) - packages(cache)
+    for rel in missing:
+        shutil.copytree(MIRROR_DIR / "hosted" / rel, cache / "hosted" / rel,
+                        copy_function=_link, dirs_exist_ok=True)
+    _bump("packages_from_mirror", len(missing))
+    return len(missing)
+
+
+def record_pub_get(before: set[str], after: set[str]) -> None:
+    downloaded = len(after - before)
+    _bump("pub_gets")
+    _bump("misses" if downloaded else "hits")
+    _bump("packages_downloaded", downloaded)
+
+
+def _dir_size(path: Path) -> tuple[int, int]:
+    total, files = 0, 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+                files += 1
+            except OSError:
+                pass
+    return total, files
+
+
+def stats() -> dict:
+    now = time.monotonic()
+    cached = _size_cache.get(SHARED_CACHE)
+    if not cached or now - cached[0] > _SIZE_TTL:
+        cached = (now, *_dir_size(SHARED_CACHE))
+        _size_cache[SHARED_CACHE] = cached
+    with _stats_lock:
+        s = dict(_stats)
+    runs = s["hits"] + s["misses"]
+    return {
+        "path": str(SHARED_CACHE),
+        "offline": OFFLINE,
+        "mirror": str(MIRROR_DIR) if MIRROR_DIR else None,
+        "size_bytes": cached[1],
+        "files": cached[2],
+        "packages": len(packages(SHARED_CACHE)),
+        **s,
+        "lock_wait_s": round(s["lock_wait_s"], 3),
+        "hit_rate": round(s["hits"] / runs, 4) if runs else None,
+    }
@@ -6,13 +6,23 @@ from fastapi import FastAPI, HTTPException
 # from gemini_config import get_llm
 # from ai_agents.coordinator import CoordinatorAgent
 from fastapi import FastAPI, HTTPException, Query, Request
-from fastapi.responses import JSONResponse, StreamingResponse, FileResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 import re
 from fastapi.responses import Response
 import workspace as ws
+from build_scheduler import scheduler as build_scheduler
+import preview
+import pub_cache
+from workspace_pool import pool as workspace_pool
+import job_workers
+import workspace_lifecycle
+import metrics
+import profiler
+import speculative
+import time
 
 app = FastAPI()
 app.add_middleware(
@@ -21,133 +31,583 @@ app.add_middleware(
     allow_methods=["*"], allow_headers=["*"],
 )
 
-# Serve built previews from /workspaces/<id>/build/web
+@app.middleware("http")
+async def _instrument(request: Request, call_next):
+    # Route templates, not raw paths, keep label cardinality bounded
+    sampler = profiler.Sampler().start() if profiler.wanted(request.query_params, request.headers) else None
+    started, status = time.perf_counter(), 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.http_seconds.observe(time.perf_counter() - started,
+                                     method=request.method, route=route, status=status)
+        profile_id = profiler.finish(sampler, f"{request.method} {route}") if sampler else None
+    if profile_id:
+        response.headers["X-Profile"] = f"/debug/profiles/{profile_id}"
+    return response
 
+def _collect():
+    """Counters other modules already keep, read at scrape time."""
+    import llm_cache
+    from llm_pool import pool as llm_pool
+    cache = llm_cache._cache
+    if cache is not None:
+        c = cache.stats()
+        yield ("llm_cache_lookups_total", "counter", "LLM response cache lookups",
+               [({"result": k}, c[k]) for k in ("hits_memory", "hits_disk", "misses", "bypassed")])
+        yield ("llm_cache_latency_saved_seconds_total", "counter", "LLM latency avoided by cache hits",
+               [({}, c["latency_saved_s"])])
+    p = pub_cache.stats()
+    yield ("pub_get_total", "counter", "pub get runs by cache outcome",
+           [({"result": "hit"}, p["hits"]), ({"result": "miss"}, p["misses"])])
+    w = workspace_pool.stats()
+    yield ("workspace_pool_claims_total", "counter", "Workspace claims",
+           [({"result": "hit"}, w["hits"]), ({"result": "miss"}, w["misses"])])
+    yield ("workspace_pool_ready", "gauge", "Pre-warmed workspaces ready", [({}, w["ready"])])
+    b = build_scheduler.stats()
+    yield ("build_queue", "gauge", "Builds in this process",
+           [({"state": "queued"}, b["queued"]), ({"state": "running"}, b["running"])])
+    models = llm_pool.stats()["models"]
+    yield ("llm_pool_in_flight", "gauge", "LLM calls in flight per model",
+           [({"model": m}, s["in_flight"]) for m, s in models.items()])
+    yield ("llm_pool_queue_depth", "gauge", "LLM calls waiting for a slot per model",
+           [({"model": m}, s["queue_depth"]) for m, s in models.items()])
+    io = ws.io_stats()
+    yield ("workspace_io_tasks", "gauge", "Calls on the workspace I/O pool",
+           [({"state": "queued"}, io["queued"]), ({"state": "running"}, io["running"])])
+    if speculative._index is not None:
+        sp = speculative._index.stats()
+        yield ("speculative_lookups_total", "counter", "Draft lookups for vision/UX",
+               [({"result": "exact"}, sp["exact_hits"]), ({"result": "similar"}, sp["hits"] - sp["exact_hits"]),
+                ({"result": "miss"}, sp["misses"])])
+    lc = workspace_lifecycle.stats()
+    yield ("workspace_reclaimed_bytes_total", "counter", "Bytes reclaimed by eviction and archiving",
+           [({"how": "evict"}, lc["reclaimed_evict_bytes"]), ({"how": "archive"}, lc["reclaimed_archive_bytes"])])
 
-@app.get("/preview/{wid}/build/web/{path:path}")
-async def serve_preview_file(wid: str, path: str = "index.html"):
-    base = ws.ensure_workspace(wid)
-    file_path = base / "build" / "web" / path
+metrics.registry.collector(_collect)
 
-    if not file_path.exists():
-        return Response("Not Found", status_code=404)
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus text exposition; worker-process metrics included."""
+    text = metrics.registry.render(metrics.METRICS_DIR if job_workers.enabled() else None)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profiles")
+def list_profiles():
+    return {"enabled": profiler.PROFILER_ENABLED, "profiles": profiler.list_profiles()}
+
+@app.get("/debug/profiles/{profile_id}")
+def get_profile(profile_id: str):
+    """Folded stacks (`frame;frame;... count`) for flamegraph.pl or speedscope."""
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(404, "profile not found")
+    return PlainTextResponse(profile["folded"])
+
+@app.on_event("startup")
+def _start_pool():
+    workspace_pool.start()
+    job_workers.pool.start()
+    workspace_lifecycle.sweeper.start()
 
-    # Inject correct <base href> into index.html
-    if path == "" or path == "index.html":
-        html = file_path.read_text()
-        base_href = f'/preview/{wid}/build/web/'
-        if '<base href="' in html:
-            html = re.sub(r'<base href="[^"]*">', f'<base href="{base_href}">', html)
-        else:
-            html = html.replace("<head>", f"<head><base href='{base_href}'>")
+@app.on_event("startup")
+async def _warm_up_drafts():
+    if speculative.SPECULATIVE_ENABLED and speculative.SPECULATIVE_WARMUP_ON_START:
+        from ai_agents.coordinator import CoordinatorAgent
+        speculative.spawn(CoordinatorAgent().warm_up())
 
-        return Response(html, media_type="text/html")
+@app.on_event("shutdown")
+def _stop_pool():
+    workspace_pool.stop()
+    job_workers.pool.stop()
+    workspace_lifecycle.sweeper.stop()
+
+# Serve built previews from /workspaces/<id>/build/web
+
+
+@app.get("/preview/{wid}/build/web/{path:path}")
+async def serve_preview_file(wid: str, request: Request, path: str = "index.html"):
+    # Every filesystem touch (rehydrate, stat, manifest, index.html) happens
+    # on the workspace I/O pool; FileResponse streams the body off-loop too
+    try:
+        base = await ws.aensure_workspace(wid)
+    except FileNotFoundError:
+        return Response("Not Found", status_code=404)
 
-    # Proper static file serving
-    return FileResponse(str(file_path))
+    res = await ws.run_io(
+        preview.resolve, wid, base, path,
+        accept_encoding=request.headers.get("accept-encoding", ""),
+        if_none_match=request.headers.get("if-none-match"),
+    )
+    encoding = res.headers.get("Content-Encoding", "identity")
+    metrics.preview_responses.inc(status=res.status)
+    if res.path is not None:
+        metrics.preview_bytes.inc(res.stat.st_size, encoding=encoding)
+        return FileResponse(str(res.path), media_type=res.media_type, headers=res.headers,
+                            stat_result=res.stat)
+    metrics.preview_bytes.inc(len(res.body or b""), encoding=encoding)
+    return Response(res.body or b"", status_code=res.status,
+                    media_type=res.media_type, headers=res.headers)
 
 class FilePatch(BaseModel):
     path: str
     content: str
 
 @app.post("/api/workspaces")
-def create_workspace():
-    created = ws.new_workspace()
+async def create_workspace():
+    created = await ws.run_io(workspace_pool.claim)
     return {"workspaceId": created["id"]}
 
+@app.get("/api/workspace-pool/stats")
+def workspace_pool_stats():
+    return workspace_pool.stats()
+
+@app.get("/api/workspace-lifecycle/stats")
+def workspace_lifecycle_stats():
+    """Evictions, archives, reclaimed bytes and rehydration latency."""
+    return {**workspace_lifecycle.stats(), "last_sweep": workspace_lifecycle.sweeper.last_report}
+
+@app.post("/api/workspace-lifecycle/sweep")
+async def workspace_lifecycle_sweep():
+    return await ws.run_io(workspace_lifecycle.sweep)
+
+@app.post("/api/workspaces/{wid}/archive")
+async def archive_workspace(wid: str):
+    """Archive now; the next access rehydrates it."""
+    try:
+        return {"archived": wid, "reclaimed_bytes": await ws.run_io(workspace_lifecycle.archive, wid)}
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+    except workspace_lifecycle.WorkspaceBusy as e:
+        raise HTTPException(409, str(e))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
 @app.get("/api/workspaces/{wid}")
-def get_tree(wid: str):
+async def get_tree(wid: str):
+    try:
+        return {"files": await ws.alist_tree(wid)}
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+
+@app.get("/api/workspaces/{wid}/tree")
+async def get_tree_level(wid: str, dir: str = "", offset: int = 0, limit: int = Query(500, le=5000)):
+    try:
+        return await ws.alist_dir(wid, dir, offset, limit)
+    except FileNotFoundError:
+        raise HTTPException(404, "directory not found")
+    except ValueError:
+        raise HTTPException(400, "invalid path")
+
+@app.get("/api/workspaces/{wid}/tree/changes")
+async def get_tree_changes(wid: str, since: int = 0):
+    try:
+        return await ws.atree_changes(wid, since)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+
+@app.get("/api/workspaces/{wid}/usage")
+async def get_usage(wid: str):
     try:
-        return {"files": ws.list_tree(wid)}
+        return await ws.adisk_usage(wid)
     except FileNotFoundError:
         raise HTTPException(404, "workspace not found")
 
+class PubCacheMode(BaseModel):
+    mode: str
+
+@app.put("/api/workspaces/{wid}/pub-cache")
+async def put_pub_cache_mode(wid: str, body: PubCacheMode):
+    try:
+        await ws.run_io(pub_cache.set_mode, await ws.aensure_workspace(wid), body.mode)
+        return {"mode": body.mode}
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@app.get("/api/pub-cache/stats")
+def pub_cache_stats():
+    return pub_cache.stats()
+
 @app.get("/api/workspaces/{wid}/file")
-def get_file(wid: str, path: str = Query(...)):
+async def get_file(wid: str, path: str = Query(...)):
     try:
-        return {"path": path, "content": ws.read_file(wid, path)}
+        return {"path": path, "content": await ws.aread_file(wid, path)}
     except FileNotFoundError:
         raise HTTPException(404, "file not found")
+    except UnicodeDecodeError:
+        raise HTTPException(415, "not a UTF-8 text file")
     except ValueError:
         raise HTTPException(400, "invalid path")
 
 @app.put("/api/workspaces/{wid}/file")
-def put_file(wid: str, patch: FilePatch):
+async def put_file(wid: str, patch: FilePatch, durability: str = "per-file"):
+    if durability not in ws.DURABILITY:
+        raise HTTPException(400, f"durability must be one of {ws.DURABILITY}")
     try:
-        ws.write_file(wid, patch.path, patch.content)
+        await ws.awrite_file(wid, patch.path, patch.content, durability)
         return {"ok": True}
     except FileNotFoundError:
         raise HTTPException(404, "workspace not found")
     except ValueError:
         raise HTTPException(400, "invalid path")
+    except workspace_lifecycle.QuotaExceeded as e:
+        raise HTTPException(507, str(e))
 
-def _flutter_env(base: Path) -> dict:
-    env = os.environ.copy()
-    # Optional: speed up pub
-    env.setdefault("PUB_CACHE", str(base / ".pub-cache"))
-    return env
-
-async def _stream_process(cmd, cwd: Path):
-    proc = await asyncio.create_subprocess_exec(
-        *cmd, cwd=str(cwd),
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.STDOUT,
-        env=_flutter_env(cwd),
-    )
-    assert proc.stdout
+class FileBatch(BaseModel):
+    files: list[FilePatch]
+    durability: str = "batch"
+
+class ReadBatch(BaseModel):
+    paths: list[str]
+
+@app.put("/api/workspaces/{wid}/files")
+async def put_files(wid: str, batch: FileBatch):
     try:
-        while True:
-            line = await proc.stdout.readline()
-            if not line:
-                break
-            yield f"data: {line.decode(errors='ignore').rstrip()}\n\n"
-    finally:
-        await proc.wait()
-        yield f"data: __EXIT__ {proc.returncode}\n\n"
+        written = await ws.awrite_files(wid, [(p.path, p.content) for p in batch.files], batch.durability)
+        return {"ok": True, "written": written}
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except workspace_lifecycle.QuotaExceeded as e:
+        raise HTTPException(507, str(e))
+
+@app.post("/api/workspaces/{wid}/files/read")
+async def read_files(wid: str, batch: ReadBatch):
+    try:
+        return await ws.aread_files(wid, batch.paths)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+
+class SnapshotPayload(BaseModel):
+    label: str = "manual"
+
+@app.get("/api/workspaces/{wid}/snapshots")
+async def list_snapshots(wid: str, limit: int = Query(100, le=1000)):
+    """Snapshots, newest first. Every file write records one."""
+    try:
+        return await ws.alist_snapshots(wid, limit)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+
+@app.post("/api/workspaces/{wid}/snapshots")
+async def take_snapshot(wid: str, body: SnapshotPayload = SnapshotPayload()):
+    try:
+        return {"snapshot": await ws.atake_snapshot(wid, body.label)}
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+
+@app.get("/api/workspaces/{wid}/snapshots/diff")
+async def diff_snapshots(wid: str, a: int = Query(..., alias="from"), b: Optional[int] = Query(None, alias="to"),
+                         patch: bool = False):
+    """Paths added/modified/deleted from snapshot `from` to `to` (default: the files now)."""
+    try:
+        return await ws.adiff_snapshots(wid, a, b, patch)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+    except KeyError as e:
+        raise HTTPException(404, e.args[0])
+
+@app.post("/api/workspaces/{wid}/snapshots/{snap_id}/restore")
+async def restore_snapshot(wid: str, snap_id: int):
+    """Rewrite only the files that differ from the snapshot; recorded as a new snapshot."""
+    try:
+        return await ws.arestore_snapshot(wid, snap_id)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+    except KeyError as e:
+        raise HTTPException(404, e.args[0])
+
+@app.get("/api/workspaces/{wid}/build/changes")
+async def build_changes(wid: str):
+    """Source files changed since the last successful build."""
+    import build_manager
+    try:
+        base = await ws.aensure_workspace(wid)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+
+    def changes():
+        state = build_manager.load_state(base)
+        build_manager.source_fingerprint(base)  # brings the snapshot head up to date
+        return {"build_id": state.get("build_id"), "changes": build_manager.changed_since_build(base, state)}
+    return await ws.run_io(changes)
 
 @app.post("/api/workspaces/{wid}/build")
 async def build_web(wid: str):
-    base = ws.ensure_workspace(wid)
-    # Clean previous build to avoid stale
-    out = base / "build" / "web"
-    if out.exists():
-        shutil.rmtree(out, ignore_errors=True)
+    try:
+        await ws.aensure_workspace(wid)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+    # The previous build keeps serving until the new one is swapped in
 
     # Prepare SSE URL for logs and preview URL
     logs_url = f"/api/workspaces/{wid}/build/logs"
     preview_url = f"/preview/{wid}/build/web/index.html"
     return {"logs": logs_url, "preview": preview_url}
 
+@app.get("/api/builds/stats")
+async def build_stats():
+    return build_scheduler.stats()
+
+@app.get("/api/builds/{job_id}")
+async def get_build(job_id: str, after: int = 0):
+    """Status and buffered log of a running or recently finished build."""
+    job = build_scheduler.get(job_id)
+    if job is None:
+        raise HTTPException(404, "build not found")
+    lines = [{"seq": seq, "line": line} for seq, line in job.lines_after(after)]
+    return {**job.info(), "lines": lines}
+
+@app.get("/api/workspaces/{wid}/build/jobs")
+async def list_builds(wid: str):
+    return {"jobs": [j.info() for j in build_scheduler.jobs_for(wid)]}
+
 @app.get("/api/workspaces/{wid}/build/logs")
-async def build_logs(wid: str):
+async def build_logs(wid: str, request: Request):
     """
     Server-Sent Events (EventSource) endpoint.
-    Triggers `flutter build web` and streams logs.
+    Queues an incremental `flutter build web` and streams its logs.
+    Event ids are `<job id>:<seq>`; a reconnect carrying `Last-Event-ID`
+    resumes that job's log instead of starting another build. With job
+    workers the log comes from the workspace's queued job instead.
     """
-    base = ws.ensure_workspace(wid)
+    try:
+        base = await ws.aensure_workspace(wid)
+    except FileNotFoundError:
+        raise HTTPException(404, "workspace not found")
+    job, after = None, 0
+    job_id, _, seq = request.headers.get("last-event-id", "").partition(":")
+    if job_workers.enabled():
+        # Builds run in the worker processes; building here as well would race them
+        return StreamingResponse(_stored_build_logs(wid, job_id, int(seq) if seq.isdigit() else 0),
+                                 media_type="text/event-stream")
+    if job_id and seq.isdigit():
+        job, after = build_scheduler.get(job_id), int(seq)
+    if job is None or job.wid != wid:
+        # Joins the workspace's queued/running build if there is one
+        job, after = build_scheduler.submit(wid, base), 0
 
     async def event_gen():
-        # ensure flutter pub get runs first (faster incremental builds)
-        yield "data: Running flutter pub get...\n\n"
-        async for chunk in _stream_process(["flutter", "pub", "get"], cwd=base):
-            yield chunk
+        async for seq, line in build_scheduler.subscribe(job, after):
+            yield f"id: {job.id}:{seq}\ndata: {line}\n\n"
+
+    return StreamingResponse(event_gen(), media_type="text/event-stream")
+@app.get("/api/llm-cache/stats")
+def llm_cache_stats():
+    from llm_cache import get_cache
+    return get_cache().stats()
 
-        yield "data: Building web...\n\n"
-        cmd = ["flutter", "build", "web", "--release", "--pwa-strategy=none"]
-        async for chunk in _stream_process(cmd, cwd=base):
-            yield chunk
+@app.get("/api/speculative/stats")
+def speculative_stats():
+    return {"enabled": speculative.SPECULATIVE_ENABLED, **speculative.get_index().stats()}
 
-        yield "data: Build finished. Open preview URL.\n\n"
+class WarmUpPayload(BaseModel):
+    categories: Optional[list[str]] = None
+    force: bool = False
+
+@app.post("/api/speculative/warm-up", status_code=202)
+async def speculative_warm_up(payload: WarmUpPayload = WarmUpPayload()):
+    """Pre-generate vision/UX drafts in the background (default: SPECULATIVE_WARMUP)."""
+    from ai_agents.coordinator import CoordinatorAgent
+    if not speculative.SPECULATIVE_ENABLED:
+        raise HTTPException(409, "speculative drafts are disabled")
+    categories = payload.categories or speculative.SPECULATIVE_WARMUP
+    speculative.spawn(CoordinatorAgent().warm_up(categories, payload.force))
+    return {"categories": categories, "status": "/api/speculative/stats"}
+
+@app.get("/api/llm-pool/stats")
+def llm_pool_stats():
+    from llm_pool import pool
+    return pool.stats()
+
+@app.get("/api/ai/generate/stream")
+async def generate_stream(prompt: str = Query(..., min_length=1)):
+    """
+    Server-Sent Events endpoint for the design pipeline.
+    Emits `stage_start`, `token`, `stage_done` and a final `done`/`error`
+    event, each with a JSON payload.
+    """
+    # Imported lazily: the agent stack (LangChain, prompts) is slow to import, and
+    # the file and build endpoints shouldn't wait for it at startup
+    from ai_agents.coordinator import CoordinatorAgent
+    coordinator = CoordinatorAgent()
+
+    async def event_gen():
+        async for event in coordinator.stream_design(prompt):
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
 
     return StreamingResponse(event_gen(), media_type="text/event-stream")
-# @app.post("/api/ai/generate")
-# async def generate(payload: dict):
-#     prompt = payload.get("prompt")
-#     if not prompt:
-#         raise HTTPException(400, "Missing 'prompt'")
 
-#     llm = get_llm()
-#     coordinator = CoordinatorAgent(llm)
-#     result = await coordinator.generate_app(prompt)
+class GeneratePayload(BaseModel):
+    prompt: str
+    workspaceId: Optional[str] = None
+
+@app.post("/api/ai/generate", status_code=202)
+async def generate(payload: GeneratePayload):
+    """
+    Start a generate-and-build job: claim a workspace (or use `workspaceId`),
+    run the design pipeline writing files into lib/, then build. The job
+    keeps running if the client goes away; poll the returned status URL.
+    """
+    from generation_jobs import jobs as generation_jobs
+    if not payload.prompt.strip():
+        raise HTTPException(400, "Missing 'prompt'")
+    if payload.workspaceId:
+        try:
+            await ws.aensure_workspace(payload.workspaceId)
+        except FileNotFoundError:
+            raise HTTPException(404, "workspace not found")
+    if job_workers.enabled():
+        return await asyncio.to_thread(
+            _enqueue, JobPayload(kind="generate", prompt=payload.prompt, workspaceId=payload.workspaceId))
+    job = generation_jobs.submit(payload.prompt, payload.workspaceId)
+    return {"jobId": job.id, "status": f"/api/ai/generate/{job.id}", "workspaceId": job.wid}
+
+@app.get("/api/ai/generate/jobs")
+async def list_generation_jobs():
+    from generation_jobs import jobs as generation_jobs
+    return {"jobs": [j.info() for j in generation_jobs.jobs()]}
+
+@app.get("/api/ai/generate/{job_id}")
+async def get_generation_job(job_id: str, after: int = 0):
+    """Job summary, events after sequence `after`, and the design once done."""
+    from generation_jobs import jobs as generation_jobs
+    job = generation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "job not found")
+    out = {**job.info(), "events": job.events_after(after)}
+    if job.done:
+        out["result"] = job.result
+    return out
+
+@app.delete("/api/ai/generate/{job_id}")
+async def cancel_generation_job(job_id: str):
+    from generation_jobs import jobs as generation_jobs
+    job = generation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "job not found")
+    generation_jobs.cancel(job)
+    return {"id": job.id, "state": job.state}
+
+async def _stored_build_logs(wid: str, job_id: str, after: int):
+    """Build log of the workspace's queued job (build or generate-and-build).
+
+    Follows the job named by `Last-Event-ID`, else the one already queued or
+    running on `wid`, else queues a build. Ends with `__EXIT__ <code>` like
+    an in-process build.
+    """
+    from job_store import FINISHED, get_store
+    store = get_store()
+    job = await asyncio.to_thread(store.get, job_id) if job_id else None
+    if job is None or job["workspace"] != wid:
+        job, after = await asyncio.to_thread(store.active_for, wid), 0
+    if job is None:
+        job = await asyncio.to_thread(store.enqueue, "build", {}, wid)
+    exited = False
+    while True:
+        row = await asyncio.to_thread(store.get, job["id"])
+        for event in await asyncio.to_thread(store.events_after, job["id"], after):
+            after = event["seq"]
+            if event["event"] == "log":
+                exited = exited or event["line"].startswith("__EXIT__")
+                yield f"id: {job['id']}:{after}\ndata: {event['line']}\n\n"
+        if row is None or (row["state"] in FINISHED and after >= row["last_seq"]):
+            break
+        await asyncio.sleep(job_workers.JOB_POLL)
+    if not exited:  # the job ended before (or without) its build
+        code = {"done": 0, "cancelled": -1}.get(row["state"] if row else "", 1)
+        yield f"id: {job['id']}:{after}\ndata: __EXIT__ {code}\n\n"
+
+class JobPayload(BaseModel):
+    kind: str
+    prompt: Optional[str] = None
+    workspaceId: Optional[str] = None
+
+def _enqueue(payload: JobPayload) -> dict:
+    from job_store import get_store
+    wid = payload.workspaceId
+    if payload.kind == "generate":
+        if not (payload.prompt or "").strip():
+            raise HTTPException(400, "Missing 'prompt'")
+        # Claimed here so the client knows its workspace straight away
+        wid = wid or workspace_pool.claim()["id"]
+        job = get_store().enqueue("generate", {"prompt": payload.prompt}, wid)
+    elif payload.kind == "build":
+        if not wid:
+            raise HTTPException(400, "Missing 'workspaceId'")
+        job = get_store().enqueue("build", {}, wid)
+    else:
+        raise HTTPException(400, f"unknown job kind {payload.kind!r}")
+    return {"jobId": job["id"], "status": f"/api/jobs/{job['id']}", "workspaceId": wid}
+
+@app.post("/api/jobs", status_code=202)
+def submit_job(payload: JobPayload):
+    """
+    Queue a `generate` (prompt, optional workspaceId) or `build`
+    (workspaceId) job for the worker processes. A build joins the
+    workspace's queued one; while one is running, a follow-up is queued.
+    """
+    if payload.workspaceId:
+        try:
+            ws.ensure_workspace(payload.workspaceId)
+        except FileNotFoundError:
+            raise HTTPException(404, "workspace not found")
+    return _enqueue(payload)
+
+@app.get("/api/jobs")
+def list_jobs(state: Optional[str] = None, limit: int = Query(100, le=1000)):
+    from job_store import get_store
+    return {"jobs": get_store().list(state, limit)}
+
+@app.get("/api/jobs/stats")
+def job_stats():
+    return job_workers.pool.stats()
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str, after: int = 0):
+    """Job row, summary and events after sequence `after`."""
+    from job_store import get_store
+    store = get_store()
+    job = store.get(job_id)
+    if job is None:
+        raise HTTPException(404, "job not found")
+    return {**job, "events": store.events_after(job_id, after)}
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job(job_id: str, request: Request):
+    """
+    Server-Sent Events for a queued job, read from the store until the job
+    finishes. Event ids are sequence numbers, so `Last-Event-ID` resumes.
+    """
+    from job_store import FINISHED, get_store
+    store = get_store()
+    if await asyncio.to_thread(store.get, job_id) is None:
+        raise HTTPException(404, "job not found")
+    last = request.headers.get("last-event-id", "")
+    after = int(last) if last.isdigit() else 0
+
+    async def event_gen():
+        nonlocal after
+        while True:
+            job = await asyncio.to_thread(store.get, job_id)
+            for event in await asyncio.to_thread(store.events_after, job_id, after):
+                after = event["seq"]
+                yield f"id: {after}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+            if job is None or (job["state"] in FINISHED and after >= job["last_seq"]):
+                return
+            await asyncio.sleep(job_workers.JOB_POLL)
+
+    return StreamingResponse(event_gen(), media_type="text/event-stream")
 
-#     return result
\ No newline at end of file
+@app.delete("/api/jobs/{job_id}")
+def cancel_job(job_id: str):
+    from job_store import get_store
+    job = get_store().request_cancel(job_id)
+    if job is None:
+        raise HTTPException(404, "job not found")
+    return {"id": job["id"], "state": job["state"], "cancel": job["cancel"]}
@@ -0,0 +1,325 @@
+"""
+Workspace snapshots.
+--------------------
+Each workspace keeps a content-addressed history in `<workspace>/.snapshots`:
+
+    objects/ab/cdef…    file contents, one blob per sha256
+    trees/<id>.json     manifest {path: blob hash}; the id hashes the manifest
+    head.json           latest manifest plus (size, mtime) per file
+    log.jsonl           one line per snapshot: id, tree, parent, label, changes
+
+`write_files` records a snapshot of just the files it wrote, so a snapshot
+costs the changed blobs plus one manifest. Files changed some other way
+(flutter, restores from another process) are picked up by `commit()`, which
+stats the tree and rehashes only files whose size or mtime moved.
+Read-only files (hardlinks into the shared base layer) are linked into the
+blob store rather than copied.
+
+`restore()` rewrites only the files that differ from the target and
+records the result as a new snapshot, so history is never rewritten.
+Paths matching TREE_IGNORE (build output, .dart_tool, ...) aren't tracked.
+
+- SNAPSHOTS         "false" disables recording
+- SNAPSHOT_HISTORY  snapshots kept per workspace; older trees and unused
+                    blobs are collected
+"""
+from __future__ import annotations
+import difflib, hashlib, json, os, shutil, threading, time, uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterable
+
+import tree_index
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX dev boxes: in-process locking only
+    fcntl = None
+
+SNAPSHOTS_ENABLED = os.getenv("SNAPSHOTS", "true").lower() == "true"
+SNAPSHOT_HISTORY = int(os.getenv("SNAPSHOT_HISTORY", "200"))
+SNAPSHOT_DIR = ".snapshots"
+PATCH_MAX_BYTES = 256 * 1024
+
+_locks: dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def _hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _tree_id(files: dict[str, str]) -> str:
+    h = hashlib.sha256()
+    for rel in sorted(files):
+        h.update(f"{rel}\0{files[rel]}\n".encode())
+    return h.hexdigest()[:20]
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+class SnapshotStore:
+    def __init__(self, base: Path):
+        self.base = base
+        self.dir = base / SNAPSHOT_DIR
+        self.objects = self.dir / "objects"
+        self.trees = self.dir / "trees"
+
+    @contextmanager
+    def _locked(self):
+        with _locks_guard:
+            lock = _locks.setdefault(self.dir, threading.Lock())
+        with lock:
+            self.dir.mkdir(exist_ok=True)
+            with open(self.dir / ".lock", "a+") as fh:
+                if fcntl:
+                    fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+                yield
+
+    # ------------------------------------------------------------------
+    # Blobs and trees
+    # ------------------------------------------------------------------
+    def _blob_path(self, h: str) -> Path:
+        return self.objects / h[:2] / h[2:]
+
+    def _put_blob(self, h: str, data: bytes, src: os.stat_result | None = None, path: Path | None = None) -> None:
+        blob = self._blob_path(h)
+        if blob.exists():
+            return
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        if src is not None and not src.st_mode & 0o200:
+            try:
+                os.link(path, blob)  # read-only layer file: share its inode
+                return
+            except FileExistsError:
+                return
+            except OSError:
+                pass
+        _write_atomic(blob, data)
+
+    def blob(self, h: str) -> bytes:
+        return self._blob_path(h).read_bytes()
+
+    def tree(self, tree_id: str) -> dict[str, str]:
+        return json.loads((self.trees / f"{tree_id}.json").read_text())
+
+    def _put_tree(self, files: dict[str, str]) -> str:
+        tree_id = _tree_id(files)
+        path = self.trees / f"{tree_id}.json"
+        if not path.exists():
+            self.trees.mkdir(parents=True, exist_ok=True)
+            _write_atomic(path, json.dumps(files, sort_keys=True).encode())
+        return tree_id
+
+    # ------------------------------------------------------------------
+    # Head and log
+    # ------------------------------------------------------------------
+    def _head(self) -> dict | None:
+        try:
+            return json.loads((self.dir / "head.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save_head(self, head: dict) -> None:
+        _write_atomic(self.dir / "head.json", json.dumps(head).encode())
+
+    def log(self) -> list[dict]:
+        try:
+            lines = (self.dir / "log.jsonl").read_text().splitlines()
+        except FileNotFoundError:
+            return []
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def _scan(self, stat_cache: dict[str, list]) -> dict[str, list]:
+        """Current files as {rel: [hash, size, mtime_ns]}, hashing only what changed."""
+        files: dict[str, list] = {}
+        for root, dirs, names in os.walk(self.base):
+            rel_root = os.path.relpath(root, self.base)
+            rel_root = "" if rel_root == "." else rel_root.replace(os.sep, "/")
+            dirs[:] = [d for d in dirs if not tree_index.ignored(f"{rel_root}/{d}" if rel_root else d)
+                       and d != SNAPSHOT_DIR]
+            for name in names:
+                rel = f"{rel_root}/{name}" if rel_root else name
+                if tree_index.ignored(rel):
+                    continue
+                path = Path(root) / name
+                try:
+                    st = path.stat()
+                except FileNotFoundError:
+                    continue
+                cached = stat_cache.get(rel)
+                if cached and cached[1] == st.st_size and cached[2] == st.st_mtime_ns:
+                    files[rel] = cached
+                    continue
+                try:
+                    data = path.read_bytes()
+                except FileNotFoundError:
+                    continue
+                h = _hash(data)
+                self._put_blob(h, data, st, path)
+                files[rel] = [h, st.st_size, st.st_mtime_ns]
+        return files
+
+    def _record(self, head: dict | None, files: dict[str, list], label: str) -> dict | None:
+        manifest = {rel: v[0] for rel, v in files.items()}
+        tree_id = self._put_tree(manifest)
+        parent = head["tree"] if head else None
+        if tree_id == parent:
+            self._save_head({"tree": tree_id, "files": files})  # refresh stat info
+            return None
+        before = self.tree(parent) if parent else {}
+        changes = _changes(before, manifest)
+        entries = self.log()
+        entry = {"id": (entries[-1]["id"] + 1) if entries else 1, "tree": tree_id, "parent": parent,
+                 "label": label, "created": time.time(), "files": len(manifest),
+                 **{k: len(v) for k, v in changes.items()}}
+        with open(self.dir / "log.jsonl", "a") as fh:
+            fh.write(json.dumps(entry) + "\n")
+        self._save_head({"tree": tree_id, "files": files})
+        if len(entries) + 1 > SNAPSHOT_HISTORY * 1.25:
+            self._collect(entries + [entry])
+        return entry
+
+    def _collect(self, entries: list[dict]) -> None:
+        """Drop snapshots beyond SNAPSHOT_HISTORY and whatever only they used."""
+        keep = entries[-SNAPSHOT_HISTORY:]
+        _write_atomic(self.dir / "log.jsonl", "".join(json.dumps(e) + "\n" for e in keep).encode())
+        trees = {e["tree"] for e in keep}
+        live = set()
+        for tree_id in trees:
+            live.update(self.tree(tree_id).values())
+        for path in self.trees.glob("*.json"):
+            if path.stem not in trees:
+                path.unlink(missing_ok=True)
+        for path in self.objects.glob("*/*"):
+            if path.parent.name + path.name not in live:
+                path.unlink(missing_ok=True)
+
+    # ------------------------------------------------------------------
+    # Recording
+    # ------------------------------------------------------------------
+    def ensure(self) -> dict:
+        """Head snapshot, taking the initial one if the workspace has none."""
+        with self._locked():
+            head = self._head()
+            if head is None:
+                self._record(None, self._scan({}), "initial")
+                head = self._head()
+            return head
+
+    def commit(self, label: str = "commit") -> dict | None:
+        """Snapshot whatever changed on disk since the head; None if nothing did."""
+        with self._locked():
+            head = self._head()
+            return self._record(head, self._scan(head["files"] if head else {}), label)
+
+    def record(self, written: Iterable[tuple[str, bytes]], label: str = "write") -> dict | None:
+        """Snapshot after `written` files were replaced; only those are hashed."""
+        with self._locked():
+            head = self._head()
+            files = dict(head["files"]) if head else self._scan({})
+            for rel, data in written:
+                try:
+                    st = (self.base / rel).stat()
+                except FileNotFoundError:
+                    files.pop(rel, None)
+                    continue
+                h = _hash(data)
+                self._put_blob(h, data)
+                files[rel] = [h, st.st_size, st.st_mtime_ns]
+            return self._record(head, files, label)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def get(self, snap_id: int) -> dict:
+        for entry in self.log():
+            if entry["id"] == snap_id:
+                return entry
+        raise KeyError(f"snapshot {snap_id} not found")
+
+    def diff(self, a: int, b: int | None = None, patch: bool = False) -> dict[str, Any]:
+        """Changes from snapshot `a` to snapshot `b` (None: the files on disk now)."""
+        if b is None:
+            self.commit("sync")
+        old = self.tree(self.get(a)["tree"])
+        new = self.tree(self.get(b)["tree"] if b is not None else self._head()["tree"])
+        changes = _changes(old, new)
+        out: dict[str, Any] = {"from": a, "to": b, **changes}
+        if patch:
+            out["patches"] = {rel: self._patch(rel, old.get(rel), new.get(rel))
+                              for rel in changes["added"] + changes["modified"] + changes["deleted"]}
+        return out
+
+    def _patch(self, rel: str, old: str | None, new: str | None) -> str | None:
+        def lines(h):
+            if h is None:
+                return []
+            data = self.blob(h)
+            if len(data) > PATCH_MAX_BYTES or b"\0" in data[:1024]:
+                raise ValueError
+            return data.decode("utf-8", errors="replace").splitlines(keepends=True)
+        try:
+            return "".join(difflib.unified_diff(lines(old), lines(new), f"a/{rel}", f"b/{rel}"))
+        except ValueError:
+            return None  # binary or too large
+
+    def changed_since(self, tree_id: str | None) -> dict[str, list[str]] | None:
+        """Paths changed between tree `tree_id` and the head; None if unknown."""
+        head = self._head()
+        if not tree_id or head is None:
+            return None
+        try:
+            return _changes(self.tree(tree_id), self.tree(head["tree"]))
+        except FileNotFoundError:
+            return None  # collected
+
+    def head_tree(self) -> str | None:
+        head = self._head()
+        return head["tree"] if head else None
+
+    # ------------------------------------------------------------------
+    # Restore
+    # ------------------------------------------------------------------
+    def restore(self, snap_id: int) -> dict:
+        """Make the workspace match snapshot `snap_id`, touching only differing files."""
+        target_entry = self.get(snap_id)
+        target = self.tree(target_entry["tree"])
+        self.commit("sync")
+        with self._locked():
+            head = self._head()
+            current = {rel: v[0] for rel, v in head["files"].items()}
+            changes = _changes(current, target)
+            files = dict(head["files"])
+            for rel in changes["added"] + changes["modified"]:
+                path = self.base / rel
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+                shutil.copyfile(self._blob_path(target[rel]), tmp)
+                os.replace(tmp, path)
+                st = path.stat()
+                files[rel] = [target[rel], st.st_size, st.st_mtime_ns]
+            for rel in changes["deleted"]:
+                (self.base / rel).unlink(missing_ok=True)
+                files.pop(rel, None)
+            entry = self._record(head, files, f"restore {snap_id}")
+        for rel in changes["added"] + changes["modified"] + changes["deleted"]:
+            tree_index.notify(self.base.name, rel)
+        return {"restored": snap_id, "written": changes["added"] + changes["modified"],
+                "deleted": changes["deleted"], "snapshot": entry}
+
+
+def _changes(old: dict[str, str], new: dict[str, str]) -> dict[str, list[str]]:
+    return {
+        "added": sorted(rel for rel in new if rel not in old),
+        "modified": sorted(rel for rel in new if rel in old and old[rel] != new[rel]),
+        "deleted": sorted(rel for rel in old if rel not in new),
+    }
+
+
+def store(base: Path) -> SnapshotStore:
+    return SnapshotStore(base)
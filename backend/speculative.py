@@ -0,0 +1,292 @@
+"""
+Speculative design drafts.
+--------------------------
+The vision and UX plan come from the slowest ("planner") model, yet many
+prompts are near-duplicates of earlier ones ("finance tracker", "a todo
+app", ...). Every finished vision + UX plan is stored here with its prompt,
+and a new prompt that is similar enough to a stored one gets that pair as a
+draft.
+
+Similarity is the cosine of character-trigram counts over the normalized
+prompt (lowercased, punctuation and filler words like "app" or "build me"
+dropped), found through an inverted trigram index. Trigrams can't tell
+"a shopping cart" from "no shopping cart", so a near match must also share
+enough words (stemmed, with negated words kept apart) and contradict none.
+It's all local, so it works offline and in tests.
+
+An exact match (same normalized prompt) is served as is: both planner
+calls are skipped. A near match only stands in for the vision; the UX plan
+is still designed for the user's own prompt. Once the request finishes,
+the planner stages run in the background for that prompt and the result
+replaces the draft for next time.
+
+`CoordinatorAgent.warm_up()` pre-generates drafts for SPECULATIVE_WARMUP.
+
+- SPECULATIVE                  "false" disables lookups and recording
+- SPECULATIVE_PATH             SQLite file (default .cache/drafts.sqlite)
+- SPECULATIVE_MIN_SIMILARITY   cosine needed to serve a draft (default 0.75)
+- SPECULATIVE_MIN_WORD_OVERLAP share of words a near match needs (default 0.5)
+- SPECULATIVE_REFINE           refine near-match drafts in the background
+- SPECULATIVE_MAX_DRAFTS       drafts kept, least recently used dropped
+- SPECULATIVE_WARMUP           comma-separated popular app categories
+- SPECULATIVE_WARMUP_ON_START  warm up when the API starts
+"""
+from __future__ import annotations
+import asyncio, json, math, os, re, sqlite3, threading, time
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable
+
+ROOT = Path(__file__).parent.resolve()
+SPECULATIVE_ENABLED = os.getenv("SPECULATIVE", "true").lower() == "true"
+SPECULATIVE_PATH = Path(os.getenv("SPECULATIVE_PATH", ROOT / ".cache" / "drafts.sqlite"))
+SPECULATIVE_MIN_SIMILARITY = float(os.getenv("SPECULATIVE_MIN_SIMILARITY", "0.75"))
+SPECULATIVE_MIN_WORD_OVERLAP = float(os.getenv("SPECULATIVE_MIN_WORD_OVERLAP", "0.5"))
+SPECULATIVE_REFINE = os.getenv("SPECULATIVE_REFINE", "true").lower() == "true"
+SPECULATIVE_MAX_DRAFTS = int(os.getenv("SPECULATIVE_MAX_DRAFTS", "2000"))
+SPECULATIVE_WARMUP = [c.strip() for c in os.getenv(
+    "SPECULATIVE_WARMUP",
+    "finance tracker,todo app,tutoring app,fitness tracker,recipe book,habit tracker,"
+    "expense splitter,event planner,chat app,online store").split(",") if c.strip()]
+SPECULATIVE_WARMUP_ON_START = os.getenv("SPECULATIVE_WARMUP_ON_START", "false").lower() == "true"
+
+FILLER = {"a", "an", "the", "app", "apps", "application", "mobile", "flutter", "for", "my", "me", "i",
+          "want", "need", "build", "create", "make", "design", "please", "simple", "that", "which", "with",
+          "and", "or", "of", "to", "in", "on", "it", "is"}
+NEGATIONS = {"no", "not", "without", "non", "dont", "never"}
+_SUFFIXES = ("ings", "ing", "ers", "er", "es", "ed", "s")
+
+
+def normalize(prompt: str) -> str:
+    words = re.findall(r"[a-z0-9]+", prompt.lower())
+    return " ".join(w for w in words if w not in FILLER) or " ".join(words)
+
+
+def trigrams(text: str) -> Counter[str]:
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _norm(grams: Counter[str]) -> float:
+    return math.sqrt(sum(n * n for n in grams.values()))
+
+
+def _stem(word: str) -> str:
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def words(text: str) -> set[str]:
+    """Stemmed words of a normalized prompt; a negated word becomes "!word"."""
+    out, negated = set(), False
+    for w in text.split():
+        if w in NEGATIONS:
+            negated = True
+            continue
+        out.add(("!" if negated else "") + _stem(w))
+        negated = False
+    return out
+
+
+def agrees(a: set[str], b: set[str], min_overlap: float = SPECULATIVE_MIN_WORD_OVERLAP) -> bool:
+    """Enough words in common, and nothing one asks for that the other rules out."""
+    if any("!" + w in b for w in a) or any("!" + w in a for w in b):
+        return False
+    return len(a & b) / len(a | b) >= min_overlap if a | b else True
+
+
+@dataclass
+class Draft:
+    prompt: str
+    vision: dict
+    ux: dict
+    similarity: float
+    source: str
+    exact: bool
+
+    def info(self) -> dict:
+        return {"prompt": self.prompt, "similarity": round(self.similarity, 3),
+                "source": self.source, "exact": self.exact}
+
+
+class DraftIndex:
+    def __init__(self, path: Path | None = SPECULATIVE_PATH, min_similarity: float = SPECULATIVE_MIN_SIMILARITY,
+                 max_drafts: int = SPECULATIVE_MAX_DRAFTS, min_word_overlap: float = SPECULATIVE_MIN_WORD_OVERLAP):
+        self.min_similarity = min_similarity
+        self.min_word_overlap = min_word_overlap
+        self.max_drafts = max_drafts
+        self._lock = threading.Lock()
+        self._grams: dict[str, tuple[Counter[str], float]] = {}  # key → (trigrams, norm)
+        self._postings: dict[str, set[str]] = {}                  # trigram → keys
+        self._rows: dict[str, dict] = {}                          # in-memory store without a path
+        self._seen = 0                                            # last rowid indexed
+        self._db = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS drafts (
+                key TEXT PRIMARY KEY, prompt TEXT NOT NULL, vision TEXT NOT NULL, ux TEXT NOT NULL,
+                source TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL, hits INTEGER NOT NULL)""")
+            self._sync_locked()
+        self.counters = {"lookups": 0, "hits": 0, "exact_hits": 0, "misses": 0, "word_rejections": 0, "stores": 0,
+                         "evictions": 0, "refinements": 0, "refine_failures": 0, "warmed": 0}
+
+    # ------------------------------------------------------------------
+    # Index
+    # ------------------------------------------------------------------
+    def _add_locked(self, key: str) -> None:
+        grams = trigrams(key)
+        self._grams[key] = (grams, _norm(grams))
+        for g in grams:
+            self._postings.setdefault(g, set()).add(key)
+
+    def _sync_locked(self) -> None:
+        """Index drafts other processes (job workers) stored since the last look."""
+        if self._db is None:
+            return
+        for rowid, key in self._db.execute("SELECT rowid, key FROM drafts WHERE rowid > ? ORDER BY rowid",
+                                           (self._seen,)):
+            if key not in self._grams:
+                self._add_locked(key)
+            self._seen = rowid
+
+    def _drop_locked(self, key: str) -> None:
+        grams, _ = self._grams.pop(key, (Counter(), 0.0))
+        for g in grams:
+            keys = self._postings.get(g)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[g]
+        self._rows.pop(key, None)
+        if self._db is not None:
+            self._db.execute("DELETE FROM drafts WHERE key = ?", (key,))
+
+    def _best_locked(self, key: str) -> tuple[str | None, float]:
+        """Most similar stored key that also agrees word-wise with `key`."""
+        if key in self._grams:
+            return key, 1.0
+        grams = trigrams(key)
+        norm = _norm(grams)
+        dots: Counter[str] = Counter()
+        for g, n in grams.items():
+            for other in self._postings.get(g, ()):
+                dots[other] += n * self._grams[other][0][g]
+        scored = sorted(((dot / (norm * self._grams[other][1]), other) for other, dot in dots.items()), reverse=True)
+        mine = words(key)
+        for score, other in scored:
+            if score < self.min_similarity:
+                break
+            if agrees(mine, words(other), self.min_word_overlap):
+                return other, score
+            self.counters["word_rejections"] += 1
+        return None, 0.0
+
+    def _row_locked(self, key: str) -> dict | None:
+        if self._db is None:
+            return self._rows.get(key)
+        row = self._db.execute("SELECT prompt, vision, ux, source FROM drafts WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {"prompt": row[0], "vision": json.loads(row[1]), "ux": json.loads(row[2]), "source": row[3]}
+
+    # ------------------------------------------------------------------
+    # Lookup / store
+    # ------------------------------------------------------------------
+    def lookup(self, prompt: str) -> Draft | None:
+        """The stored draft most similar to `prompt`, if similar enough."""
+        key = normalize(prompt)
+        with self._lock:
+            self.counters["lookups"] += 1
+            self._sync_locked()
+            best, score = self._best_locked(key)
+            row = self._row_locked(best) if best and score >= self.min_similarity else None
+            if row is None and best and score >= self.min_similarity:
+                self._drop_locked(best)  # evicted by another process
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            self.counters["exact_hits"] += best == key
+            if self._db is not None:
+                self._db.execute("UPDATE drafts SET used = ?, hits = hits + 1 WHERE key = ?", (time.time(), best))
+            else:
+                row["used"] = time.time()
+        return Draft(row["prompt"], row["vision"], row["ux"], score, row["source"], best == key)
+
+    def has(self, prompt: str) -> bool:
+        with self._lock:
+            self._sync_locked()
+            return normalize(prompt) in self._grams
+
+    def remember(self, prompt: str, vision: dict, ux: dict, source: str = "generated") -> bool:
+        """Store a finished vision + UX plan; plans that didn't parse are skipped."""
+        if not vision or not ux or not ux.get("screens"):
+            return False
+        key, now = normalize(prompt), time.time()
+        with self._lock:
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO drafts VALUES (?, ?, ?, ?, ?, ?, ?, "
+                    "COALESCE((SELECT hits FROM drafts WHERE key = ?), 0))",
+                    (key, prompt, json.dumps(vision), json.dumps(ux), source, now, now, key))
+            else:
+                self._rows[key] = {"prompt": prompt, "vision": vision, "ux": ux, "source": source, "used": now}
+            if key not in self._grams:
+                self._add_locked(key)
+            self.counters["stores"] += 1
+            self._evict_locked()
+        return True
+
+    def _evict_locked(self) -> None:
+        excess = len(self._grams) - self.max_drafts
+        if excess <= 0:
+            return
+        if self._db is not None:
+            oldest = [k for (k,) in self._db.execute("SELECT key FROM drafts ORDER BY used LIMIT ?", (excess,))]
+        else:
+            oldest = sorted(self._rows, key=lambda k: self._rows[k]["used"])[:excess]
+        for key in oldest:
+            self._drop_locked(key)
+        self.counters["evictions"] += len(oldest)
+
+    def count(self, name: str, by: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += by
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = {**self.counters, "drafts": len(self._grams), "trigrams": len(self._postings),
+                 "refining": len(_background)}
+        s["hit_rate"] = round(s["hits"] / s["lookups"], 4) if s["lookups"] else None
+        return s
+
+
+# -------------------------------------------------------------------------
+# Background refinement
+# -------------------------------------------------------------------------
+_background: set[asyncio.Task] = set()
+
+
+def spawn(coro: Awaitable[Any]) -> asyncio.Task:
+    """Run `coro` detached; the task is kept referenced until it finishes."""
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+    return task
+
+
+_index: DraftIndex | None = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> DraftIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DraftIndex()
+        return _index
@@ -34,9 +34,9 @@ async def main():
     print("✅ UI critique completed!\n")
 
     # Optional feedback loop
-    if "issues" in critique.lower():
+    if critique.has_issues:
         print("🔁 Issues found! Revising UI with feedback...")
-        ui = await coordinator.ui_designer.design_ui(f"{ux}\n\nFeedback:\n{critique}")
+        ui = await coordinator.ui_designer.design_ui(ux, feedback=critique)
         print("✅ Revised UI created!\n")
 
     print("💻 [5/6] Writing Flutter app skeleton...")
@@ -49,11 +49,11 @@ async def main():
 
     # ---- COMBINE RESULTS ----
     output = {
-        "vision": vision,
-        "ux": ux,
-        "ui": ui,
-        "critique": critique,
-        "final_code": styled
+        "vision": vision.data(),
+        "ux": ux.data(),
+        "ui": ui.data(),
+        "critique": critique.data(),
+        "final_code": styled.data()
     }
 
     output_file = "output/app_design_output.json"
@@ -65,9 +65,9 @@ async def main():
 
     # ---- Optional summary ----
     print("✅ Summary:")
-    print("  - Vision:", vision[:200], "...")
-    print("  - UX:", ux[:200], "...")
-    print("  - Critique:", critique[:200], "...")
+    print("  - Vision:", vision.compact()[:200], "...")
+    print("  - UX:", ux.compact()[:200], "...")
+    print("  - Critique:", critique.compact()[:200], "...")
     print("\n🎉 Workflow finished successfully!\n")
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the `flutter` CLI, for tests and benchmarks on machines
+without the SDK:
+
+    FLUTTER_BIN="python tools/fake_flutter.py" uvicorn server:app
+
+Implements just what the backend calls:
+
+    create . --platforms web --project-name NAME   → web/index.html, web/manifest.json
+    pub get [--offline]                            → .dart_tool/package_config.json
+    build web ... --output DIR                     → index.html, main.dart.js, flutter.js
+
+`main.dart.js` embeds a hash of lib/, so changed sources give a changed
+build. FAKE_FLUTTER_DELAY adds seconds per step, spread over
+FAKE_FLUTTER_TICKS progress lines if set; FAKE_FLUTTER_FAIL=build (or pub)
+makes that step exit 1.
+"""
+import hashlib, json, os, sys, time
+from pathlib import Path
+
+DELAY = float(os.getenv("FAKE_FLUTTER_DELAY", "0"))
+TICKS = int(os.getenv("FAKE_FLUTTER_TICKS", "0"))
+FAIL = os.getenv("FAKE_FLUTTER_FAIL", "")
+
+
+def _step(name: str) -> None:
+    for i in range(TICKS):
+        time.sleep(DELAY / TICKS)
+        print(f"  {name}: {i + 1}/{TICKS}", flush=True)
+    if DELAY and not TICKS:
+        time.sleep(DELAY)
+    if FAIL == name:
+        print(f"Error: fake failure in {name}", flush=True)
+        sys.exit(1)
+
+
+def create(args: list[str]) -> None:
+    name = args[args.index("--project-name") + 1] if "--project-name" in args else "app"
+    web = Path("web")
+    web.mkdir(exist_ok=True)
+    (web / "index.html").write_text(
+        '<!DOCTYPE html><html><head><base href="/"><title>%s</title></head>'
+        '<body><script src="flutter_bootstrap.js" async></script></body></html>\n' % name)
+    (web / "manifest.json").write_text(json.dumps({"name": name, "short_name": name}))
+    print(f"Creating project {name}...\nAll done!", flush=True)
+
+
+def pub_get(args: list[str]) -> None:
+    print("Resolving dependencies...", flush=True)
+    _step("pub")
+    Path(".dart_tool").mkdir(exist_ok=True)
+    Path(".dart_tool/package_config.json").write_text(json.dumps({"configVersion": 2, "packages": []}))
+    print("Got dependencies!", flush=True)
+
+
+def build_web(args: list[str]) -> None:
+    out = Path(args[args.index("--output") + 1]) if "--output" in args else Path("build/web")
+    print("Compiling lib/main.dart for the Web...", flush=True)
+    _step("build")
+    h = hashlib.sha256()
+    for f in sorted(Path("lib").rglob("*.dart")):
+        h.update(f.as_posix().encode() + b"\0" + f.read_bytes())
+    out.mkdir(parents=True, exist_ok=True)
+    for f in Path("web").iterdir():
+        if f.is_file():
+            (out / f.name).write_bytes(f.read_bytes())
+    (out / "main.dart.js").write_text(f"// fake build {h.hexdigest()}\n" + "console.log('app');\n" * 2000)
+    (out / "flutter.js").write_text("// fake flutter loader\n")
+    (out / "flutter_bootstrap.js").write_text("// fake bootstrap\n")
+    print(f"✓ Built {out}", flush=True)
+
+
+def main(argv: list[str]) -> None:
+    if argv[:1] == ["create"]:
+        create(argv[1:])
+    elif argv[:2] == ["pub", "get"]:
+        pub_get(argv[2:])
+    elif argv[:2] == ["build", "web"]:
+        build_web(argv[2:])
+    elif argv[:1] == ["--version"]:
+        print("Flutter 0.0.0 (fake)")
+    else:
+        print(f"fake_flutter: unsupported command {' '.join(argv)}", file=sys.stderr)
+        sys.exit(64)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,286 @@
+"""
+Per-workspace file tree index.
+------------------------------
+The tree is scanned once per workspace (pruning ignored directories before
+descending) and then kept current by `notify()` from the write path and,
+when `watchdog` is installed and TREE_WATCH=true, by a filesystem watcher.
+Every change bumps a version number so clients can ask for deltas.
+Versions start from the wall clock (microseconds) rather than 0, so an
+index rebuilt after eviction, archiving or a restart never reissues
+numbers a client already holds.
+
+Writes from other processes (job workers) don't reach `notify()`, so
+queries first re-stat the indexed directories and rescan the ones whose
+mtime moved (TREE_REVALIDATE, on by default; atomic-rename writes always
+touch the directory).
+
+- TREE_IGNORE      comma-separated globs matched against names and paths
+- TREE_CHANGE_LOG  how many changes are kept for `changes_since`
+"""
+from __future__ import annotations
+import fnmatch, os, threading, time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Dict, List
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+TREE_IGNORE = [g.strip() for g in os.getenv(
+    "TREE_IGNORE", "build,.dart_tool,.pub-cache,.git,.idea,.snapshots,*.tmp").split(",") if g.strip()]
+TREE_CHANGE_LOG = int(os.getenv("TREE_CHANGE_LOG", "2000"))
+TREE_INDEX_MAX = int(os.getenv("TREE_INDEX_MAX", "512"))
+TREE_WATCH = os.getenv("TREE_WATCH", "false").lower() == "true"
+TREE_REVALIDATE = os.getenv("TREE_REVALIDATE", "true").lower() == "true"
+
+
+def ignored(rel: str, ignore=TREE_IGNORE) -> bool:
+    name = rel.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(name, g) or fnmatch.fnmatch(rel, g) for g in ignore)
+
+
+class TreeIndex:
+    def __init__(self, base: Path, ignore=TREE_IGNORE):
+        self.base = base
+        self.ignore = ignore
+        self.version = time.time_ns() // 1000
+        self._lock = threading.RLock()
+        self._files: dict[str, int] = {}              # rel → size
+        self._mtimes: dict[str, int] = {}             # rel → st_mtime_ns (files and dirs)
+        self._children: dict[str, set[str]] = {"": set()}  # dir rel → child names
+        self._changes: deque[tuple[int, str, str]] = deque(maxlen=TREE_CHANGE_LOG)
+        self._observer = None
+        self._scan("")
+
+    # ------------------------------------------------------------------
+    # Scanning / updating
+    # ------------------------------------------------------------------
+    def _scan(self, dir_rel: str) -> None:
+        stack = [dir_rel]
+        while stack:
+            current = stack.pop()
+            names = self._children.setdefault(current, set())
+            try:
+                self._mtimes[current] = os.stat(self.base / current).st_mtime_ns
+                it = os.scandir(self.base / current)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            with it:
+                for entry in it:
+                    rel = f"{current}/{entry.name}" if current else entry.name
+                    if ignored(rel, self.ignore):
+                        continue
+                    names.add(entry.name)
+                    if entry.is_dir(follow_symlinks=False):
+                        self._children.setdefault(rel, set())
+                        stack.append(rel)
+                    else:
+                        try:
+                            st = entry.stat(follow_symlinks=False)
+                            self._files[rel], self._mtimes[rel] = st.st_size, st.st_mtime_ns
+                        except FileNotFoundError:
+                            names.discard(entry.name)
+
+    def _drop(self, rel: str) -> None:
+        self._files.pop(rel, None)
+        for d in [d for d in self._children if d == rel or d.startswith(rel + "/")]:
+            del self._children[d]
+        for f in [f for f in self._files if f.startswith(rel + "/")]:
+            del self._files[f]
+        for m in [m for m in self._mtimes if m == rel or m.startswith(rel + "/")]:
+            del self._mtimes[m]
+        parent, _, name = rel.rpartition("/")
+        self._children.get(parent, set()).discard(name)
+
+    def notify(self, rel: str) -> None:
+        """Re-stat `rel` (file or directory) and record the change."""
+        rel = rel.strip("/")
+        if not rel or ignored(rel, self.ignore):
+            return
+        with self._lock:
+            path = self.base / rel
+            existed = rel in self._files or rel in self._children
+            self._drop(rel)
+            if path.is_dir():
+                op = "modified" if existed else "created"
+                self._children[rel] = set()
+                self._scan(rel)
+            elif path.is_file():
+                op = "modified" if existed else "created"
+                st = path.stat()
+                self._files[rel], self._mtimes[rel] = st.st_size, st.st_mtime_ns
+            else:
+                if not existed:
+                    return
+                op = "deleted"
+            if op != "deleted":
+                # Make sure every ancestor is present
+                parts = rel.split("/")
+                for i in range(len(parts)):
+                    parent = "/".join(parts[:i])
+                    self._children.setdefault(parent, set()).add(parts[i])
+            self.version += 1
+            self._changes.append((self.version, op, rel))
+
+    def revalidate(self) -> None:
+        """Pick up changes made behind the index's back (other processes)."""
+        with self._lock:
+            for d in list(self._children):
+                if d not in self._children:
+                    continue  # dropped while walking
+                try:
+                    mtime = os.stat(self.base / d).st_mtime_ns
+                except (FileNotFoundError, NotADirectoryError):
+                    if d:
+                        self.notify(d)
+                    continue
+                if mtime == self._mtimes.get(d):
+                    continue
+                self._mtimes[d] = mtime
+                try:
+                    with os.scandir(self.base / d) as it:
+                        now = {e.name: e for e in it
+                               if not ignored(f"{d}/{e.name}" if d else e.name, self.ignore)}
+                except FileNotFoundError:
+                    continue
+                before = self._children.get(d, set())
+                for name in set(now) | before:
+                    rel = f"{d}/{name}" if d else name
+                    if name not in now or name not in before:
+                        self.notify(rel)
+                    elif rel in self._files:
+                        try:
+                            if now[name].stat(follow_symlinks=False).st_mtime_ns != self._mtimes.get(rel):
+                                self.notify(rel)
+                        except FileNotFoundError:
+                            self.notify(rel)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def _node(self, rel: str, name: str) -> Dict[str, Any]:
+        if rel in self._children:
+            return {"id": rel, "path": rel, "name": name, "type": "dir",
+                    "hasChildren": bool(self._children[rel])}
+        return {"id": rel, "path": rel, "name": name, "type": "file", "size": self._files.get(rel, 0)}
+
+    def level(self, dir_rel: str = "", offset: int = 0, limit: int = 500) -> Dict[str, Any]:
+        dir_rel = dir_rel.strip("/")
+        if TREE_REVALIDATE:
+            self.revalidate()
+        with self._lock:
+            if dir_rel not in self._children:
+                raise FileNotFoundError("directory not found")
+            names = sorted(self._children[dir_rel])
+            page = names[offset:offset + limit]
+            return {
+                "version": self.version,
+                "dir": dir_rel,
+                "total": len(names),
+                "offset": offset,
+                "entries": [self._node(f"{dir_rel}/{n}" if dir_rel else n, n) for n in page],
+            }
+
+    def tree(self) -> List[Dict[str, Any]]:
+        if TREE_REVALIDATE:
+            self.revalidate()
+        with self._lock:
+            def walk(dir_rel: str) -> List[Dict[str, Any]]:
+                nodes = []
+                for name in sorted(self._children.get(dir_rel, ())):
+                    rel = f"{dir_rel}/{name}" if dir_rel else name
+                    node = self._node(rel, name)
+                    if node["type"] == "dir":
+                        del node["hasChildren"]
+                        node["children"] = walk(rel)
+                    nodes.append(node)
+                return nodes
+            return walk("")
+
+    def changes_since(self, version: int) -> Dict[str, Any]:
+        if TREE_REVALIDATE:
+            self.revalidate()
+        with self._lock:
+            oldest = self._changes[0][0] if self._changes else self.version + 1
+            if version > self.version or version + 1 < oldest:
+                # From an earlier index of this workspace, or the log no
+                # longer reaches back that far; client must reload
+                return {"version": self.version, "reset": True, "changes": []}
+            return {
+                "version": self.version,
+                "reset": False,
+                "changes": [{"version": v, "op": op, "path": p}
+                            for v, op, p in self._changes if v > version],
+            }
+
+    # ------------------------------------------------------------------
+    # Optional watcher
+    # ------------------------------------------------------------------
+    def watch(self) -> None:
+        if Observer is None or self._observer is not None:
+            return
+        index = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                for p in {getattr(event, "src_path", None), getattr(event, "dest_path", None)}:
+                    if p:
+                        try:
+                            index.notify(Path(p).relative_to(index.base).as_posix())
+                        except ValueError:
+                            pass
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), str(self.base), recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+
+    def close(self) -> None:
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer = None
+
+
+# -------------------------------------------------------------------------
+# Registry
+# -------------------------------------------------------------------------
+_indexes: OrderedDict[str, TreeIndex] = OrderedDict()
+_registry_lock = threading.Lock()
+
+
+def get(wid: str, base: Path) -> TreeIndex:
+    with _registry_lock:
+        index = _indexes.get(wid)
+        if index is not None:
+            _indexes.move_to_end(wid)
+            return index
+    # Scan outside the registry lock so other workspaces aren't held up
+    index = TreeIndex(base)
+    with _registry_lock:
+        existing = _indexes.get(wid)
+        if existing is not None:
+            return existing
+        _indexes[wid] = index
+        while len(_indexes) > TREE_INDEX_MAX:
+            _indexes.popitem(last=False)[1].close()
+    if TREE_WATCH:
+        index.watch()
+    return index
+
+
+def notify(wid: str, rel: str) -> None:
+    """Tell an already-built index that `rel` changed; no-op otherwise."""
+    with _registry_lock:
+        index = _indexes.get(wid)
+    if index is not None:
+        index.notify(rel)
+
+
+def forget(wid: str) -> None:
+    with _registry_lock:
+        index = _indexes.pop(wid, None)
+    if index is not None:
+        index.close()
@@ -1,95 +1,419 @@
 from __future__ import annotations
-import os, shutil, uuid, re
+import asyncio, contextvars, functools, os, shutil, uuid, re, hashlib, threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, Any, List
 import subprocess, time
+import metrics
+import pub_cache
+import snapshots
+import tree_index
 ROOT = Path(__file__).parent.resolve()
 WORKSPACES = ROOT / "workspaces"
 TEMPLATE = ROOT / "templates" / "blank"
 WORKSPACES.mkdir(exist_ok=True, parents=True)
 
 SAFE_PATH = re.compile(r"^[A-Za-z0-9_\-./]+$")
+# Top-level entries the backend keeps inside a workspace; not reachable through the file API
+INTERNAL_PATHS = (snapshots.SNAPSHOT_DIR, ".pub-cache", pub_cache.MODE_FILE)
 
-def new_workspace() -> dict[str, str]:
-    wid = uuid.uuid4().hex[:8]
-    wdir = WORKSPACES / wid
+# -------------------------------------------------------------------------
+# Shared base layer
+# -------------------------------------------------------------------------
+# The template plus the `flutter create` output is built once per template
+# revision under LAYERS/<digest> and treated as read-only. Workspaces are
+# materialized from it with hardlinks, so identical files share one inode.
+LAYERS = ROOT / ".layers"
+
+# Files that flutter/pub rewrite in place; these always get a private copy
+# (reflinked when the filesystem supports it) so the layer is never mutated.
+PRIVATE_PATHS = (".dart_tool/", "build/", ".pub-cache/", "pubspec.yaml", "pubspec.lock", ".metadata")
+
+_FICLONE = 0x40049409  # linux/fs.h
+_layer_lock = threading.Lock()
+
+def _template_digest() -> str:
+    h = hashlib.sha256()
+    for f in sorted(p for p in TEMPLATE.rglob("*") if p.is_file()):
+        h.update(f.relative_to(TEMPLATE).as_posix().encode())
+        h.update(b"\0")
+        h.update(f.read_bytes())
+    return h.hexdigest()[:16]
+
+def _project_name() -> str:
+    m = re.search(r"^name:\s*(\S+)", (TEMPLATE / "pubspec.yaml").read_text(), re.M)
+    return m.group(1) if m else "flutter_web_workspace"
 
-    # Copy template
-    shutil.copytree(TEMPLATE, wdir)
+def _is_private(rel: str) -> bool:
+    return any(rel == p or rel.startswith(p) for p in PRIVATE_PATHS)
 
-    # Ensure required folders exist before web setup
-    (wdir / "assets").mkdir(exist_ok=True)
+def base_layer() -> Path:
+    """Return the base layer for the current template, building it if needed."""
+    layer = LAYERS / _template_digest()
+    if layer.exists():
+        return layer
+    with _layer_lock:
+        if layer.exists():
+            return layer
+        LAYERS.mkdir(parents=True, exist_ok=True)
+        staging = LAYERS / f".tmp-{uuid.uuid4().hex}"
+        try:
+            # Copy template
+            shutil.copytree(TEMPLATE, staging)
+
+            # Ensure required folders exist before web setup
+            (staging / "assets").mkdir(exist_ok=True)
+
+            # Run flutter create web config
+            subprocess.run(
+                [*pub_cache.FLUTTER_BIN, "create", ".", "--platforms", "web", "--project-name", _project_name()],
+                cwd=str(staging),
+                check=True,
+            )
+
+            # Shared files are read-only so accidental in-place writes fail loudly
+            for f in staging.rglob("*"):
+                if f.is_file() and not _is_private(f.relative_to(staging).as_posix()):
+                    f.chmod(0o444)
+            os.rename(staging, layer)
+        except OSError:
+            if not layer.exists():
+                raise
+            # another process published the same layer first
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+    return layer
+
+_reflink_supported = True
+
+def _reflink(src: Path, dst: Path) -> bool:
+    global _reflink_supported
+    if not _reflink_supported:
+        return False
+    try:
+        import fcntl
+        with open(src, "rb") as s, open(dst, "wb") as d:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except (ImportError, OSError):
+        # Filesystem can't clone; don't pay for the attempt again
+        _reflink_supported = False
+        dst.unlink(missing_ok=True)
+        return False
+
+def materialize(layer: Path, wdir: Path) -> dict[str, int]:
+    """Populate `wdir` from `layer`, sharing file contents wherever possible."""
+    stats = {"linked": 0, "reflinked": 0, "copied": 0, "bytes_copied": 0}
+    for root, dirs, files in os.walk(layer):
+        src_dir = Path(root)
+        rel_dir = src_dir.relative_to(layer)
+        (wdir / rel_dir).mkdir(parents=True, exist_ok=True)
+        for name in files:
+            src = src_dir / name
+            dst = wdir / rel_dir / name
+            rel = (rel_dir / name).as_posix()
+            if not _is_private(rel):
+                try:
+                    os.link(src, dst)
+                    stats["linked"] += 1
+                    continue
+                except OSError:
+                    pass  # cross-device or unsupported; fall through to a copy
+            if _reflink(src, dst):
+                stats["reflinked"] += 1
+                continue
+            shutil.copy2(src, dst)
+            dst.chmod(0o644)
+            stats["copied"] += 1
+            stats["bytes_copied"] += src.stat().st_size
+    return stats
 
-    # Run flutter create web config
-    subprocess.run(
-        ["flutter", "create", ".", "--platforms", "web"],
-        cwd=str(wdir),
-        check=True,
-    )
+def flutter_env(base: Path) -> dict:
+    # Packages resolve into the shared cache unless the workspace opted out
+    return pub_cache.env_for(base)
 
+def prepare_workspace(wdir: Path, pub_get: bool = False) -> None:
+    """Materialize a ready-to-build Flutter project at `wdir`."""
+    materialize(base_layer(), wdir)
+
+    if pub_get:
+        with pub_cache.locked(pub_cache.cache_dir_for(wdir)) as cache:
+            if pub_cache.OFFLINE:
+                pub_cache.seed_from_mirror(cache)
+            before = pub_cache.packages(cache)
+            subprocess.run(
+                pub_cache.pub_get_cmd(),
+                cwd=str(wdir),
+                env=flutter_env(wdir),
+                check=True,
+            )
+            pub_cache.record_pub_get(before, pub_cache.packages(cache))
+
+def new_workspace() -> dict[str, str]:
+    wid = uuid.uuid4().hex[:8]
+    wdir = WORKSPACES / wid
+    prepare_workspace(wdir)
     return {"id": wid, "path": str(wdir)}
 
 def _validate_relpath(path: str) -> str:
-    if not path or not SAFE_PATH.match(path) or ".." in Path(path).parts or Path(path).is_absolute():
+    parts = Path(path).parts
+    if not path or not SAFE_PATH.match(path) or ".." in parts or Path(path).is_absolute():
+        raise ValueError("Invalid path")
+    if parts and parts[0] in INTERNAL_PATHS:
         raise ValueError("Invalid path")
     return path
 
 def list_tree(wid: str) -> List[Dict[str, Any]]:
-    base = WORKSPACES / wid
-    if not base.exists():
-        raise FileNotFoundError("workspace not found")
+    base = ensure_workspace(wid)
+    return tree_index.get(wid, base).tree()
 
-    def walk_dir(dir_path: Path) -> List[Dict[str, Any]]:
-        nodes = []
-        for entry in sorted(dir_path.iterdir()):
-            rel = entry.relative_to(base).as_posix()
+def list_dir(wid: str, rel: str = "", offset: int = 0, limit: int = 500) -> Dict[str, Any]:
+    """One directory level of the tree, paginated."""
+    base = ensure_workspace(wid)
+    if rel:
+        _validate_relpath(rel)
+    return tree_index.get(wid, base).level(rel, offset, limit)
 
-            # Skip build artifacts
-            if rel.startswith("build/"):
-                continue
-
-            if entry.is_dir():
-                nodes.append({
-                    "id": rel,
-                    "path":rel,
-                    "name": entry.name,
-                    "type": "dir",
-                    "children": walk_dir(entry),
-                })
-            else:
-                nodes.append({
-                    "id": rel,
-                    "path":rel,
-                    "name": entry.name,
-                    "type": "file",
-                    "size": entry.stat().st_size,
-                })
-        return nodes
-
-    return walk_dir(base)
+def tree_changes(wid: str, since: int) -> Dict[str, Any]:
+    return tree_index.get(wid, ensure_workspace(wid)).changes_since(since)
 
 def read_file(wid: str, rel: str) -> str:
-    base = WORKSPACES / wid
     rel = _validate_relpath(rel)
+    base = ensure_workspace(wid)
     f = base / rel
     if not f.exists() or not f.is_file(): raise FileNotFoundError("file not found")
     return f.read_text(encoding="utf-8")
 
-def write_file(wid: str, rel: str, content: str) -> None:
-    base = WORKSPACES / wid
-    rel = _validate_relpath(rel)
-    f = base / rel
-    f.parent.mkdir(parents=True, exist_ok=True)
-    
-    # Use low-level file handle to ensure write durability
-    with open(f, "w", encoding="utf-8") as out:
-        out.write(content)
-        out.flush()
-        os.fsync(out.fileno())  # ✅ ensures data is committed to disk
-    
-    print(f"✅ Flushed and saved {f}")
+# -------------------------------------------------------------------------
+# Durable writes
+# -------------------------------------------------------------------------
+# "per-file": fsync every file before it is renamed into place
+# "batch":    write the whole batch, then fsync its files, then rename
+#             (only this batch's files: a filesystem-wide sync would also
+#             flush every other workspace's pending writes)
+# "none":     leave flushing to the OS
+DURABILITY = ("none", "batch", "per-file")
+
+def _fsync_dir(d: Path) -> None:
+    try:
+        fd = os.open(d, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass  # some filesystems refuse directory fsync
+    finally:
+        os.close(fd)
+
+def write_files(wid: str, files, durability: str = "batch", label: str = "write") -> List[str]:
+    """Write many `(path, content)` pairs via temp file + atomic rename.
+
+    All paths are validated before anything is written. Targets may be
+    hardlinks into the shared base layer, so content is never written
+    through them (copy-on-write). The batch is recorded as one snapshot
+    named `label`.
+    """
+    if durability not in DURABILITY:
+        raise ValueError(f"durability must be one of {DURABILITY}")
+    import workspace_lifecycle
+    with workspace_lifecycle.in_use(wid) as base:  # archiving waits for the write
+        return _write_files(wid, base, files, durability, label)
+
+def _write_files(wid: str, base: Path, files, durability: str, label: str) -> List[str]:
+    items = [(_validate_relpath(rel), content.encode("utf-8") if isinstance(content, str) else content)
+             for rel, content in files]
+    import workspace_lifecycle
+    workspace_lifecycle.check_quota(wid, sum(len(content) for _, content in items))
+    if snapshots.SNAPSHOTS_ENABLED:
+        snapshots.store(base).ensure()  # the state before the first write is restorable too
+
+    staged: list[tuple[Path, Path]] = []
+    try:
+        for rel, content in items:
+            f = base / rel
+            f.parent.mkdir(parents=True, exist_ok=True)
+            tmp = f.with_name(f".{f.name}.{uuid.uuid4().hex[:8]}.tmp")
+            staged.append((tmp, f))
+            with open(tmp, "wb") as out:
+                out.write(content)
+                if durability == "per-file":
+                    out.flush()
+                    os.fsync(out.fileno())  # ✅ ensures data is committed to disk
+
+        if durability == "batch":
+            # Writeback of the earlier files is under way by now, so most of these return quickly
+            for tmp, _ in staged:
+                with open(tmp, "rb") as fh:
+                    os.fsync(fh.fileno())
+
+        for tmp, f in staged:
+            os.replace(tmp, f)
+    except BaseException:
+        for tmp, _ in staged:
+            tmp.unlink(missing_ok=True)
+        raise
+
+    # Make the renames themselves durable
+    if durability != "none":
+        for d in {f.parent for _, f in staged}:
+            _fsync_dir(d)
+
+    if snapshots.SNAPSHOTS_ENABLED:
+        snapshots.store(base).record(items, label)
+    metrics.files_written.inc(len(items))
+    metrics.bytes_written.inc(sum(len(content) for _, content in items))
+    for rel, _ in items:
+        tree_index.notify(wid, rel)
+    return [rel for rel, _ in items]
+
+def write_file(wid: str, rel: str, content: str, durability: str = "per-file", label: str = "write") -> None:
+    write_files(wid, [(rel, content)], durability, label)
+    print(f"✅ Flushed and saved {WORKSPACES / wid / rel}")
+
+def read_files(wid: str, paths: List[str]) -> Dict[str, Any]:
+    ensure_workspace(wid)
+    out: Dict[str, Any] = {"files": [], "errors": []}
+    for rel in paths:
+        try:
+            out["files"].append({"path": rel, "content": read_file(wid, rel)})
+        except FileNotFoundError:
+            out["errors"].append({"path": rel, "error": "file not found"})
+        except UnicodeDecodeError:
+            out["errors"].append({"path": rel, "error": "not a UTF-8 text file"})
+        except ValueError:
+            out["errors"].append({"path": rel, "error": "invalid path"})
+    return out
+
+# -------------------------------------------------------------------------
+# Snapshots
+# -------------------------------------------------------------------------
+def list_snapshots(wid: str, limit: int = 100) -> Dict[str, Any]:
+    store = snapshots.store(ensure_workspace(wid))
+    head = store.ensure()
+    return {"head": head["tree"], "snapshots": store.log()[::-1][:limit]}
+
+def take_snapshot(wid: str, label: str = "manual") -> Dict[str, Any] | None:
+    """Snapshot changes made outside `write_files`; None if there were none."""
+    store = snapshots.store(ensure_workspace(wid))
+    store.ensure()
+    return store.commit(label)
+
+def diff_snapshots(wid: str, a: int, b: int | None = None, patch: bool = False) -> Dict[str, Any]:
+    """Raises KeyError for an unknown snapshot id."""
+    store = snapshots.store(ensure_workspace(wid))
+    store.ensure()
+    return store.diff(a, b, patch)
+
+def restore_snapshot(wid: str, snap_id: int) -> Dict[str, Any]:
+    """Raises KeyError for an unknown snapshot id."""
+    import workspace_lifecycle
+    with workspace_lifecycle.in_use(wid) as base:
+        store = snapshots.store(base)
+        store.ensure()
+        return store.restore(snap_id)
 
 def ensure_workspace(wid: str) -> Path:
+    # Imported lazily: the lifecycle module builds on this one
+    import workspace_lifecycle
     p = WORKSPACES / wid
-    if not p.exists(): raise FileNotFoundError("workspace not found")
+    if not p.exists() and not workspace_lifecycle.rehydrate(wid):
+        raise FileNotFoundError("workspace not found")
+    workspace_lifecycle.touch(wid)
     return p
+
+def disk_usage(wid: str) -> dict[str, Any]:
+    """Report how much of a workspace is shared with other workspaces."""
+    base = ensure_workspace(wid)
+    report = {"files": 0, "shared_files": 0, "apparent_bytes": 0,
+              "shared_bytes": 0, "unique_bytes": 0}
+    seen: set[int] = set()
+    for root, _, files in os.walk(base):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            report["files"] += 1
+            report["apparent_bytes"] += st.st_size
+            if st.st_ino in seen:
+                continue
+            seen.add(st.st_ino)
+            if st.st_nlink > 1:
+                report["shared_files"] += 1
+                report["shared_bytes"] += st.st_size
+            else:
+                report["unique_bytes"] += st.st_size
+    return report
+
+# -------------------------------------------------------------------------
+# Async API
+# -------------------------------------------------------------------------
+# Everything above blocks: tree walks, copies, fsync, `flutter create`.
+# The `a*` variants run it on a dedicated pool of WORKSPACE_IO_THREADS
+# threads, so a burst of file requests queues here rather than stalling the
+# event loop (and every SSE stream on it) or crowding out the default
+# executor that builds and the LLM cache use.
+WORKSPACE_IO_THREADS = int(os.getenv("WORKSPACE_IO_THREADS", "16"))
+
+_io_pool = ThreadPoolExecutor(max_workers=max(1, WORKSPACE_IO_THREADS), thread_name_prefix="ws-io")
+_io_lock = threading.Lock()
+_io_stats = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+
+def _io_call(ctx: contextvars.Context, fn, args, kwargs):
+    with _io_lock:
+        _io_stats["queued"] -= 1
+        _io_stats["running"] += 1
+    try:
+        return ctx.run(fn, *args, **kwargs)
+    except BaseException:
+        with _io_lock:
+            _io_stats["failed"] += 1
+        raise
+    finally:
+        with _io_lock:
+            _io_stats["running"] -= 1
+            _io_stats["completed"] += 1
+
+async def run_io(fn, *args, **kwargs):
+    """Run blocking workspace I/O on the workspace pool and await the result."""
+    with _io_lock:
+        _io_stats["queued"] += 1
+    try:
+        future = _io_pool.submit(_io_call, contextvars.copy_context(), fn, args, kwargs)
+    except BaseException:
+        with _io_lock:
+            _io_stats["queued"] -= 1
+        raise
+    future.add_done_callback(_io_cancelled)
+    return await asyncio.wrap_future(future)
+
+def _io_cancelled(future) -> None:
+    # Cancelled while still queued (the awaiting request went away): _io_call never ran
+    if future.cancelled():
+        with _io_lock:
+            _io_stats["queued"] -= 1
+
+def io_stats() -> dict[str, int]:
+    with _io_lock:
+        return {"threads": _io_pool._max_workers, **_io_stats}
+
+def _async(fn):
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        return await run_io(fn, *args, **kwargs)
+    wrapper.__name__ = wrapper.__qualname__ = f"a{fn.__name__}"
+    return wrapper
+
+anew_workspace = _async(new_workspace)
+aensure_workspace = _async(ensure_workspace)
+alist_tree = _async(list_tree)
+alist_dir = _async(list_dir)
+atree_changes = _async(tree_changes)
+aread_file = _async(read_file)
+aread_files = _async(read_files)
+awrite_files = _async(write_files)
+awrite_file = _async(write_file)
+adisk_usage = _async(disk_usage)
+alist_snapshots = _async(list_snapshots)
+atake_snapshot = _async(take_snapshot)
+adiff_snapshots = _async(diff_snapshots)
+arestore_snapshot = _async(restore_snapshot)
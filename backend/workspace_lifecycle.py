@@ -0,0 +1,429 @@
+"""
+Workspace lifecycle: idle eviction, archiving and rehydration.
+--------------------------------------------------------------
+Every `ensure_workspace` (file reads/writes, builds, preview hits) marks
+the workspace as accessed. A background sweep then, per workspace:
+
+- after LIFECYCLE_EVICT_AFTER idle seconds drops what can be rebuilt:
+  `.dart_tool`, an isolated `.pub-cache` and `build/` (preview returns 404
+  until the next build)
+- after LIFECYCLE_ARCHIVE_AFTER packs the rest (sources, snapshots) into
+  ARCHIVE_DIR/<wid>.tar.gz and removes the directory. Files that are
+  hardlinks into a base layer are stored as references, not content.
+
+The next `ensure_workspace` on an archived workspace rehydrates it:
+relink the layer files, unpack the archive, rename into place.
+
+Quotas (bytes not shared with the base layer; 0 = unlimited):
+- LIFECYCLE_WORKSPACE_QUOTA  writes that would exceed it raise
+                             `QuotaExceeded`; the sweep evicts caches
+                             of workspaces over it
+- LIFECYCLE_GLOBAL_QUOTA     the sweep evicts, then archives, least
+                             recently used workspaces until under it
+
+Workspaces used within LIFECYCLE_MIN_IDLE seconds are never swept.
+Writes and builds hold the workspace through `in_use()` (a shared lock
+across processes), and `archive()` refuses with `WorkspaceBusy` while
+one does, or while a build or job is running on it. Access times are
+kept as marker files under ACCESS_DIR so every process sees them; a
+marker is refreshed at most every LIFECYCLE_TOUCH_INTERVAL seconds.
+"""
+from __future__ import annotations
+import json, os, re, shutil, sys, tarfile, threading, time, uuid
+from collections import deque
+from contextlib import contextmanager
+from pathlib import Path
+
+import pub_cache
+import tree_index
+import workspace as ws
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX dev boxes: in-process locking only
+    fcntl = None
+
+LIFECYCLE_ENABLED = os.getenv("LIFECYCLE", "true").lower() == "true"
+LIFECYCLE_INTERVAL = float(os.getenv("LIFECYCLE_INTERVAL", "300"))
+LIFECYCLE_EVICT_AFTER = float(os.getenv("LIFECYCLE_EVICT_AFTER", str(6 * 3600)))
+LIFECYCLE_ARCHIVE_AFTER = float(os.getenv("LIFECYCLE_ARCHIVE_AFTER", str(7 * 24 * 3600)))
+LIFECYCLE_MIN_IDLE = float(os.getenv("LIFECYCLE_MIN_IDLE", "600"))
+LIFECYCLE_TOUCH_INTERVAL = float(os.getenv("LIFECYCLE_TOUCH_INTERVAL", "60"))
+LIFECYCLE_WORKSPACE_QUOTA = int(os.getenv("LIFECYCLE_WORKSPACE_QUOTA", "0"))
+LIFECYCLE_GLOBAL_QUOTA = int(os.getenv("LIFECYCLE_GLOBAL_QUOTA", "0"))
+
+ARCHIVE_DIR = ws.ROOT / ".archives"
+ACCESS_DIR = ws.ROOT / ".access"
+EVICTABLE = (".dart_tool", ".pub-cache", "build")
+WID = re.compile(r"^[A-Za-z0-9_-]+$")
+_USAGE_TTL = 30.0
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class WorkspaceBusy(Exception):
+    pass
+
+
+_stats_lock = threading.Lock()
+_stats = {"evictions": 0, "archives": 0, "rehydrations": 0, "quota_rejections": 0,
+          "reclaimed_evict_bytes": 0, "reclaimed_archive_bytes": 0, "sweeps": 0}
+_rehydrate_ms: deque[float] = deque(maxlen=1000)
+_touched: dict[str, float] = {}
+_usage: dict[str, tuple[float, int]] = {}  # wid → (measured at, unique bytes)
+
+
+def _bump(key: str, by: float = 1) -> None:
+    with _stats_lock:
+        _stats[key] += by
+
+
+@contextmanager
+def _locked(wid: str, shared: bool = False, wait: bool = True):
+    """Per-workspace lock across processes: exclusive for archive and
+    rehydrate, shared for writes and builds. Without `wait`, raises
+    WorkspaceBusy instead of blocking."""
+    (ARCHIVE_DIR / ".locks").mkdir(parents=True, exist_ok=True)
+    with open(ARCHIVE_DIR / ".locks" / f"{wid}.lock", "a+") as fh:
+        if fcntl:
+            try:
+                fcntl.flock(fh.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+                            | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                raise WorkspaceBusy("workspace is in use") from None
+        yield
+
+
+@contextmanager
+def in_use(wid: str):
+    """Hold `wid` for a write or build; yields its directory.
+
+    Archiving waits for (or, from `archive()`, refuses) every holder.
+    """
+    while True:
+        base = ws.ensure_workspace(wid)  # outside the lock: rehydrating takes it exclusively
+        with _locked(wid, shared=True):
+            if base.is_dir():
+                yield base
+                return
+        # archived between the check and the lock; bring it back and retry
+
+
+def unique_bytes(path: Path) -> int:
+    """Bytes under `path` that deleting it would free (hardlinked files don't count)."""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.lstat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            if st.st_nlink == 1:
+                total += st.st_size
+    return total
+
+
+# -------------------------------------------------------------------------
+# Access tracking
+# -------------------------------------------------------------------------
+def touch(wid: str) -> None:
+    now = time.time()
+    if now - _touched.get(wid, 0.0) < LIFECYCLE_TOUCH_INTERVAL:
+        return
+    _touched[wid] = now
+    marker = ACCESS_DIR / wid
+    try:
+        os.utime(marker, (now, now))
+    except FileNotFoundError:
+        ACCESS_DIR.mkdir(parents=True, exist_ok=True)
+        marker.touch()
+
+
+def last_access(wid: str) -> float:
+    try:
+        marked = (ACCESS_DIR / wid).stat().st_mtime
+    except FileNotFoundError:
+        try:
+            marked = (ws.WORKSPACES / wid).stat().st_mtime
+        except FileNotFoundError:
+            marked = 0.0
+    return max(marked, _touched.get(wid, 0.0))
+
+
+def _working(wid: str) -> bool:
+    """A build or generation is running on `wid`, here or in a job worker."""
+    from build_scheduler import scheduler as build_scheduler
+    from job_store import JOB_DB, get_store
+    if any(not j.done for j in build_scheduler.jobs_for(wid)):
+        return True
+    generation_jobs = sys.modules.get("generation_jobs")  # not loaded: no in-process jobs
+    if generation_jobs and any(j.wid == wid and not j.done for j in generation_jobs.jobs.jobs()):
+        return True
+    if JOB_DB.exists():
+        job = get_store().active_for(wid)
+        return job is not None and job["state"] == "running"
+    return False
+
+
+def _busy(wid: str) -> bool:
+    return time.time() - last_access(wid) < LIFECYCLE_MIN_IDLE or _working(wid)
+
+
+# -------------------------------------------------------------------------
+# Quotas
+# -------------------------------------------------------------------------
+def usage(wid: str, fresh: bool = False) -> int:
+    cached = _usage.get(wid)
+    if cached and not fresh and time.time() - cached[0] < _USAGE_TTL:
+        return cached[1]
+    n = unique_bytes(ws.WORKSPACES / wid)
+    _usage[wid] = (time.time(), n)
+    return n
+
+
+def check_quota(wid: str, incoming: int) -> None:
+    """Raise QuotaExceeded if writing `incoming` more bytes would pass the workspace quota."""
+    if not LIFECYCLE_WORKSPACE_QUOTA:
+        return
+    used = usage(wid)
+    if used + incoming > LIFECYCLE_WORKSPACE_QUOTA:
+        used = usage(wid, fresh=True)
+        if used + incoming > LIFECYCLE_WORKSPACE_QUOTA:
+            _bump("quota_rejections")
+            raise QuotaExceeded(f"workspace quota exceeded ({used + incoming} > {LIFECYCLE_WORKSPACE_QUOTA} bytes)")
+    _usage[wid] = (_usage[wid][0], used + incoming)
+
+
+# -------------------------------------------------------------------------
+# Eviction and archiving
+# -------------------------------------------------------------------------
+def evict(wid: str) -> int:
+    """Drop rebuildable caches and build output; returns bytes reclaimed."""
+    base = ws.WORKSPACES / wid
+    freed = 0
+    for name in EVICTABLE:
+        path = base / name
+        if name == ".pub-cache" and pub_cache.get_mode(base) != "isolated":
+            continue
+        if path.is_dir():
+            freed += unique_bytes(path)
+            shutil.rmtree(path, ignore_errors=True)
+    if freed:
+        _bump("evictions")
+        _bump("reclaimed_evict_bytes", freed)
+        _usage.pop(wid, None)
+    return freed
+
+
+def _evict_unused(wid: str) -> int:
+    """`evict`, unless the workspace is being written or built."""
+    with _locked(wid, wait=False):
+        if _working(wid):
+            raise WorkspaceBusy("workspace has a build or generation running")
+        return evict(wid)
+
+
+def _layer_inodes() -> dict[tuple[int, int], tuple[str, str]]:
+    inodes = {}
+    if not ws.LAYERS.is_dir():
+        return inodes
+    for layer in ws.LAYERS.iterdir():
+        if layer.name.startswith("."):
+            continue
+        for root, _, files in os.walk(layer):
+            for name in files:
+                st = os.lstat(os.path.join(root, name))
+                rel = os.path.relpath(os.path.join(root, name), layer).replace(os.sep, "/")
+                inodes[(st.st_dev, st.st_ino)] = (layer.name, rel)
+    return inodes
+
+
+def archive(wid: str) -> int:
+    """Evict, then pack the workspace into one archive; returns bytes reclaimed.
+
+    Raises WorkspaceBusy while the workspace is being written or built.
+    """
+    if not WID.match(wid):
+        raise ValueError("invalid workspace id")
+    with _locked(wid, wait=False):
+        base = ws.WORKSPACES / wid
+        if not base.is_dir():
+            raise FileNotFoundError("workspace not found")
+        if _working(wid):
+            raise WorkspaceBusy("workspace has a build or generation running")
+        freed = evict(wid)
+        before = unique_bytes(base)
+        layers = _layer_inodes()
+        links: dict[str, list[str]] = {}
+        tmp = ARCHIVE_DIR / f".{wid}.{uuid.uuid4().hex[:8]}.tmp"
+        with tarfile.open(tmp, "w:gz", compresslevel=6) as tar:
+            for root, dirs, files in os.walk(base):
+                dirs.sort()
+                for name in sorted(files) + dirs:
+                    path = Path(root) / name
+                    rel = path.relative_to(base).as_posix()
+                    st = os.lstat(path)
+                    ref = layers.get((st.st_dev, st.st_ino)) if name in files else None
+                    if ref:
+                        links[rel] = list(ref)
+                    else:
+                        tar.add(path, rel, recursive=False)
+        meta = {"wid": wid, "archived": time.time(), "links": links, "bytes": before,
+                "archive_bytes": tmp.stat().st_size}
+        (ARCHIVE_DIR / f"{wid}.json").write_text(json.dumps(meta))
+        os.replace(tmp, ARCHIVE_DIR / f"{wid}.tar.gz")
+        shutil.rmtree(base)
+        tree_index.forget(wid)
+        _usage.pop(wid, None)
+    _bump("archives")
+    _bump("reclaimed_archive_bytes", before - meta["archive_bytes"])
+    return freed + before - meta["archive_bytes"]
+
+
+def is_archived(wid: str) -> bool:
+    return bool(WID.match(wid)) and (ARCHIVE_DIR / f"{wid}.tar.gz").exists()
+
+
+def rehydrate(wid: str) -> bool:
+    """Restore an archived workspace; False if there is no archive for `wid`."""
+    if not is_archived(wid):
+        return False
+    started = time.perf_counter()
+    with _locked(wid):
+        base = ws.WORKSPACES / wid
+        if base.exists():
+            return True  # another caller got here first
+        tar_path, meta_path = ARCHIVE_DIR / f"{wid}.tar.gz", ARCHIVE_DIR / f"{wid}.json"
+        if not tar_path.exists():
+            return False
+        meta = json.loads(meta_path.read_text())
+        staging = ws.WORKSPACES / f".rehydrate-{wid}-{uuid.uuid4().hex[:8]}"
+        try:
+            staging.mkdir()
+            for rel, (layer, layer_rel) in meta["links"].items():
+                src, dst = ws.LAYERS / layer / layer_rel, staging / rel
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(src, dst)
+                except OSError:
+                    shutil.copy2(src, dst)  # layer on another device
+            with tarfile.open(tar_path, "r:gz") as tar:
+                tar.extractall(staging, **({"filter": "data"} if hasattr(tarfile, "data_filter") else {}))
+            os.rename(staging, base)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        tar_path.unlink()
+        meta_path.unlink()
+    _touched.pop(wid, None)
+    touch(wid)
+    _bump("rehydrations")
+    _rehydrate_ms.append((time.perf_counter() - started) * 1000)
+    return True
+
+
+# -------------------------------------------------------------------------
+# Sweeping
+# -------------------------------------------------------------------------
+def _live() -> list[str]:
+    try:
+        return [p.name for p in ws.WORKSPACES.iterdir() if p.is_dir() and not p.name.startswith(".")]
+    except FileNotFoundError:
+        return []
+
+
+def sweep(now: float | None = None) -> dict:
+    """One pass of idle eviction, archiving and quota enforcement."""
+    now = now or time.time()
+    report = {"evicted": [], "archived": [], "reclaimed_bytes": 0, "errors": []}
+
+    def run(fn, wid: str, key: str) -> None:
+        try:
+            freed = fn(wid)
+        except WorkspaceBusy:
+            return  # picked up again on a later sweep
+        except Exception as e:
+            report["errors"].append({"workspace": wid, "error": str(e)})
+            return
+        if freed:
+            report[key].append(wid)
+            report["reclaimed_bytes"] += freed
+
+    by_age = sorted(_live(), key=last_access)
+    for wid in by_age:
+        idle = now - last_access(wid)
+        if _busy(wid):
+            continue
+        if idle >= LIFECYCLE_ARCHIVE_AFTER:
+            run(archive, wid, "archived")
+        elif idle >= LIFECYCLE_EVICT_AFTER or (LIFECYCLE_WORKSPACE_QUOTA and usage(wid) > LIFECYCLE_WORKSPACE_QUOTA):
+            run(_evict_unused, wid, "evicted")
+
+    if LIFECYCLE_GLOBAL_QUOTA:
+        remaining = [w for w in _live() if not _busy(w)]
+        total = sum(usage(w, fresh=True) for w in _live())
+        # Cheapest first: caches of the least recently used, then whole workspaces
+        for step, key in ((_evict_unused, "evicted"), (archive, "archived")):
+            for wid in sorted(remaining, key=last_access):
+                if total <= LIFECYCLE_GLOBAL_QUOTA:
+                    break
+                before = report["reclaimed_bytes"]
+                run(step, wid, key)
+                total -= report["reclaimed_bytes"] - before
+        report["total_bytes"] = total
+
+    _bump("sweeps")
+    return report
+
+
+def stats() -> dict:
+    lat = sorted(_rehydrate_ms)
+
+    def pct(p: float) -> float | None:
+        return round(lat[min(len(lat) - 1, int(p * len(lat)))], 2) if lat else None
+
+    archives = list(ARCHIVE_DIR.glob("*.tar.gz")) if ARCHIVE_DIR.is_dir() else []
+    with _stats_lock:
+        s = dict(_stats)
+    s.update(
+        live=len(_live()), archived=len(archives),
+        archive_bytes=sum(p.stat().st_size for p in archives),
+        reclaimed_bytes=s["reclaimed_evict_bytes"] + s["reclaimed_archive_bytes"],
+        rehydrate_ms_p50=pct(0.50), rehydrate_ms_p99=pct(0.99),
+        evict_after_s=LIFECYCLE_EVICT_AFTER, archive_after_s=LIFECYCLE_ARCHIVE_AFTER,
+        workspace_quota=LIFECYCLE_WORKSPACE_QUOTA, global_quota=LIFECYCLE_GLOBAL_QUOTA,
+    )
+    return s
+
+
+class Sweeper:
+    def __init__(self, interval: float = LIFECYCLE_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.last_report: dict | None = None
+
+    def start(self) -> None:
+        if self._thread or not LIFECYCLE_ENABLED:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="ws-lifecycle", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_report = sweep()
+            except Exception as e:
+                print(f"⚠️ Workspace sweep failed: {e}")
+
+
+sweeper = Sweeper()
@@ -0,0 +1,154 @@
+"""
+Pre-warmed workspace pool.
+--------------------------
+Background threads keep `POOL_DIR` filled with ready-made workspaces
+(template copied, web scaffolding generated, optionally `pub get` done).
+`claim()` hands one out with a single `os.rename`, which is atomic on the
+same filesystem, so concurrent claimers (threads or processes) never get
+the same workspace. A miss falls back to building one inline.
+"""
+from __future__ import annotations
+import os, shutil, threading, time, uuid
+from collections import deque
+from pathlib import Path
+import workspace as ws
+
+POOL_DIR = ws.ROOT / ".workspace-pool"
+POOL_SIZE = int(os.getenv("WORKSPACE_POOL_SIZE", "4"))
+POOL_CONCURRENCY = int(os.getenv("WORKSPACE_POOL_CONCURRENCY", "2"))
+# package_config.json records absolute paths into PUB_CACHE, so pool entries
+# resolve against the shared cache: a cache inside the staging dir would be
+# left behind by the claim rename.
+POOL_PUB_GET = os.getenv("WORKSPACE_POOL_PUB_GET", "false").lower() == "true"
+
+_STAGING_PREFIX = ".tmp-"
+
+
+class WorkspacePool:
+    def __init__(self, size: int = POOL_SIZE, concurrency: int = POOL_CONCURRENCY,
+                 pub_get: bool = POOL_PUB_GET, pool_dir: Path | None = None):
+        self.size = max(0, size)
+        self.concurrency = max(1, concurrency)
+        self.pub_get = pub_get
+        self.pool_dir = pool_dir or POOL_DIR  # read now, so a reassigned POOL_DIR is honoured
+        self.pool_dir.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._filling = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refill_errors = 0
+        self._claim_ms: deque[float] = deque(maxlen=1000)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._threads or self.size == 0:
+            return
+        # Half-built entries from a previous run are never claimable
+        for entry in self.pool_dir.glob(f"{_STAGING_PREFIX}*"):
+            shutil.rmtree(entry, ignore_errors=True)
+        self._stop.clear()
+        for i in range(self.concurrency):
+            t = threading.Thread(target=self._fill_loop, name=f"ws-pool-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        for t in self._threads:
+            t.join(timeout=1)
+        self._threads.clear()
+
+    # ------------------------------------------------------------------
+    # Filling
+    # ------------------------------------------------------------------
+    def _ready(self) -> list[Path]:
+        try:
+            return [p for p in self.pool_dir.iterdir() if not p.name.startswith(".")]
+        except FileNotFoundError:
+            return []
+
+    def _fill_loop(self) -> None:
+        backoff = 1.0
+        while not self._stop.is_set():
+            with self._lock:
+                missing = self.size - len(self._ready()) - self._filling
+                if missing > 0:
+                    self._filling += 1
+            if missing <= 0:
+                self._wakeup.wait(timeout=5)
+                self._wakeup.clear()
+                continue
+
+            staging = self.pool_dir / f"{_STAGING_PREFIX}{uuid.uuid4().hex}"
+            try:
+                ws.prepare_workspace(staging, pub_get=self.pub_get)
+                os.rename(staging, self.pool_dir / uuid.uuid4().hex)
+                self.refills += 1
+                backoff = 1.0
+            except Exception as e:
+                self.refill_errors += 1
+                print(f"⚠️ Workspace pool refill failed: {e}")
+                shutil.rmtree(staging, ignore_errors=True)
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 60.0)
+            finally:
+                with self._lock:
+                    self._filling -= 1
+
+    # ------------------------------------------------------------------
+    # Claiming
+    # ------------------------------------------------------------------
+    def claim(self) -> dict[str, str]:
+        started = time.perf_counter()
+        try:
+            for entry in self._ready():
+                wid = uuid.uuid4().hex[:8]
+                wdir = ws.WORKSPACES / wid
+                try:
+                    os.rename(entry, wdir)
+                except FileNotFoundError:
+                    continue  # another claimer won the race for this entry
+                with self._lock:
+                    self.hits += 1
+                return {"id": wid, "path": str(wdir)}
+
+            with self._lock:
+                self.misses += 1
+            return ws.new_workspace()
+        finally:
+            self._wakeup.set()
+            self._claim_ms.append((time.perf_counter() - started) * 1000)
+
+    def stats(self) -> dict:
+        claims = self.hits + self.misses
+        lat = sorted(self._claim_ms)
+
+        def pct(p: float) -> float | None:
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 2) if lat else None
+
+        return {
+            "target_size": self.size,
+            "ready": len(self._ready()),
+            "filling": self._filling,
+            "concurrency": self.concurrency,
+            "pub_get": self.pub_get,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / claims, 4) if claims else None,
+            "refills": self.refills,
+            "refill_errors": self.refill_errors,
+            "claim_ms_p50": pct(0.50),
+            "claim_ms_p99": pct(0.99),
+        }
+
+
+pool = WorkspacePool()